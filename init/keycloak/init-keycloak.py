@@ -11,15 +11,32 @@ This script configures Keycloak with:
 
 import requests
 import json
-import time
+import os
 import sys
-from typing import Dict, Optional
+from typing import Dict, List, Optional
+
+# Shared modules live in /app/lib in the container and in lib/ at the repo root
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _lib_dir in (os.path.join(_HERE, "lib"), os.path.join(_HERE, "..", "..", "lib")):
+    if os.path.isdir(_lib_dir):
+        sys.path.insert(0, _lib_dir)
+        break
+
+from http_client import create_client, print_http_stats
+from init_dag import Task, print_timeline, run_dag
+from keycloak_admin import KeycloakAdmin, RealmIndex
+from realm_reconciler import RealmReconciler
+from readiness import keycloak_probes, print_readiness, wait_until_ready
+from tracing import init as init_tracing
 
 KEYCLOAK_URL = "http://keycloak:8080"
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "admin"
 REALM_CONFIG_FILE = "/app/realm-config.json"
 
+# Above this many users the summary lists only the first few
+SUMMARY_USER_LIMIT = 50
+
 
 class KeycloakConfigurator:
     """Handles Keycloak configuration"""
@@ -29,30 +46,21 @@ class KeycloakConfigurator:
         self.admin_user = admin_user
         self.admin_pass = admin_pass
         self.access_token: Optional[str] = None
-        self.session = requests.Session()
-
-    def wait_for_keycloak(self, max_attempts: int = 30) -> bool:
-        """Wait for Keycloak to be ready"""
+        self.session = create_client()
+        self.readiness: Optional[Dict] = None
+        self.realm_config: Optional[Dict] = None
+        self.admin = KeycloakAdmin(base_url, self.session)
+        self.indexes: Dict[str, RealmIndex] = {}
+
+    def wait_for_keycloak(self, deadline: float = 180.0) -> bool:
+        """Wait for Keycloak's OIDC endpoints to be ready"""
         print("Waiting for Keycloak to be ready...")
 
-        for attempt in range(max_attempts):
-            try:
-                # Try to access the root endpoint (returns HTML)
-                response = self.session.get(
-                    f"{self.base_url}/",
-                    timeout=5
-                )
-                if response.status_code == 200:
-                    print(f"✓ Keycloak is ready!")
-                    return True
-            except requests.exceptions.RequestException:
-                pass
-
-            print(f"  Attempt {attempt + 1}/{max_attempts}... waiting")
-            time.sleep(5)
-
-        print("✗ Timeout waiting for Keycloak")
-        return False
+        report = wait_until_ready("Keycloak", keycloak_probes(self.base_url),
+                                  deadline=deadline)
+        print_readiness(report)
+        self.readiness = report
+        return report['ready']
 
     def get_admin_token(self) -> bool:
         """Get admin access token"""
@@ -99,12 +107,11 @@ class KeycloakConfigurator:
             return False
 
     def create_realm(self, realm_config: Dict) -> bool:
-        """Create realm with configuration"""
+        """Create realm with configuration, or reconcile it if it exists"""
         realm_name = realm_config["realm"]
 
         if self.realm_exists(realm_name):
-            print(f"ℹ Realm '{realm_name}' already exists, skipping creation")
-            return True
+            return self.reconcile_realm(realm_config)
 
         print(f"\nCreating realm: {realm_name}")
 
@@ -127,6 +134,28 @@ class KeycloakConfigurator:
             print(f"✗ Error creating realm: {e}")
             return False
 
+    def reconcile_realm(self, realm_config: Dict) -> bool:
+        """Apply only what changed in realm-config.json to an existing realm"""
+        realm_name = realm_config["realm"]
+        print(f"\nReconciling realm: {realm_name}")
+
+        try:
+            result = RealmReconciler(self.admin, realm_config).reconcile()
+        except requests.exceptions.RequestException as e:
+            print(f"✗ Error reconciling realm: {e}")
+            if e.response is not None:
+                print(f"  Response: {e.response.text}")
+            return False
+
+        if not result["changes"]:
+            print(f"✓ Realm '{realm_name}' is up to date")
+            return True
+        for change in result["changes"]:
+            print(f"  • {change}")
+        print(f"✓ Realm '{realm_name}' reconciled ({result['added']} added, "
+              f"{result['overwritten']} overwritten, {result['updated']} updated)")
+        return True
+
     def get_realm_info(self, realm_name: str):
         """Get realm information"""
         try:
@@ -140,52 +169,31 @@ class KeycloakConfigurator:
         except:
             return None
 
+    def index(self, realm_name: str) -> RealmIndex:
+        """Cached index of a realm's clients and users"""
+        if realm_name not in self.indexes:
+            self.indexes[realm_name] = RealmIndex(self.admin, realm_name)
+        return self.indexes[realm_name]
+
     def list_users(self, realm_name: str):
-        """List users in realm"""
+        """List all users in realm"""
         try:
-            response = self.session.get(
-                f"{self.base_url}/admin/realms/{realm_name}/users",
-                timeout=10
-            )
-            if response.status_code == 200:
-                return response.json()
-            return []
-        except:
+            return self.index(realm_name).users()
+        except requests.exceptions.RequestException:
             return []
 
     def list_clients(self, realm_name: str):
-        """List clients in realm"""
+        """List all clients in realm"""
         try:
-            response = self.session.get(
-                f"{self.base_url}/admin/realms/{realm_name}/clients",
-                timeout=10
-            )
-            if response.status_code == 200:
-                return response.json()
-            return []
-        except:
+            return self.index(realm_name).clients()
+        except requests.exceptions.RequestException:
             return []
 
     def get_client_secret(self, realm_name: str, client_id: str) -> Optional[str]:
         """Get client secret"""
         try:
-            # Get client UUID
-            clients = self.list_clients(realm_name)
-            client = next((c for c in clients if c["clientId"] == client_id), None)
-
-            if not client:
-                return None
-
-            # Get client secret
-            response = self.session.get(
-                f"{self.base_url}/admin/realms/{realm_name}/clients/{client['id']}/client-secret",
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                return response.json().get("value")
-            return None
-        except:
+            return self.index(realm_name).client_secret(client_id)
+        except requests.exceptions.RequestException:
             return None
 
     def print_summary(self, realm_name: str):
@@ -200,10 +208,12 @@ class KeycloakConfigurator:
             print(f"Display Name: {realm_info.get('displayName', 'N/A')}")
             print(f"Enabled: {realm_info.get('enabled', False)}")
 
-        print("\nUsers:")
         users = self.list_users(realm_name)
-        for user in users:
+        print(f"\nUsers ({len(users)}):")
+        for user in users[:SUMMARY_USER_LIMIT]:
             print(f"  • {user.get('username')} ({user.get('email')})")
+        if len(users) > SUMMARY_USER_LIMIT:
+            print(f"  ... and {len(users) - SUMMARY_USER_LIMIT} more")
 
         print("\nClients:")
         clients = self.list_clients(realm_name)
@@ -239,6 +249,44 @@ class KeycloakConfigurator:
         print("="*70)
         print()
 
+    def load_realm_config(self) -> Dict:
+        """Load the realm configuration file"""
+        print(f"\nLoading realm configuration from {REALM_CONFIG_FILE}...")
+        with open(REALM_CONFIG_FILE, 'r') as f:
+            self.realm_config = json.load(f)
+        print(f"✓ Configuration loaded")
+        return self.realm_config
+
+    def apply_realm(self) -> bool:
+        """Create the realm from the loaded configuration"""
+        self.indexes.pop(self.realm_config["realm"], None)
+        if not self.create_realm(self.realm_config):
+            print("\n⚠ Warning: Could not create realm")
+            return False
+        return True
+
+    def tasks(self, prefix: str = "keycloak") -> List[Task]:
+        """Initialization steps as a dependency graph"""
+        return [
+            Task(f"{prefix}.ready", self.wait_for_keycloak),
+            Task(f"{prefix}.auth", self.get_admin_token, [f"{prefix}.ready"]),
+            Task(f"{prefix}.config", self.load_realm_config),
+            Task(f"{prefix}.realm", self.apply_realm, [f"{prefix}.auth", f"{prefix}.config"])
+        ]
+
+    def check_results(self, results: Dict[str, Dict], prefix: str = "keycloak") -> bool:
+        """Report fatal step failures; returns False if initialization failed"""
+        fatal = {
+            f"{prefix}.ready": "Keycloak not ready",
+            f"{prefix}.auth": "Could not authenticate",
+            f"{prefix}.config": "Could not load realm configuration"
+        }
+        for name, reason in fatal.items():
+            if results[name]['status'] != 'ok':
+                print(f"\n✗ Initialization failed: {reason}")
+                return False
+        return True
+
     def run(self):
         """Main initialization routine"""
         print("="*70)
@@ -246,34 +294,17 @@ class KeycloakConfigurator:
         print("="*70)
         print()
 
-        # Step 1: Wait for Keycloak
-        if not self.wait_for_keycloak():
-            print("\n✗ Initialization failed: Keycloak not ready")
-            sys.exit(1)
-
-        time.sleep(5)
-
-        # Step 2: Authenticate
-        if not self.get_admin_token():
-            print("\n✗ Initialization failed: Could not authenticate")
-            sys.exit(1)
+        tasks = self.tasks()
+        results = run_dag(tasks)
 
-        # Step 3: Load realm configuration
-        print(f"\nLoading realm configuration from {REALM_CONFIG_FILE}...")
-        try:
-            with open(REALM_CONFIG_FILE, 'r') as f:
-                realm_config = json.load(f)
-            print(f"✓ Configuration loaded")
-        except Exception as e:
-            print(f"✗ Failed to load configuration: {e}")
+        if not self.check_results(results):
+            print_timeline(tasks, results)
+            print_http_stats()
             sys.exit(1)
 
-        # Step 4: Create realm
-        if not self.create_realm(realm_config):
-            print("\n⚠ Warning: Could not create realm")
-
-        # Step 5: Print summary
-        self.print_summary(realm_config["realm"])
+        self.print_summary(self.realm_config["realm"])
+        print_timeline(tasks, results)
+        print_http_stats()
 
         print("="*70)
         print("Initialization Complete!")
@@ -283,6 +314,7 @@ class KeycloakConfigurator:
 
 def main():
     """Main entry point"""
+    init_tracing("init-keycloak")
     try:
         configurator = KeycloakConfigurator(
             KEYCLOAK_URL,
@@ -15,10 +15,29 @@ import json
 import time
 import sys
 import os
-from typing import Dict, List, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+# Shared modules live in /app/lib in the container and in lib/ at the repo root
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _lib_dir in (os.path.join(_HERE, "lib"), os.path.join(_HERE, "..", "..", "lib")):
+    if os.path.isdir(_lib_dir):
+        sys.path.insert(0, _lib_dir)
+        break
+
+from http_client import create_client, print_http_stats
+from init_dag import Task, print_timeline, run_dag
+from model_discovery import discover, print_report
+from openwebui_provisioning import build_plan, execute, print_result
+from provisioning_compiler import compile_file
+from readiness import openwebui_probes, print_readiness, wait_until_ready
+from rate_limiter import AdaptiveRateLimiter, is_throttle_status, retry_after_seconds
+from tracing import in_current_context, init as init_tracing
+from user_import import ImportJournal, ImportStats, iter_users
+
+OPENWEBUI_CONTAINER = "open-webui"
 
 
 class OpenWebUIInitializer:
@@ -31,53 +50,22 @@ class OpenWebUIInitializer:
         self.base_url = self.config['openwebui_url']
         self.session = self.create_session()
         self.admin_token: Optional[str] = None
+        self.readiness: Optional[Dict] = None
+        self.connections: Optional[List[Dict]] = None
 
     def create_session(self) -> requests.Session:
-        """Create a session with retry logic"""
-        session = requests.Session()
-        retry = Retry(
-            total=5,
-            backoff_factor=1,
-            status_forcelist=[502, 503, 504]
-        )
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-        return session
+        """Create a pooled session that retries connect errors, 429 and 5xx"""
+        return create_client()
 
-    def wait_for_openwebui(self, max_attempts: int = 30) -> bool:
-        """Wait for Open WebUI to be ready"""
+    def wait_for_openwebui(self, deadline: float = 150.0) -> bool:
+        """Wait for Open WebUI's API to be ready"""
         print("Waiting for Open WebUI to be ready...")
 
-        for attempt in range(max_attempts):
-            try:
-                response = self.session.get(
-                    f"{self.base_url}/health",
-                    timeout=5
-                )
-                if response.status_code == 200:
-                    print(f"✓ Open WebUI is ready!")
-                    return True
-            except requests.exceptions.RequestException:
-                pass
-
-            # Also try the main page
-            try:
-                response = self.session.get(
-                    self.base_url,
-                    timeout=5
-                )
-                if response.status_code == 200:
-                    print(f"✓ Open WebUI is ready!")
-                    return True
-            except requests.exceptions.RequestException:
-                pass
-
-            print(f"  Attempt {attempt + 1}/{max_attempts}... waiting")
-            time.sleep(5)
-
-        print("✗ Timeout waiting for Open WebUI")
-        return False
+        report = wait_until_ready("Open WebUI", openwebui_probes(self.base_url),
+                                  deadline=deadline)
+        print_readiness(report)
+        self.readiness = report
+        return report['ready']
 
     def check_if_initialized(self) -> bool:
         """Check if Open WebUI has been initialized"""
@@ -161,59 +149,235 @@ class OpenWebUIInitializer:
             print(f"✗ Error signing in: {e}")
             return False
 
-    def create_users(self) -> List[Dict]:
-        """Create all team users"""
+    def load_users(self, on_invalid: Optional[Callable[[str], None]] = None) -> Iterator[Dict]:
+        """Yield the inline users from config.json, then the users file if any"""
+        yield from self.config.get('users', [])
+
+        users_file = self.users_file()
+        if users_file:
+            print(f"Streaming users from {users_file}")
+            yield from iter_users(users_file, on_invalid)
+
+    def users_file(self) -> Optional[str]:
+        """Path of the CSV/NDJSON bulk user file, if configured"""
+        return os.environ.get('OPENWEBUI_USERS_FILE') or self.config.get('users_file')
+
+    def list_existing_emails(self) -> Set[str]:
+        """Fetch every existing user's email: one bulk listing, else the paged one"""
+        listing = self.get_users("/api/v1/users/all")
+        if listing is not None:
+            return {user['email'].lower() for user in listing[0]}
+
+        emails: Set[str] = set()
+        page = 1
+        while True:
+            listing = self.get_users(f"/api/v1/users/?page={page}")
+            if listing is None:
+                if page == 1:
+                    break
+                # Users missed here still come back as "already registered"
+                print(f"⚠ User listing stopped at page {page}; relying on per-user checks for the rest")
+                return emails
+            users, total = listing
+            before = len(emails)
+            emails.update(user['email'].lower() for user in users)
+            # Versions without paging return everything on every page
+            if len(emails) == before or (total is not None and len(emails) >= total):
+                return emails
+            page += 1
+
+        print("⚠ Could not list existing users; relying on per-user checks")
+        return set()
+
+    def get_users(self, path: str) -> Optional[Tuple[List[Dict], Optional[int]]]:
+        """(users with an email, total if reported) of one listing call; None if it failed"""
+        try:
+            response = self.session.get(f"{self.base_url}{path}", timeout=60)
+            if response.status_code != 200:
+                return None
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+        users = data.get('users', []) if isinstance(data, dict) else data
+        if not isinstance(users, list):
+            return None
+        total = data.get('total') if isinstance(data, dict) else None
+        return ([user for user in users if isinstance(user, dict) and isinstance(user.get('email'), str)],
+                total if isinstance(total, int) else None)
+
+    def create_users(self, users: Optional[Iterable[Dict]] = None) -> ImportStats:
+        """Create all team users with bounded concurrency and adaptive pacing"""
         print("\n" + "="*70)
         print("Creating Team Users")
         print("="*70)
 
-        results = []
-
-        for user in self.config['users']:
-            print(f"\nCreating: {user['name']} ({user['email']}) - {user['team'].upper()} Team")
+        settings = self.config.get('user_provisioning', {})
+        concurrency = settings.get('concurrency', 16)
+        limiter = AdaptiveRateLimiter(
+            initial_rate=settings.get('initial_rate', 20),
+            max_rate=settings.get('max_rate', 500)
+        )
 
+        users_file = self.users_file()
+        journal_path = settings.get('journal_path') or (f"{users_file}.journal" if users_file else None)
+        journal = ImportJournal(journal_path) if journal_path else None
+        if journal and journal.done:
+            print(f"Resuming: {len(journal.done)} users already confirmed in {journal_path}")
+
+        existing = self.list_existing_emails() if self.admin_token else set()
+
+        # Dedicated pool sized for the workers; the limiter owns status retries here
+        user_session = create_client(pool_size=concurrency, retry_statuses=(),
+                                     headers=dict(self.session.headers))
+
+        # Per-user lines for small inline lists, progress lines for bulk files
+        verbose = not users_file
+        print_lock = threading.Lock()
+        start = time.perf_counter()
+        stats = ImportStats()
+
+        def provision(user: Dict) -> Dict:
+            result = self.create_user(user_session, limiter, user,
+                                      max_attempts=settings.get('max_attempts', 6))
+            if journal and result['status'] != 'failed':
+                journal.record(user['email'])
+            icon = {'created': '✓', 'exists': 'ℹ', 'failed': '✗'}[result['status']]
+            with print_lock:
+                if verbose or result['status'] == 'failed':
+                    print(f"  {icon} {user['email']} ({user['team']}) - {result['status']} "
+                          f"in {result['latency_ms']:.0f}ms")
+                    if result.get('error'):
+                        print(f"      {result['error']}")
+            return result
+
+        def finished(future, user: Dict):
+            # Fold the outcome into the totals as soon as it lands; nothing per user is kept
             try:
-                # Try signup endpoint first
-                response = self.session.post(
-                    f"{self.base_url}/api/v1/auths/signup",
-                    json={
-                        "email": user['email'],
-                        "password": user['password'],
-                        "name": user['name']
-                    },
-                    timeout=10
-                )
-
-                if response.status_code == 200:
-                    print(f"  ✓ User created successfully")
-                    results.append({**user, 'status': 'created'})
-                elif response.status_code == 400 and 'already' in response.text.lower():
-                    print(f"  ℹ User already exists")
-                    results.append({**user, 'status': 'exists'})
-                else:
-                    print(f"  ⚠ Signup returned {response.status_code}, trying admin API...")
-                    # Try creating via admin API if we have admin token
-                    if self.admin_token:
-                        created = self.create_user_as_admin(user)
-                        results.append({**user, 'status': 'created' if created else 'failed'})
-                    else:
-                        print(f"  ✗ Failed: No admin token available")
-                        results.append({**user, 'status': 'failed'})
-
+                stats.add(future.result())
             except Exception as e:
-                print(f"  ✗ Error: {e}")
-                results.append({**user, 'status': 'failed'})
+                with print_lock:
+                    print(f"  ✗ {user['email']} ({user['team']}) - failed: {e}")
+                stats.add({**user, 'status': 'failed', 'attempts': 0, 'latency_ms': 0.0})
+            finally:
+                in_flight.release()
+
+        def invalid(error: str):
+            # A bad row is counted and skipped; the rest of the file still goes through
+            with print_lock:
+                print(f"  ✗ {error}")
+            stats.reject()
+
+        # Bound the number of queued users so the file is never fully in memory
+        in_flight = threading.BoundedSemaphore(concurrency * 4)
+        submitted = 0
+        skipped = 0
 
-            time.sleep(1)
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for user in (self.load_users(invalid) if users is None else users):
+                    if (journal and user['email'] in journal) or user['email'].lower() in existing:
+                        stats.add({**user, 'status': 'exists', 'attempts': 0, 'latency_ms': 0.0})
+                        skipped += 1
+                        continue
+
+                    in_flight.acquire()
+                    future = pool.submit(in_current_context(provision), user)
+                    future.add_done_callback(lambda done, user=user: finished(done, user))
+                    submitted += 1
+
+                    if not verbose and submitted % 1000 == 0:
+                        with print_lock:
+                            print(f"  … {submitted} users submitted ({limiter.rate:.0f}/s)")
+        finally:
+            # Confirmed users must reach disk even if reading the file fails
+            if journal:
+                journal.close()
+
+        elapsed = time.perf_counter() - start
+        print(f"\nProvisioned {stats.total} users in {elapsed:.2f}s "
+              f"({skipped} skipped without a request, final rate {limiter.rate:.0f}/s, "
+              f"{limiter.throttled} throttled responses)")
+        return stats
+
+    def create_user(self, session: requests.Session, limiter: AdaptiveRateLimiter,
+                    user: Dict, max_attempts: int = 6) -> Dict:
+        """Create one user, backing off on 429/5xx"""
+        start = time.perf_counter()
+        status, error = 'failed', None
+
+        for attempt in range(1, max_attempts + 1):
+            limiter.acquire()
+            try:
+                if self.admin_token:
+                    # Signup is disabled once the admin exists; use the admin API
+                    response = session.post(
+                        f"{self.base_url}/api/v1/auths/add",
+                        json={
+                            "name": user['name'],
+                            "email": user['email'],
+                            "password": user['password'],
+                            "role": user.get('role', 'user')
+                        },
+                        timeout=10
+                    )
+                else:
+                    response = session.post(
+                        f"{self.base_url}/api/v1/auths/signup",
+                        json={
+                            "email": user['email'],
+                            "password": user['password'],
+                            "name": user['name']
+                        },
+                        timeout=10
+                    )
+            except requests.exceptions.ConnectionError as e:
+                limiter.on_throttle()
+                error = str(e)
+                continue
+            except requests.exceptions.RequestException as e:
+                error = str(e)
+                break
 
-        return results
+            if response.status_code == 200:
+                limiter.on_success()
+                status, error = 'created', None
+                break
+            if response.status_code == 400 and 'already' in response.text.lower():
+                limiter.on_success()
+                status, error = 'exists', None
+                break
+            if is_throttle_status(response.status_code):
+                limiter.on_throttle(retry_after_seconds(response.headers.get('Retry-After')))
+                error = f"HTTP {response.status_code} after {attempt} attempts"
+                continue
+
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            break
+
+        return {
+            **user,
+            'status': status,
+            'attempts': attempt,
+            'latency_ms': (time.perf_counter() - start) * 1000,
+            **({'error': error} if error else {})
+        }
+
+    def prepare_connections(self) -> List[Dict]:
+        """Compile connections from agentgateway.yaml and discover extra models"""
+        connections = compile_file(extra_models=self.config.get('extra_models'))
+
+        discovery = self.config.get('model_discovery', {})
+        if discovery.get('enabled'):
+            print("Discovering models through AgentGateway...")
+            connections, reports = discover(
+                connections,
+                timeout=discovery.get('timeout', 5),
+                ttl=discovery.get('ttl', 3600)
+            )
+            print_report(reports)
 
-    def create_user_as_admin(self, user: Dict) -> bool:
-        """Create user using admin privileges"""
-        # This would require admin API endpoints
-        # For now, we'll document that users need to be created through the UI
-        # or by temporarily enabling signup
-        return False
+        self.connections = connections
+        return connections
 
     def configure_models(self) -> bool:
         """Configure AI models in Open WebUI by directly updating the database"""
@@ -222,213 +386,55 @@ class OpenWebUIInitializer:
         print("="*70)
 
         try:
-            import subprocess
-
-            # Python script to update database directly
-            db_script = """
-import sqlite3
-import json
-import time
-
-conn = sqlite3.connect('/app/backend/data/webui.db')
-cursor = conn.cursor()
-
-# Get or create config
-cursor.execute('SELECT id, data FROM config')
-result = cursor.fetchone()
-
-if result:
-    config_id, config_data = result
-    data = json.loads(config_data)
-else:
-    config_id = 1
-    data = {}
-
-# Update config with connection settings
-data['ENABLE_OPENAI_API'] = True
-data['OPENAI_API_BASE_URLS'] = [
-    "http://agentgateway:3000/anthropic/v1",
-    "http://agentgateway:3000/openai/v1",
-    "http://agentgateway:3000/xai/v1",
-    "http://agentgateway:3000/gemini/v1"
-]
-data['OPENAI_API_KEYS'] = [
-    "sk-anthropic",
-    "sk-openai",
-    "sk-xai",
-    "sk-gemini"
-]
-
-# Configure openai section
-if 'openai' not in data:
-    data['openai'] = {}
-
-data['openai']['enable'] = True
-data['openai']['api_base_urls'] = data['OPENAI_API_BASE_URLS']
-data['openai']['api_keys'] = data['OPENAI_API_KEYS']
-
-# CRITICAL: Configure api_configs with model_ids
-data['openai']['api_configs'] = {
-    '0': {
-        'enable': True,
-        'tags': [],
-        'prefix_id': '',
-        'model_ids': ['claude-haiku-4-5-20251001'],
-        'connection_type': 'external',
-        'auth_type': 'bearer'
-    },
-    '1': {
-        'enable': True,
-        'tags': [],
-        'prefix_id': '',
-        'model_ids': ['gpt-5.2-2025-12-11'],
-        'connection_type': 'external',
-        'auth_type': 'bearer'
-    },
-    '2': {
-        'enable': True,
-        'tags': [],
-        'prefix_id': '',
-        'model_ids': ['grok-4-latest'],
-        'connection_type': 'external',
-        'auth_type': 'bearer'
-    },
-    '3': {
-        'enable': True,
-        'tags': [],
-        'prefix_id': '',
-        'model_ids': ['gemini-3-pro-preview'],
-        'connection_type': 'external',
-        'auth_type': 'bearer'
-    }
-}
-
-# Disable automatic model fetching
-data['ENABLE_MODEL_FILTER'] = False
-
-# Add models to model table
-models = [
-    {
-        'id': 'claude-haiku-4-5-20251001',
-        'name': 'Anthropic (Claude) - claude-haiku-4-5-20251001',
-        'base_url': 'http://agentgateway:3000/anthropic/v1',
-        'api_key': 'sk-anthropic'
-    },
-    {
-        'id': 'gpt-5.2-2025-12-11',
-        'name': 'OpenAI (GPT) - gpt-5.2-2025-12-11',
-        'base_url': 'http://agentgateway:3000/openai/v1',
-        'api_key': 'sk-openai'
-    },
-    {
-        'id': 'grok-4-latest',
-        'name': 'xAI (Grok) - grok-4-latest',
-        'base_url': 'http://agentgateway:3000/xai/v1',
-        'api_key': 'sk-xai'
-    },
-    {
-        'id': 'gemini-3-pro-preview',
-        'name': 'Gemini - gemini-3-pro-preview',
-        'base_url': 'http://agentgateway:3000/gemini/v1',
-        'api_key': 'sk-gemini'
-    }
-]
-
-timestamp = int(time.time())
-models_added = 0
-
-for model_data in models:
-    # Check if model already exists
-    cursor.execute('SELECT id FROM model WHERE id = ?', (model_data['id'],))
-    if cursor.fetchone():
-        continue
-
-    # Create model entry
-    meta = json.dumps({
-        'profile_image_url': '/static/favicon.png',
-        'description': f"{model_data['name']} via AgentGateway",
-        'capabilities': {},
-        'position': models_added
-    })
-
-    params = json.dumps({
-        'api_base_url': model_data['base_url'],
-        'api_key': model_data['api_key'],
-        'stream': True
-    })
-
-    cursor.execute(
-        'INSERT INTO model (id, user_id, base_model_id, name, meta, params, created_at, updated_at, is_active, access_control) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-        (model_data['id'], '', model_data['id'], model_data['name'], meta, params, timestamp, timestamp, 1, json.dumps({'read': {'group_ids': [], 'user_ids': []}, 'write': {'group_ids': [], 'user_ids': []}}))
-    )
-    models_added += 1
-
-# Save config
-if result:
-    cursor.execute('UPDATE config SET data = ?, updated_at = datetime("now") WHERE id = ?',
-                   (json.dumps(data), config_id))
-else:
-    cursor.execute('INSERT INTO config (id, data, version, created_at, updated_at) VALUES (?, ?, 0, datetime("now"), datetime("now"))',
-                   (config_id, json.dumps(data)))
-
-conn.commit()
-conn.close()
-
-print(f"✓ Configured 4 API endpoints")
-print(f"✓ Added {models_added} new models")
-"""
+            connections = self.connections or self.prepare_connections()
 
-            # Execute the script in the Open WebUI container
-            result = subprocess.run(
-                ["docker", "exec", "open-webui", "python3", "-c", db_script],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            # Runs in-process when the Open WebUI data volume is mounted here
+            result = execute(build_plan(connections), OPENWEBUI_CONTAINER)
+            print_result(result)
 
-            if result.returncode == 0:
-                print("✓ Models configured successfully via database")
-                print(result.stdout)
-                return True
-            else:
-                print(f"✗ Failed to configure models: {result.stderr}")
+            if "error" in result:
                 return False
+            if result["changed"]:
+                print("✓ Models configured successfully via database")
+            return True
 
         except Exception as e:
             print(f"✗ Error configuring models: {e}")
             return False
 
-    def print_summary(self, user_results: List[Dict]):
+    def print_summary(self, stats: Optional[ImportStats]):
         """Print initialization summary"""
+        stats = stats or ImportStats()
         print("\n" + "="*70)
         print("INITIALIZATION SUMMARY")
         print("="*70)
 
-        created = len([r for r in user_results if r['status'] == 'created'])
-        exists = len([r for r in user_results if r['status'] == 'exists'])
-        failed = len([r for r in user_results if r['status'] == 'failed'])
-
         print(f"\nUsers:")
-        print(f"  ✓ Created:        {created}")
-        print(f"  ℹ Already exist:  {exists}")
-        print(f"  ✗ Failed:         {failed}")
-
-        # Group by team
-        teams = {}
-        for user in user_results:
-            team = user['team']
-            if team not in teams:
-                teams[team] = []
-            teams[team].append(user)
+        print(f"  ✓ Created:        {stats.count('created')}")
+        print(f"  ℹ Already exist:  {stats.count('exists')}")
+        print(f"  ✗ Failed:         {stats.count('failed')}"
+              + (f" ({stats.invalid} invalid rows)" if stats.invalid else ""))
+
+        if stats.timed:
+            print(f"  ⏱ Latency:        p50 {stats.percentile(0.50):.0f}ms, "
+                  f"p95 {stats.percentile(0.95):.0f}ms, max {stats.max_latency_ms:.0f}ms")
 
         print("\n" + "="*70)
         print("USER ACCOUNTS BY TEAM")
         print("="*70)
 
-        for team_name in sorted(teams.keys()):
+        for team_name in sorted(stats.teams):
             print(f"\n{team_name.upper()} TEAM:")
             print("-" * 50)
-            for user in teams[team_name]:
+            if stats.details is None:
+                # Bulk imports: counts only, credentials live in the source file
+                counts = stats.teams[team_name]
+                print(f"  {sum(counts.values())} users: {counts.get('created', 0)} created, "
+                      f"{counts.get('exists', 0)} existing, {counts.get('failed', 0)} failed")
+                continue
+            for user in stats.details:
+                if user['team'] != team_name:
+                    continue
                 status_icon = {
                     'created': '✓',
                     'exists': 'ℹ',
@@ -449,21 +455,8 @@ print(f"✓ Added {models_added} new models")
         print(f"\n⚠ IMPORTANT: Change the admin password after first login!")
         print()
 
-    def run(self):
-        """Main initialization routine"""
-        print("="*70)
-        print("Open WebUI Initialization")
-        print("="*70)
-        print()
-
-        # Step 1: Wait for Open WebUI
-        if not self.wait_for_openwebui():
-            print("\n✗ Initialization failed: Open WebUI not ready")
-            sys.exit(1)
-
-        time.sleep(5)  # Give it a moment to fully start
-
-        # Step 2: Create admin user
+    def ensure_admin(self) -> bool:
+        """Create or sign in the admin user; users fall back to signup without it"""
         print("\n" + "="*70)
         print("Creating Admin User")
         print("="*70)
@@ -471,15 +464,39 @@ print(f"✓ Added {models_added} new models")
         if not self.create_admin():
             print("\n⚠ Warning: Could not create/authenticate admin user")
             print("  You may need to create users manually through the UI")
+        return True
+
+    def tasks(self, prefix: str = "openwebui") -> List[Task]:
+        """Initialization steps as a dependency graph"""
+        return [
+            Task(f"{prefix}.ready", self.wait_for_openwebui),
+            Task(f"{prefix}.admin", self.ensure_admin, [f"{prefix}.ready"]),
+            Task(f"{prefix}.users", self.create_users, [f"{prefix}.admin"]),
+            # Compiling and discovery don't need Open WebUI, only the DB write does
+            Task(f"{prefix}.connections", self.prepare_connections),
+            Task(f"{prefix}.models", self.configure_models,
+                 [f"{prefix}.ready", f"{prefix}.connections"])
+        ]
+
+    def run(self):
+        """Main initialization routine"""
+        print("="*70)
+        print("Open WebUI Initialization")
+        print("="*70)
+        print()
 
-        # Step 3: Create team users
-        user_results = self.create_users()
+        tasks = self.tasks()
+        results = run_dag(tasks)
 
-        # Step 4: Configure models
-        self.configure_models()
+        if results['openwebui.ready']['status'] != 'ok':
+            print("\n✗ Initialization failed: Open WebUI not ready")
+            print_timeline(tasks, results)
+            print_http_stats()
+            sys.exit(1)
 
-        # Step 5: Print summary
-        self.print_summary(user_results)
+        self.print_summary(results['openwebui.users']['result'])
+        print_timeline(tasks, results)
+        print_http_stats()
 
         print("\n" + "="*70)
         print("Initialization Complete!")
@@ -489,6 +506,7 @@ print(f"✓ Added {models_added} new models")
 
 def main():
     """Main entry point"""
+    init_tracing("init-openwebui")
     try:
         initializer = OpenWebUIInitializer()
         initializer.run()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Stack Initialization Runner
+===========================
+
+Runs the Keycloak and Open WebUI initialization as one dependency graph:
+
+    keycloak.ready → keycloak.auth ─┐
+    keycloak.config ────────────────┴→ keycloak.realm
+    openwebui.ready → openwebui.admin → openwebui.users
+    openwebui.connections ─┬→ openwebui.models
+    openwebui.ready ───────┘
+    keycloak.realm + openwebui.users → users.sync
+
+Independent steps run concurrently, so cold start takes as long as the
+slowest chain instead of the sum of both init containers. Every step is
+idempotent, and the run ends with a timeline that marks the critical path.
+
+The last step mirrors the realm's users into Open WebUI (see user_sync), so
+users only need to be declared in realm-config.json.
+"""
+
+import importlib.util
+import os
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _lib_dir in (os.path.join(_HERE, "lib"), os.path.join(_HERE, "..", "..", "lib")):
+    if os.path.isdir(_lib_dir):
+        sys.path.insert(0, _lib_dir)
+        break
+
+from http_client import print_http_stats
+from init_dag import Task, print_timeline, run_dag
+from tracing import init as init_tracing
+from user_sync import OpenWebUIAdmin, SyncState, print_sync_result, sync_users
+
+# Kept on the Open WebUI data volume so fingerprints survive between runs
+SYNC_STATE = os.environ.get("AGW_USER_SYNC_STATE", "/app/backend/data/keycloak-user-sync.json")
+
+
+def load_script(name: str, candidates):
+    """Import one of the hyphen-named init scripts as a module"""
+    for path in candidates:
+        if os.path.exists(path):
+            spec = importlib.util.spec_from_file_location(name, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module
+    raise FileNotFoundError(f"{name}: none of {', '.join(candidates)} exist")
+
+
+def sync_realm_users(configurator, initializer):
+    """Mirror the realm's users into Open WebUI"""
+    print("\nSyncing Keycloak users into Open WebUI...")
+    result = sync_users(
+        configurator.admin,
+        configurator.realm_config["realm"],
+        OpenWebUIAdmin(initializer.base_url, initializer.admin_token),
+        state=SyncState(SYNC_STATE),
+        protected=[initializer.config['admin']['email']]
+    )
+    print_sync_result(result)
+    return result
+
+
+def main():
+    """Main entry point"""
+    init_tracing("init-stack")
+    keycloak = load_script("init_keycloak", [
+        os.path.join(_HERE, "init-keycloak.py"),
+        os.path.join(_HERE, "..", "keycloak", "init-keycloak.py")
+    ])
+    openwebui = load_script("init_openwebui", [
+        os.path.join(_HERE, "init-openwebui.py"),
+        os.path.join(_HERE, "..", "openwebui", "init-openwebui.py")
+    ])
+
+    print("="*70)
+    print("Stack Initialization (Keycloak + Open WebUI)")
+    print("="*70)
+    print()
+
+    configurator = keycloak.KeycloakConfigurator(
+        keycloak.KEYCLOAK_URL,
+        keycloak.ADMIN_USERNAME,
+        keycloak.ADMIN_PASSWORD
+    )
+    initializer = openwebui.OpenWebUIInitializer()
+
+    tasks = configurator.tasks() + initializer.tasks() + [
+        Task("users.sync", lambda: sync_realm_users(configurator, initializer),
+             ["keycloak.realm", "openwebui.users"])
+    ]
+    results = run_dag(tasks, max_workers=len(tasks))
+
+    keycloak_ok = configurator.check_results(results)
+    if keycloak_ok:
+        configurator.print_summary(configurator.realm_config["realm"])
+
+    openwebui_ok = results['openwebui.ready']['status'] == 'ok'
+    if openwebui_ok:
+        initializer.print_summary(results['openwebui.users']['result'])
+    else:
+        print("\n✗ Open WebUI initialization failed: Open WebUI not ready")
+
+    print_timeline(tasks, results)
+    print_http_stats()
+
+    print("\n" + "="*70)
+    print("Initialization Complete!" if keycloak_ok and openwebui_ok else "Initialization Failed")
+    print("="*70)
+    print()
+
+    sys.exit(0 if keycloak_ok and openwebui_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Batch Queue
+===========
+
+An offline lane for scheduled, non-interactive completions (nightly
+summaries, classification jobs) so they stop competing with users for the
+gateway's per-route `localRateLimit` buckets:
+
+- `BatchQueue` persists requests in a local SQLite file. Each request gets
+  an id, and its status (`queued`, `sending`, `submitted`, `done`,
+  `failed`) and result can be looked up by that id at any time, including
+  from another process.
+- `BatchWorker` drains the queue, grouped by route and model:
+  - Routes with a batch API configured (OpenAI-format `/v1/files` +
+    `/v1/batches`) get each group uploaded as one JSONL batch, which
+    providers bill at batch prices. Batches are polled, and their output
+    file is written back to the individual requests.
+  - Every other route goes through a throttled background lane: one sender
+    thread per route, paced by an AdaptiveRateLimiter capped at `lane_rpm`
+    requests per minute. The default of 2 leaves 8 of the route's 10
+    requests per minute for interactive traffic. 429/5xx responses put the
+    request back in the queue and slow the lane down, honoring
+    `Retry-After`.
+- Requests are sent without `stream`. Requests left in `sending` by a
+  crashed worker are re-queued on start.
+
+scripts/batch-queue.py is the command line (submit, status, results, run).
+scripts/mock-gateway.py implements the batch endpoints for local testing.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from http_client import create_client
+from rate_limiter import AdaptiveRateLimiter, is_throttle_status, retry_after_seconds
+
+DEFAULT_DB = "batch-queue.db"
+DEFAULT_GATEWAY = "http://localhost:3000"
+# Requests per minute per route left to the background lane (routes allow 10)
+DEFAULT_LANE_RPM = 2.0
+# Largest batch a provider accepts
+MAX_BATCH_REQUESTS = 50000
+COMPLETIONS_PATH = "/v1/chat/completions"
+
+# Gateway routes → environment variable holding the provider key
+ROUTE_KEYS = {
+    "/openai": "OPENAI_API_KEY",
+    "/anthropic": "ANTHROPIC_API_KEY",
+    "/gemini": "GEMINI_API_KEY",
+    "/xai": "XAI_API_KEY",
+}
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS batch_requests (
+    id TEXT PRIMARY KEY,
+    route TEXT NOT NULL,
+    model TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL,
+    batch_id TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS batch_requests_queued ON batch_requests (status, route, model, created);
+CREATE TABLE IF NOT EXISTS batch_jobs (
+    id TEXT PRIMARY KEY,
+    route TEXT NOT NULL,
+    model TEXT NOT NULL,
+    status TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+# Provider batch states that won't change any more
+BATCH_FINAL = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchQueue:
+    """Durable queue of completion requests, addressed by id"""
+
+    def __init__(self, path: str = DEFAULT_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA_SQL)
+
+    def close(self):
+        self.conn.close()
+
+    def execute(self, sql: str, params: Iterable = ()) -> List[Tuple]:
+        with self._lock:
+            return self.conn.execute(sql, tuple(params)).fetchall()
+
+    def submit(self, route: str, body: Dict, request_id: Optional[str] = None) -> str:
+        """Queue one chat completion body for a route; returns its id"""
+        return self.submit_many(route, [(request_id, body)])[0]
+
+    def submit_many(self, route: str, items: Iterable[Tuple[Optional[str], Dict]]) -> List[str]:
+        """Queue many (id or None, body) pairs in one transaction"""
+        route = "/" + route.strip("/")
+        now = time.time()
+        rows, ids = [], []
+        for request_id, body in items:
+            if not isinstance(body, dict) or not body.get("model"):
+                raise ValueError("request body needs a model")
+            body = {key: value for key, value in body.items() if key not in ("stream", "stream_options")}
+            request_id = request_id or f"req_{uuid.uuid4().hex}"
+            ids.append(request_id)
+            rows.append((request_id, route, body["model"], json.dumps(body), "queued", now, now))
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO batch_requests (id, route, model, body, status, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def get(self, request_id: str) -> Optional[Dict]:
+        """Status, and the response or error, of one request"""
+        rows = self.execute("SELECT id, route, model, status, batch_id, result, error, attempts, "
+                            "created, updated FROM batch_requests WHERE id = ?", (request_id,))
+        if not rows:
+            return None
+        (request_id, route, model, status, batch_id, result, error,
+         attempts, created, updated) = rows[0]
+        return {"id": request_id, "route": route, "model": model, "status": status,
+                "batch_id": batch_id, "response": json.loads(result) if result else None,
+                "error": error, "attempts": attempts, "created": created, "updated": updated}
+
+    def results(self, status: Optional[str] = None) -> List[Dict]:
+        query = "SELECT id FROM batch_requests"
+        params: Tuple = ()
+        if status:
+            query, params = query + " WHERE status = ?", (status,)
+        return [self.get(row[0]) for row in self.execute(query + " ORDER BY created", params)]
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.execute("SELECT status, COUNT(*) FROM batch_requests GROUP BY status"))
+
+    def groups(self) -> List[Tuple[str, str, int]]:
+        """(route, model, queued requests), oldest first"""
+        return self.execute("SELECT route, model, COUNT(*) FROM batch_requests WHERE status = 'queued' "
+                            "GROUP BY route, model ORDER BY MIN(created)")
+
+    def claim(self, route: str, model: Optional[str] = None,
+              limit: int = 1, status: str = "sending") -> List[Tuple[str, Dict]]:
+        """Atomically move up to `limit` queued requests to `status`"""
+        query = "SELECT id, body FROM batch_requests WHERE status = 'queued' AND route = ?"
+        params: List = [route]
+        if model is not None:
+            query += " AND model = ?"
+            params.append(model)
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(query + " ORDER BY created LIMIT ?", (*params, limit)).fetchall()
+                self.conn.executemany(
+                    "UPDATE batch_requests SET status = ?, attempts = attempts + 1, updated = ? "
+                    "WHERE id = ?", [(status, time.time(), request_id) for request_id, _ in rows])
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [(request_id, json.loads(body)) for request_id, body in rows]
+
+    def finish(self, request_id: str, response: Optional[Dict] = None, error: Optional[str] = None):
+        status = "failed" if error else "done"
+        self.execute("UPDATE batch_requests SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?",
+                     (status, json.dumps(response) if response is not None else None, error,
+                      time.time(), request_id))
+
+    def requeue(self, request_ids: Iterable[str]):
+        with self._lock:
+            self.conn.executemany("UPDATE batch_requests SET status = 'queued', batch_id = NULL, "
+                                  "updated = ? WHERE id = ?",
+                                  [(time.time(), request_id) for request_id in request_ids])
+
+    def recover(self) -> int:
+        """Re-queue requests a crashed worker left in flight
+
+        That is `sending` (a lane), or `submitted` without a batch id (claimed
+        for a batch that was never recorded).
+        """
+        with self._lock:
+            cursor = self.conn.execute("UPDATE batch_requests SET status = 'queued', updated = ? "
+                                       "WHERE status = 'sending' "
+                                       "OR (status = 'submitted' AND batch_id IS NULL)", (time.time(),))
+            return cursor.rowcount
+
+    def add_job(self, batch_id: str, route: str, model: str, request_ids: List[str]):
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute("INSERT INTO batch_jobs (id, route, model, status, size, created, updated) "
+                              "VALUES (?, ?, ?, 'validating', ?, ?, ?)",
+                              (batch_id, route, model, len(request_ids), now, now))
+            self.conn.executemany("UPDATE batch_requests SET batch_id = ?, updated = ? WHERE id = ?",
+                                  [(batch_id, now, request_id) for request_id in request_ids])
+            self.conn.execute("COMMIT")
+
+    def open_jobs(self) -> List[Tuple[str, str]]:
+        """(batch id, route) of batches still running at the provider"""
+        placeholders = ",".join("?" * len(BATCH_FINAL))
+        return self.execute(f"SELECT id, route FROM batch_jobs WHERE status NOT IN ({placeholders})",
+                            BATCH_FINAL)
+
+    def update_job(self, batch_id: str, status: str):
+        self.execute("UPDATE batch_jobs SET status = ?, updated = ? WHERE id = ?",
+                     (status, time.time(), batch_id))
+
+    def job_requests(self, batch_id: str) -> List[str]:
+        return [row[0] for row in self.execute(
+            "SELECT id FROM batch_requests WHERE batch_id = ? AND status = 'submitted'", (batch_id,))]
+
+
+class BatchApi:
+    """OpenAI-format batch endpoints (/files, /batches) of one provider"""
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None,
+                 client: Optional[requests.Session] = None):
+        self.base_url = base_url.rstrip("/")
+        self.client = client or create_client(timeout=(3.05, 120))
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    def create(self, lines: List[Dict]) -> Dict:
+        """Upload the JSONL input and start a batch"""
+        payload = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+        upload = self.client.post(f"{self.base_url}/files", headers=self.headers,
+                                  data={"purpose": "batch"},
+                                  files={"file": ("batch.jsonl", payload, "application/jsonl")})
+        upload.raise_for_status()
+        batch = self.client.post(f"{self.base_url}/batches", headers=self.headers, json={
+            "input_file_id": upload.json()["id"],
+            "endpoint": COMPLETIONS_PATH,
+            "completion_window": "24h",
+        })
+        batch.raise_for_status()
+        return batch.json()
+
+    def status(self, batch_id: str) -> Dict:
+        response = self.client.get(f"{self.base_url}/batches/{batch_id}", headers=self.headers)
+        response.raise_for_status()
+        return response.json()
+
+    def output(self, file_id: str) -> List[Dict]:
+        response = self.client.get(f"{self.base_url}/files/{file_id}/content", headers=self.headers)
+        response.raise_for_status()
+        return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+class BatchWorker:
+    """Sends queued requests through provider batches or the throttled lane"""
+
+    def __init__(self, queue: BatchQueue, gateway_url: str = DEFAULT_GATEWAY,
+                 lane_rpm: float = DEFAULT_LANE_RPM, batch_apis: Optional[Dict[str, BatchApi]] = None,
+                 max_attempts: int = 5, idle_wait: float = 5.0,
+                 client: Optional[requests.Session] = None):
+        self.queue = queue
+        self.gateway_url = gateway_url.rstrip("/")
+        self.lane_rpm = lane_rpm
+        self.batch_apis = {"/" + route.strip("/"): api for route, api in (batch_apis or {}).items()}
+        self.max_attempts = max_attempts
+        self.idle_wait = idle_wait
+        # The lane paces itself; keep only connect retries
+        self.client = client or create_client(timeout=(3.05, 300), retry_statuses=())
+        self.stop = threading.Event()
+        self.lanes: Dict[str, threading.Thread] = {}
+        self.limiters: Dict[str, AdaptiveRateLimiter] = {}
+
+    # --- provider batches ---------------------------------------------------
+
+    def submit_batches(self) -> int:
+        """Upload every queued group on a batch-capable route; returns batches created"""
+        created = 0
+        for route, model, _ in self.queue.groups():
+            api = self.batch_apis.get(route)
+            if api is None:
+                continue
+            items = self.queue.claim(route, model, limit=MAX_BATCH_REQUESTS, status="submitted")
+            if not items:
+                continue
+            lines = [{"custom_id": request_id, "method": "POST", "url": COMPLETIONS_PATH, "body": body}
+                     for request_id, body in items]
+            try:
+                batch = api.create(lines)
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                print(f"⚠️  Batch submission for {route} {model} failed: {e}")
+                for request_id, _ in items:
+                    self.retry_or_fail(request_id, f"batch submission failed: {e}")
+                continue
+            self.queue.add_job(batch["id"], route, model, [request_id for request_id, _ in items])
+            created += 1
+        return created
+
+    def poll_batches(self) -> int:
+        """Check running batches and store the results of finished ones"""
+        finished = 0
+        for batch_id, route in self.queue.open_jobs():
+            api = self.batch_apis.get(route)
+            if api is None:
+                continue
+            try:
+                batch = api.status(batch_id)
+                status = batch.get("status", "unknown")
+                if status not in BATCH_FINAL:
+                    self.queue.update_job(batch_id, status)
+                    continue
+                outputs = []
+                for file_key in ("output_file_id", "error_file_id"):
+                    if batch.get(file_key):
+                        outputs += api.output(batch[file_key])
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"⚠️  Polling batch {batch_id} failed: {e}")
+                continue
+            self.store_outputs(batch_id, status, outputs)
+            finished += 1
+        return finished
+
+    def store_outputs(self, batch_id: str, status: str, outputs: List[Dict]):
+        for line in outputs:
+            request_id = line.get("custom_id")
+            response = line.get("response") or {}
+            if line.get("error") or response.get("status_code", 200) >= 400:
+                error = line.get("error") or response.get("body")
+                self.queue.finish(request_id, error=json.dumps(error))
+            else:
+                self.queue.finish(request_id, response.get("body"))
+        # Anything the provider didn't answer (failed, expired, cancelled) is
+        # retried until it runs out of attempts
+        for request_id in self.queue.job_requests(batch_id):
+            self.retry_or_fail(request_id, f"batch {batch_id} ended {status} without an answer")
+        self.queue.update_job(batch_id, status)
+
+    # --- throttled lane -----------------------------------------------------
+
+    def limiter(self, route: str) -> AdaptiveRateLimiter:
+        if route not in self.limiters:
+            rate = self.lane_rpm / 60.0
+            self.limiters[route] = AdaptiveRateLimiter(initial_rate=rate, min_rate=rate / 10,
+                                                       max_rate=rate, base_backoff=5.0,
+                                                       max_backoff=300.0)
+        return self.limiters[route]
+
+    def send(self, route: str, request_id: str, body: Dict) -> bool:
+        """Send one request through the gateway; False if the route pushed back"""
+        limiter = self.limiter(route)
+        limiter.acquire()
+        try:
+            response = self.client.post(f"{self.gateway_url}{route}{COMPLETIONS_PATH}", json=body)
+        except requests.exceptions.RequestException as e:
+            limiter.on_throttle()
+            self.retry_or_fail(request_id, str(e))
+            return False
+        if is_throttle_status(response.status_code):
+            limiter.on_throttle(retry_after_seconds(response.headers.get("Retry-After")))
+            self.retry_or_fail(request_id, f"HTTP {response.status_code}")
+            return False
+        limiter.on_success()
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {"raw": response.text}
+        if response.status_code >= 400:
+            self.queue.finish(request_id, error=json.dumps(payload))
+        else:
+            self.queue.finish(request_id, payload)
+        return True
+
+    def retry_or_fail(self, request_id: str, error: str):
+        record = self.queue.get(request_id)
+        if record and record["attempts"] >= self.max_attempts:
+            self.queue.finish(request_id, error=f"gave up after {record['attempts']} attempts: {error}")
+        else:
+            self.queue.requeue([request_id])
+
+    def lane(self, route: str):
+        """Sender loop for one route"""
+        while not self.stop.is_set():
+            items = self.queue.claim(route)
+            if not items:
+                self.stop.wait(self.idle_wait)
+                continue
+            request_id, body = items[0]
+            self.send(route, request_id, body)
+
+    def lane_routes(self) -> List[str]:
+        routes = {route for route, _, _ in self.queue.groups()}
+        return sorted(route for route in routes if route not in self.batch_apis)
+
+    def start_lanes(self):
+        for route in self.lane_routes():
+            thread = self.lanes.get(route)
+            if thread is None or not thread.is_alive():
+                self.lanes[route] = threading.Thread(target=self.lane, args=(route,), daemon=True)
+                self.lanes[route].start()
+
+    # --- driver -------------------------------------------------------------
+
+    def run(self, poll_interval: float = 60.0, once: bool = False):
+        """Work the queue until stopped (or until it is drained, with once=True)"""
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"↻ Re-queued {recovered} request(s) left in flight by a previous worker")
+        while not self.stop.is_set():
+            self.start_lanes()
+            self.submit_batches()
+            self.poll_batches()
+            if once and not self.pending():
+                break
+            self.stop.wait(poll_interval)
+        self.stop.set()
+        for thread in self.lanes.values():
+            thread.join()
+
+    def pending(self) -> int:
+        counts = self.queue.counts()
+        return sum(counts.get(status, 0) for status in ("queued", "sending", "submitted"))
+
+
+def batch_apis_from_env(specs: Iterable[str]) -> Dict[str, BatchApi]:
+    """BatchApi per 'ROUTE=BASE_URL' spec, keyed with the route's provider key"""
+    apis = {}
+    for spec in specs or ():
+        route, _, base_url = spec.partition("=")
+        route = "/" + route.strip("/")
+        apis[route] = BatchApi(base_url, os.environ.get(ROUTE_KEYS.get(route, ""), ""))
+    return apis
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Gateway Proxy
+=============
+
+A small HTTP proxy that sits between Open WebUI (or any OpenAI-compatible
+client) and AgentGateway, so request-level policies can be added in
+Python without touching the gateway:
+
+- Requests are forwarded to the upstream gateway over the shared pooled
+  client (http_client.py). Streamed responses (`text/event-stream`) are
+  relayed chunk by chunk with chunked transfer encoding and never
+  buffered.
+- Policies are layers: `layer(request, call_next) -> ProxyResponse`. Each
+  one can answer a request itself, pass it on, or wrap the response
+  (e.g. the response cache in response_cache.py). Layers run in the order
+  they were added.
+- `GET /metrics` serves Prometheus metrics from the proxy and every layer
+  that has a `metrics()` method; `GET /healthz` answers without touching
+  the upstream. `close()` on shutdown calls every layer's `close()`.
+
+Only the standard library and `requests` are needed.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from http_client import create_client
+
+DEFAULT_UPSTREAM = "http://agentgateway:3000"
+DEFAULT_LISTEN = ("0.0.0.0", 3010)
+# Streams can stay open for minutes; the read timeout is per chunk
+UPSTREAM_TIMEOUT = (3.05, 300.0)
+
+# Connection-level headers that are never forwarded
+HOP_BY_HOP = frozenset((
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+    "trailer", "trailers", "transfer-encoding", "upgrade", "host", "content-length",
+    "accept-encoding", "content-encoding"
+))
+# Response headers the proxy's own server sets; forwarding them would send both
+OWN_RESPONSE_HEADERS = frozenset(("server", "date"))
+
+
+class ProxyRequest:
+    """One client request, with the body already read"""
+
+    def __init__(self, method: str, path: str, headers: Dict[str, str], body: bytes = b""):
+        self.method = method
+        self.path = path
+        self.headers = {name.lower(): value for name, value in headers.items()}
+        self.body = body
+        self._json = None
+        self._parsed = False
+
+    @property
+    def json(self) -> Optional[Dict]:
+        """The body as a JSON object, or None"""
+        if not self._parsed:
+            self._parsed = True
+            if self.body and "json" in self.headers.get("content-type", "application/json"):
+                try:
+                    body = json.loads(self.body)
+                except ValueError:
+                    body = None
+                self._json = body if isinstance(body, dict) else None
+        return self._json
+
+
+class ProxyResponse:
+    """A response with either a complete body or an iterator of chunks"""
+
+    def __init__(self, status: int, headers: Iterable[Tuple[str, str]] = (), body: bytes = b"",
+                 chunks: Optional[Iterator[bytes]] = None):
+        self.status = status
+        self.headers: List[Tuple[str, str]] = list(headers)
+        self.body = body
+        self.chunks = chunks
+        # token_usage.Usage, parsed once and shared by every layer that meters it
+        self.usage = None
+
+    @property
+    def streaming(self) -> bool:
+        return self.chunks is not None
+
+    def header(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def set_header(self, name: str, value: str):
+        self.headers = [(key, val) for key, val in self.headers if key.lower() != name.lower()]
+        self.headers.append((name, value))
+
+
+Handler = Callable[[ProxyRequest], ProxyResponse]
+Layer = Callable[[ProxyRequest, Handler], ProxyResponse]
+
+
+def json_response(status: int, body, headers: Iterable[Tuple[str, str]] = ()) -> ProxyResponse:
+    return ProxyResponse(status, [("Content-Type", "application/json"), *headers],
+                         json.dumps(body).encode("utf-8"))
+
+
+def metric(name: str, kind: str, help_text: str,
+           samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Prometheus exposition lines for one metric"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{val}"' for key, val in sorted(labels.items()))
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+class GatewayProxy:
+    """Forwards requests to the gateway through a chain of layers"""
+
+    def __init__(self, upstream: str = DEFAULT_UPSTREAM, client: Optional[requests.Session] = None,
+                 layers: Iterable[Layer] = ()):
+        self.upstream = upstream.rstrip("/")
+        # Connect retries only: a retried POST could bill a prompt twice
+        self.client = client or create_client(pool_size=64, timeout=UPSTREAM_TIMEOUT,
+                                              retries=2, retry_statuses=())
+        self.layers: List[Layer] = list(layers)
+        self._lock = threading.Lock()
+        self.responses: Dict[str, int] = {}
+        self.upstream_seconds = 0.0
+        self.upstream_requests = 0
+
+    def add_layer(self, layer: Layer):
+        self.layers.append(layer)
+
+    def forward(self, request: ProxyRequest) -> ProxyResponse:
+        """Send a request to the upstream gateway"""
+        headers = {name: value for name, value in request.headers.items() if name not in HOP_BY_HOP}
+        start = time.perf_counter()
+        try:
+            upstream = self.client.request(request.method, self.upstream + request.path,
+                                           headers=headers, data=request.body or None, stream=True)
+        except requests.exceptions.RequestException as e:
+            return json_response(502, {"error": {"message": f"upstream unavailable: {e}",
+                                                 "type": "proxy_error"}})
+        finally:
+            with self._lock:
+                self.upstream_seconds += time.perf_counter() - start
+                self.upstream_requests += 1
+
+        response_headers = [(name, value) for name, value in upstream.headers.items()
+                            if name.lower() not in HOP_BY_HOP and name.lower() not in OWN_RESPONSE_HEADERS]
+        if "text/event-stream" in upstream.headers.get("Content-Type", ""):
+            return ProxyResponse(upstream.status_code, response_headers,
+                                 chunks=relay(upstream))
+        try:
+            body = upstream.content
+        finally:
+            upstream.close()
+        return ProxyResponse(upstream.status_code, response_headers, body)
+
+    def handle(self, request: ProxyRequest) -> ProxyResponse:
+        """Run a request through every layer, then the upstream"""
+        def call(index: int) -> Handler:
+            if index == len(self.layers):
+                return self.forward
+            return lambda req: self.layers[index](req, call(index + 1))
+        response = call(0)(request)
+        with self._lock:
+            status_class = f"{response.status // 100}xx"
+            self.responses[status_class] = self.responses.get(status_class, 0) + 1
+        return response
+
+    def metrics(self) -> str:
+        with self._lock:
+            responses = dict(self.responses)
+            seconds, count = self.upstream_seconds, self.upstream_requests
+        lines = metric("agw_proxy_responses_total", "counter", "Responses sent by status class",
+                       [({"code": code}, value) for code, value in sorted(responses.items())])
+        lines += metric("agw_proxy_upstream_seconds", "summary",
+                        "Time to upstream response headers", [])
+        lines += [f"agw_proxy_upstream_seconds_sum {seconds:.6f}",
+                  f"agw_proxy_upstream_seconds_count {count}"]
+        for layer in self.layers:
+            if hasattr(layer, "metrics"):
+                lines += layer.metrics()
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        """Let every layer that keeps state (a `close()` method) write it out"""
+        for layer in self.layers:
+            if hasattr(layer, "close"):
+                layer.close()
+
+    def serve(self, host: str = DEFAULT_LISTEN[0], port: int = DEFAULT_LISTEN[1]) -> ThreadingHTTPServer:
+        """Create the HTTP server; call serve_forever() on it"""
+        server = ThreadingHTTPServer((host, port), type("Handler", (ProxyHandler,), {"proxy": self}))
+        server.daemon_threads = True
+        return server
+
+
+def relay(upstream: requests.Response) -> Iterator[bytes]:
+    """Upstream stream chunks as they arrive; closes the connection when done"""
+    try:
+        for chunk in upstream.iter_content(chunk_size=None):
+            if chunk:
+                yield chunk
+    finally:
+        upstream.close()
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    """Reads a request, hands it to the proxy and writes the response"""
+
+    protocol_version = "HTTP/1.1"
+    # Small SSE chunks must not wait for delayed ACKs
+    disable_nagle_algorithm = True
+    proxy: GatewayProxy = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_any(self):
+        path = urlsplit(self.path).path
+        if self.command == "GET" and path == "/healthz":
+            return self.write(json_response(200, {"status": "ok"}))
+        if self.command == "GET" and path == "/metrics":
+            return self.write(ProxyResponse(200, [("Content-Type", "text/plain; version=0.0.4")],
+                                            self.proxy.metrics().encode("utf-8")))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        request = ProxyRequest(self.command, self.path, dict(self.headers.items()), body)
+        self.write(self.proxy.handle(request))
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = handle_any
+
+    def write(self, response: ProxyResponse):
+        self.send_response(response.status)
+        for name, value in response.headers:
+            self.send_header(name, value)
+        if not response.streaming:
+            self.send_header("Content-Length", str(len(response.body)))
+            self.end_headers()
+            self.wfile.write(response.body)
+            return
+
+        self.send_header("Transfer-Encoding", "chunked")
+        if response.header("Cache-Control") is None:
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        chunks = response.chunks
+        try:
+            for chunk in chunks:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away: stop reading the upstream stream
+            self.close_connection = True
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP Client
+==================
+
+One way to talk HTTP for every script and init container:
+
+- `create_client()` returns a `requests.Session` with a keep-alive
+  connection pool sized for the caller, and a default (connect, read)
+  timeout applied to every request that doesn't pass its own.
+- Connect errors, 429 and 5xx responses are retried with exponential,
+  jittered backoff, honoring `Retry-After`. Status retries only apply to
+  idempotent methods; a POST is retried only when it never reached the
+  server. Callers that pace themselves (AdaptiveRateLimiter) pass
+  `retry_statuses=()` and keep only the connect retries.
+- `http2=True` sends requests over HTTP/2 through httpx when `httpx[http2]`
+  is installed, and falls back to the HTTP/1.1 pool otherwise.
+- Every response goes through timing hooks. The built-in hook feeds the
+  process-wide `STATS`, so every script reports latency the same way with
+  `print_http_stats()`; extra hooks get `(response, seconds)`.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from rate_limiter import retry_after_seconds
+
+DEFAULT_TIMEOUT = (3.05, 30.0)
+DEFAULT_RETRIES = 4
+DEFAULT_BACKOFF = 0.5
+DEFAULT_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Latencies kept per host for percentiles; long-running services keep a sliding window
+LATENCY_WINDOW = 2048
+
+Timeout = Union[float, Tuple[float, float]]
+TimingHook = Callable[[requests.Response, float], None]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class LatencyStats:
+    """Per-host request counts, errors, retries and latency percentiles
+
+    Counts and the maximum cover every request; percentiles cover the last
+    `window` requests per host, so memory stays bounded in daemons.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict] = {}
+
+    def record(self, host: str, seconds: float, status: Optional[int], retries: int = 0):
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                entry = self._hosts[host] = {"latencies": deque(maxlen=self.window), "requests": 0,
+                                             "max": 0.0, "errors": 0, "retries": 0}
+            entry["latencies"].append(seconds)
+            entry["requests"] += 1
+            entry["max"] = max(entry["max"], seconds)
+            entry["retries"] += retries
+            if status is None or status >= 400:
+                entry["errors"] += 1
+
+    def summary(self) -> Dict[str, Dict]:
+        """Snapshot: {host: {requests, errors, retries, p50_ms, p95_ms, max_ms}}"""
+        with self._lock:
+            hosts = {host: dict(entry, latencies=sorted(entry["latencies"]))
+                     for host, entry in self._hosts.items()}
+        return {
+            host: {
+                "requests": entry["requests"],
+                "errors": entry["errors"],
+                "retries": entry["retries"],
+                "p50_ms": round(percentile(entry["latencies"], 0.50) * 1000, 1),
+                "p95_ms": round(percentile(entry["latencies"], 0.95) * 1000, 1),
+                "max_ms": round(entry["max"] * 1000, 1)
+            }
+            for host, entry in hosts.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            self._hosts = {}
+
+
+STATS = LatencyStats()
+
+
+def print_http_stats(stats: LatencyStats = STATS):
+    """Print one latency line per host"""
+    summary = stats.summary()
+    if not summary:
+        return
+    print("\n⏱ HTTP latency:")
+    for host, entry in sorted(summary.items()):
+        print(f"  {host}: {entry['requests']} requests, p50 {entry['p50_ms']:.0f}ms, "
+              f"p95 {entry['p95_ms']:.0f}ms, max {entry['max_ms']:.0f}ms, "
+              f"{entry['errors']} errors, {entry['retries']} retries")
+
+
+def build_retry(retries: int, backoff: float, statuses: Iterable[int]) -> Retry:
+    """Connect and status retries with jittered backoff and Retry-After"""
+    statuses = tuple(statuses)
+    options = dict(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries if statuses else 0,
+        status_forcelist=statuses,
+        backoff_factor=backoff,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    try:
+        return Retry(**options, backoff_jitter=backoff, backoff_max=30.0)
+    except TypeError:
+        # urllib3 1.x: no jitter, fixed 120s backoff cap
+        return Retry(**options)
+
+
+class Client(requests.Session):
+    """Session with a default timeout and timing hooks"""
+
+    def __init__(self, timeout: Timeout = DEFAULT_TIMEOUT, stats: LatencyStats = STATS):
+        super().__init__()
+        self.timeout = timeout
+        self.stats = stats
+        self.timing_hooks: List[TimingHook] = []
+
+    def add_timing_hook(self, hook: TimingHook):
+        self.timing_hooks.append(hook)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            self.stats.record(host, time.perf_counter() - start, None)
+            raise
+        seconds = time.perf_counter() - start
+        retries = getattr(response, "retries", None)
+        if retries is None:
+            retries = getattr(getattr(response.raw, "retries", None), "history", ())
+        self.stats.record(host, seconds, response.status_code,
+                          retries if isinstance(retries, int) else len(retries))
+        for hook in self.timing_hooks:
+            hook(response, seconds)
+        return response
+
+
+class HTTP2Adapter(HTTPAdapter):
+    """Transport adapter that sends requests over HTTP/2 with httpx"""
+
+    def __init__(self, pool_size: int, retries: int, backoff: float, statuses: Iterable[int]):
+        import httpx  # optional dependency, checked by create_client()
+        super().__init__()
+        self.httpx = httpx
+        self.client = httpx.Client(http2=True, limits=httpx.Limits(
+            max_connections=pool_size, max_keepalive_connections=pool_size))
+        self.retries = retries
+        self.backoff = backoff
+        self.statuses = set(statuses)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        idempotent = request.method in Retry.DEFAULT_ALLOWED_METHODS
+
+        for attempt in range(self.retries + 1):
+            try:
+                reply = self.client.request(
+                    request.method, request.url, headers=dict(request.headers),
+                    content=request.body,
+                    timeout=self.httpx.Timeout(read, connect=connect)
+                )
+            except self.httpx.ConnectError as e:
+                if attempt == self.retries:
+                    raise requests.exceptions.ConnectionError(e, request=request)
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            except self.httpx.TimeoutException as e:
+                raise requests.exceptions.Timeout(e, request=request)
+
+            if attempt < self.retries and idempotent and reply.status_code in self.statuses:
+                delay = retry_after_seconds(reply.headers.get("Retry-After"))
+                time.sleep(min(30.0, delay if delay is not None else self.backoff * 2 ** attempt))
+                continue
+            break
+
+        response = requests.Response()
+        response.status_code = reply.status_code
+        response.headers = requests.structures.CaseInsensitiveDict(reply.headers)
+        response._content = reply.content
+        response.url = str(reply.url)
+        response.reason = reply.reason_phrase
+        response.request = request
+        response.encoding = reply.encoding
+        response.retries = attempt
+        return response
+
+    def close(self):
+        self.client.close()
+        super().close()
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        import httpx  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_client(pool_size: int = 16, timeout: Timeout = DEFAULT_TIMEOUT,
+                  retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF,
+                  retry_statuses: Iterable[int] = DEFAULT_RETRY_STATUSES,
+                  http2: bool = False, headers: Optional[Dict[str, str]] = None,
+                  timing_hooks: Iterable[TimingHook] = ()) -> Client:
+    """Pooled, retrying session shared by one component"""
+    client = Client(timeout)
+    if http2 and http2_available():
+        adapter = HTTP2Adapter(pool_size, retries, backoff, retry_statuses)
+    else:
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                              max_retries=build_retry(retries, backoff, retry_statuses))
+    client.mount("http://", adapter)
+    client.mount("https://", adapter)
+    if headers:
+        client.headers.update(headers)
+    for hook in timing_hooks:
+        client.add_timing_hook(hook)
+    return client
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Init Task Graph
+===============
+
+Runs initialization steps as a dependency graph: every task starts as soon as
+all of its dependencies have succeeded, so independent chains (Keycloak realm
+setup, Open WebUI users, Open WebUI models) overlap and total time drops to
+the slowest chain.
+
+A task fails when it raises or returns False; its dependents are skipped.
+After a run, `print_timeline()` draws every task on a shared time axis and
+marks the critical path, the chain of tasks that determined the total time.
+With tracing enabled every task is also a span, so the same timeline shows
+up in Jaeger.
+"""
+
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List
+
+from tracing import in_current_context, span
+
+
+class Task:
+    """One named initialization step"""
+
+    def __init__(self, name: str, fn: Callable, deps: Iterable[str] = ()):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+
+
+def run_dag(tasks: List[Task], max_workers: int = 8) -> Dict[str, Dict]:
+    """Run tasks concurrently in dependency order"""
+    by_name = {task.name: task for task in tasks}
+    for task in tasks:
+        unknown = [dep for dep in task.deps if dep not in by_name]
+        if unknown:
+            raise ValueError(f"{task.name} depends on unknown task(s): {', '.join(unknown)}")
+
+    origin = time.monotonic()
+    results: Dict[str, Dict] = {}
+    running = {}
+
+    def execute(task: Task) -> Dict:
+        start = time.monotonic() - origin
+        with span(task.name, **{"task.deps": ",".join(task.deps)}) as record:
+            try:
+                value = task.fn()
+                status, error = ("failed", "returned False") if value is False else ("ok", None)
+            except Exception as e:
+                traceback.print_exc()
+                value, status, error = None, "failed", str(e)
+            if record is not None and error:
+                record.fail(error)
+        return {"status": status, "result": value, "error": error,
+                "start": start, "end": time.monotonic() - origin}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while len(results) < len(tasks):
+            for task in tasks:
+                if task.name in results or task.name in running:
+                    continue
+                dep_states = [results.get(dep, {}).get("status") for dep in task.deps]
+                if any(state in ("failed", "skipped") for state in dep_states):
+                    now = time.monotonic() - origin
+                    results[task.name] = {"status": "skipped", "result": None,
+                                          "error": "dependency failed", "start": now, "end": now}
+                elif all(state == "ok" for state in dep_states):
+                    running[task.name] = pool.submit(in_current_context(execute), task)
+
+            if not running:
+                if len(results) < len(tasks):
+                    raise ValueError("dependency cycle in init tasks")
+                break
+
+            done, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name in [name for name, future in running.items() if future in done]:
+                results[name] = running.pop(name).result()
+
+    return results
+
+
+def critical_path(tasks: List[Task], results: Dict[str, Dict]) -> List[str]:
+    """Chain of tasks, ending with the last to finish, that set the total time"""
+    by_name = {task.name: task for task in tasks}
+    ran = [name for name, result in results.items() if result["status"] != "skipped"]
+    if not ran:
+        return []
+
+    path = [max(ran, key=lambda name: results[name]["end"])]
+    while True:
+        deps = by_name[path[-1]].deps
+        if not deps:
+            break
+        # The dependency that finished last is the one this task waited for
+        path.append(max(deps, key=lambda dep: results[dep]["end"]))
+    return list(reversed(path))
+
+
+def print_timeline(tasks: List[Task], results: Dict[str, Dict], width: int = 40):
+    """Print a text timeline with the critical path marked"""
+    total = max((result["end"] for result in results.values()), default=0.0) or 1e-9
+    path = critical_path(tasks, results)
+    label_width = max(len(task.name) for task in tasks)
+    icons = {"ok": "✓", "failed": "✗", "skipped": "-"}
+
+    print("\n" + "="*70)
+    print("INIT TIMELINE")
+    print("="*70)
+    for task in sorted(tasks, key=lambda task: results[task.name]["start"]):
+        result = results[task.name]
+        begin = int(result["start"] / total * width)
+        length = max(1, int((result["end"] - result["start"]) / total * width))
+        if result["status"] == "skipped":
+            length = 0
+        bar = " " * begin + ("█" if task.name in path else "░") * length
+        print(f"{icons[result['status']]} {task.name:<{label_width}} |{bar:<{width}}| "
+              f"{result['start']:6.2f}s → {result['end']:6.2f}s")
+
+    print(f"\nCritical path ({total:.2f}s): {' → '.join(path)}")
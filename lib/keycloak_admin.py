@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Keycloak Admin API Access
+=========================
+
+Reads realm collections (users, clients, groups) from the Keycloak admin
+REST API completely and quickly, even for realms with tens of thousands of
+users:
+
+- Collections are paged with `first`/`max`. Keycloak returns at most 100
+  entries when neither is given, so an unpaged `GET /users` silently misses
+  everyone after the first hundred.
+- When the size is known up front (`/users/count`), the remaining pages are
+  fetched concurrently; otherwise pages are read one after another until a
+  short page comes back.
+- `RealmIndex` keeps an in-process index of clients and users by id,
+  clientId, username and email, so repeated lookups (client secrets,
+  summaries) don't re-list the realm.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+from tracing import in_current_context
+
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_CONCURRENCY = 4
+
+# Collections that support GET .../count
+COUNTABLE = ("users", "groups")
+
+
+class KeycloakAdmin:
+    """Paginated reads against one Keycloak admin API"""
+
+    def __init__(self, base_url: str, session: requests.Session,
+                 page_size: int = DEFAULT_PAGE_SIZE, concurrency: int = DEFAULT_CONCURRENCY,
+                 timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.session = session
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def login(self, username: str, password: str, realm: str = "master") -> bool:
+        """Get an admin token via admin-cli and use it for every call"""
+        response = self.session.post(
+            f"{self.base_url}/realms/{realm}/protocol/openid-connect/token",
+            data={"client_id": "admin-cli", "username": username,
+                  "password": password, "grant_type": "password"},
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            return False
+        self.session.headers.update({"Authorization": f"Bearer {response.json()['access_token']}"})
+        return True
+
+    def realm_url(self, realm: str, path: str = "") -> str:
+        return f"{self.base_url}/admin/realms/{realm}" + (f"/{path}" if path else "")
+
+    def count(self, realm: str, resource: str, params: Optional[Dict] = None) -> Optional[int]:
+        """Size of a collection, or None if Keycloak can't count it"""
+        if resource not in COUNTABLE:
+            return None
+        response = self.session.get(self.realm_url(realm, f"{resource}/count"),
+                                    params=params, timeout=self.timeout)
+        if response.status_code != 200:
+            return None
+        body = response.json()
+        # /users/count returns a number, /groups/count returns {"count": n}
+        return body["count"] if isinstance(body, dict) else int(body)
+
+    def page(self, realm: str, resource: str, first: int, params: Optional[Dict] = None) -> List[Dict]:
+        """Fetch one page of a collection"""
+        response = self.session.get(
+            self.realm_url(realm, resource),
+            params={**(params or {}), "first": first, "max": self.page_size},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def iter_collection(self, realm: str, resource: str,
+                        params: Optional[Dict] = None) -> Iterator[Dict]:
+        """Yield every entry of a collection, in Keycloak's order"""
+        total = self.count(realm, resource, params)
+        if total is None or total <= self.page_size or self.concurrency <= 1:
+            yield from self._iter_sequential(realm, resource, params)
+            return
+
+        offsets = range(0, total, self.page_size)
+        last = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            fetch = in_current_context(lambda first: self.page(realm, resource, first, params))
+            for last in pool.map(fetch, offsets):
+                yield from last
+
+        if len(last) == self.page_size:
+            # Entries created while paging land after the counted range
+            yield from self._iter_sequential(realm, resource, params,
+                                             first=offsets[-1] + self.page_size)
+
+    def _iter_sequential(self, realm: str, resource: str, params: Optional[Dict] = None,
+                         first: int = 0) -> Iterator[Dict]:
+        while True:
+            entries = self.page(realm, resource, first, params)
+            yield from entries
+            if len(entries) < self.page_size:
+                return
+            first += self.page_size
+
+    def users(self, realm: str, brief: bool = True) -> Iterator[Dict]:
+        """Every user in a realm"""
+        params = {"briefRepresentation": "true"} if brief else None
+        return self.iter_collection(realm, "users", params)
+
+    def clients(self, realm: str) -> Iterator[Dict]:
+        """Every client in a realm"""
+        return self.iter_collection(realm, "clients")
+
+    def groups(self, realm: str) -> Iterator[Dict]:
+        """Every top-level group in a realm, with attributes"""
+        return self.iter_collection(realm, "groups", {"briefRepresentation": "false"})
+
+    def group_members(self, realm: str, group_id: str) -> Iterator[Dict]:
+        """Every member of a group"""
+        return self.iter_collection(realm, f"groups/{group_id}/members",
+                                    {"briefRepresentation": "true"})
+
+    def roles(self, realm: str) -> Iterator[Dict]:
+        """Every realm role"""
+        return self.iter_collection(realm, "roles")
+
+    def role_users(self, realm: str, role: str) -> Iterator[Dict]:
+        """Every user with a realm role mapped directly"""
+        return self.iter_collection(realm, f"roles/{role}/users")
+
+    def client_secret(self, realm: str, client_uuid: str) -> Optional[str]:
+        """Secret of a confidential client, by its internal id"""
+        response = self.session.get(self.realm_url(realm, f"clients/{client_uuid}/client-secret"),
+                                    timeout=self.timeout)
+        if response.status_code != 200:
+            return None
+        return response.json().get("value")
+
+
+class RealmIndex:
+    """In-process index of a realm's clients and users"""
+
+    def __init__(self, admin: KeycloakAdmin, realm: str):
+        self.admin = admin
+        self.realm = realm
+        self._clients: Optional[List[Dict]] = None
+        self._users: Optional[List[Dict]] = None
+        self._secrets: Dict[str, Optional[str]] = {}
+        self.clients_by_id: Dict[str, Dict] = {}
+        self.clients_by_client_id: Dict[str, Dict] = {}
+        self.users_by_id: Dict[str, Dict] = {}
+        self.users_by_username: Dict[str, Dict] = {}
+        self.users_by_email: Dict[str, Dict] = {}
+
+    def clients(self, refresh: bool = False) -> List[Dict]:
+        """All clients, listed once"""
+        if self._clients is None or refresh:
+            self._clients = list(self.admin.clients(self.realm))
+            self.clients_by_id = {c["id"]: c for c in self._clients}
+            self.clients_by_client_id = {c["clientId"]: c for c in self._clients}
+            self._secrets = {}
+        return self._clients
+
+    def users(self, refresh: bool = False) -> List[Dict]:
+        """All users, listed once"""
+        if self._users is None or refresh:
+            self._users = list(self.admin.users(self.realm))
+            self.users_by_id = {u["id"]: u for u in self._users}
+            self.users_by_username = {u["username"]: u for u in self._users if u.get("username")}
+            self.users_by_email = {u["email"].lower(): u for u in self._users if u.get("email")}
+        return self._users
+
+    def client(self, client_id: str) -> Optional[Dict]:
+        """Client by its clientId"""
+        self.clients()
+        return self.clients_by_client_id.get(client_id)
+
+    def user(self, username: str) -> Optional[Dict]:
+        """User by username"""
+        self.users()
+        return self.users_by_username.get(username)
+
+    def client_secret(self, client_id: str) -> Optional[str]:
+        """Client secret by clientId, fetched once"""
+        if client_id not in self._secrets:
+            client = self.client(client_id)
+            self._secrets[client_id] = (self.admin.client_secret(self.realm, client["id"])
+                                        if client else None)
+        return self._secrets[client_id]
+
+    def invalidate(self):
+        """Forget everything, e.g. after the realm was changed"""
+        self._clients = None
+        self._users = None
+        self._secrets = {}
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Model Catalog
+=============
+
+A gateway_proxy layer that answers `GET /v1/models` with one merged,
+OpenAI-style list of every provider's models, so model pickers don't have
+to know which gateway route lists models where (only some routes map
+`/v1/models`):
+
+- Providers come from agentgateway.yaml (provisioning_compiler). Each
+  provider's `/<route>/v1/models` is fetched through the gateway
+  concurrently. OpenAI, Anthropic and Gemini listings are normalized to
+  `{"id", "object": "model", "created", "owned_by", "name", "route"}`.
+  Non-chat models are filtered out as in model_discovery.
+- Listings are cached per provider and served stale-while-revalidate.
+  Within `ttl` an entry is served as is. After that it is still served
+  immediately, while one background refresh per provider fetches a new
+  copy. A failed refresh keeps the last good listing and is retried after
+  `retry_after` seconds.
+- Only the first fetch of a provider is waited for, and at most
+  `first_wait` seconds. Past that deadline, or if the route has no models
+  endpoint, its configured default model stands in for it, so one slow
+  provider never blocks the list.
+- The last good listings are shared with model_discovery's on-disk catalog,
+  so a restarted proxy starts warm.
+- `POST /v1/chat/completions` without a route prefix is sent to the route
+  that lists the requested model. Open WebUI can then use the proxy as a
+  single OpenAI connection (`http://gateway-proxy:3010/v1`).
+
+Responses carry `X-Model-Catalog: fresh`, `stale` or `partial` (some
+provider has never listed and is represented by its configured models).
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from gateway_proxy import Handler, ProxyRequest, ProxyResponse, json_response, metric
+from http_client import create_client
+from model_discovery import NON_CHAT_MARKERS, load_cache, probe_url, save_cache
+
+DEFAULT_TTL = 300.0
+# How long the first request waits for a provider that has never answered
+FIRST_WAIT = 2.0
+# Delay before retrying a provider whose refresh failed
+RETRY_AFTER = 30.0
+FETCH_TIMEOUT = 5.0
+
+LIST_PATHS = ("/v1/models", "/models")
+ROUTED_PATHS = ("/v1/chat/completions", "/v1/completions")
+
+
+def iso_timestamp(value) -> int:
+    """Unix seconds from an epoch number or an ISO 8601 string (Anthropic)"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+        except ValueError:
+            pass
+    return 0
+
+
+def normalize_models(body: Dict, provider: str, route: str) -> List[Dict]:
+    """OpenAI-style model entries from an OpenAI, Anthropic or Gemini listing
+
+    Raises ValueError for anything that isn't such a listing.
+    """
+    if not isinstance(body, dict):
+        raise ValueError(f"model listing is a JSON {type(body).__name__}, not an object")
+    listed = body.get("data", []), body.get("models", [])
+    if not all(isinstance(items, list) and all(isinstance(entry, dict) for entry in items)
+               for items in listed):
+        raise ValueError("model listing entries are not objects")
+    entries = []
+    for entry in listed[0]:
+        if entry.get("id"):
+            entries.append({"id": entry["id"], "name": entry.get("display_name") or entry.get("name"),
+                            "created": iso_timestamp(entry.get("created") or entry.get("created_at"))})
+    for entry in listed[1]:
+        if entry.get("name"):
+            entries.append({"id": entry["name"].split("/", 1)[-1], "name": entry.get("displayName"),
+                            "created": 0})
+    return [model_entry(entry["id"], provider, route, entry["name"], entry["created"])
+            for entry in entries
+            if not any(marker in entry["id"].lower() for marker in NON_CHAT_MARKERS)]
+
+
+def model_entry(model_id: str, provider: str, route: str, name: Optional[str] = None,
+                created: int = 0) -> Dict:
+    return {"id": model_id, "object": "model", "created": created, "owned_by": provider,
+            "name": name or model_id, "route": route}
+
+
+class ProviderListing:
+    """The last listing fetched for one provider"""
+
+    def __init__(self, models: List[Dict], fetched_at: float, listed: bool = True):
+        self.models = models
+        self.fetched_at = fetched_at
+        # False for the configured-models stand-in of a provider that never listed
+        self.listed = listed
+        self.retry_at = 0.0
+        self.error: Optional[str] = None
+
+
+class ModelCatalog:
+    """Proxy layer serving a merged, cached /v1/models"""
+
+    def __init__(self, connections: List[Dict], ttl: float = DEFAULT_TTL,
+                 first_wait: float = FIRST_WAIT, retry_after: float = RETRY_AFTER,
+                 timeout: float = FETCH_TIMEOUT, client: Optional[requests.Session] = None,
+                 use_disk: bool = True, clock=time.time):
+        self.providers = []
+        for conn in connections:
+            route = urlsplit(conn["url"]).path.rsplit("/v1", 1)[0]
+            self.providers.append((probe_url(conn), route.strip("/"), route, conn))
+        self.ttl = ttl
+        self.first_wait = first_wait
+        self.retry_after = retry_after
+        self.timeout = timeout
+        # One connect retry: stale data is served while a slow provider catches up
+        self.client = client or create_client(retries=1, retry_statuses=())
+        self.use_disk = use_disk
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.providers)))
+        self.listings: Dict[str, ProviderListing] = {}
+        self.refreshing: Dict[str, object] = {}
+        self.counts = {"fresh": 0, "stale": 0, "partial": 0}
+        self.refreshes: Dict[Tuple[str, str], int] = {}
+        if use_disk:
+            self.load_disk()
+
+    def load_disk(self):
+        """Seed listings from model_discovery's catalog (ids only, treated as stale)"""
+        catalog = load_cache()
+        for url, provider, route, _ in self.providers:
+            cached = catalog.get(url)
+            if cached and cached.get("models"):
+                self.listings[url] = ProviderListing(
+                    [model_entry(model_id, provider, route) for model_id in cached["models"]],
+                    min(cached.get("fetched_at", 0), self.clock() - self.ttl))
+
+    def fetch(self, url: str, provider: str, route: str, conn: Dict) -> List[Dict]:
+        response = self.client.get(url, headers={"Authorization": f"Bearer {conn['api_key']}"},
+                                   timeout=(min(self.timeout, 2.0), self.timeout))
+        response.raise_for_status()
+        models = normalize_models(response.json(), provider, route)
+        if not models:
+            raise ValueError("empty model listing")
+        return models
+
+    def refresh(self, url: str, provider: str, route: str, conn: Dict):
+        """Fetch one provider's listing, keeping the old one on failure"""
+        models, error = None, "refresh raised"
+        try:
+            models = self.fetch(url, provider, route, conn)
+            error = None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            error = str(e)
+        finally:
+            # Whatever happened, the refresh is over and the provider can be fetched again
+            self.settle(url, provider, route, conn, models, error)
+        if models is not None and self.use_disk:
+            catalog = load_cache()
+            catalog[url] = {"fetched_at": self.clock(), "models": [model["id"] for model in models]}
+            save_cache(catalog)
+
+    def settle(self, url: str, provider: str, route: str, conn: Dict,
+               models: Optional[List[Dict]], error: Optional[str]):
+        """Record the outcome of a refresh"""
+        now = self.clock()
+        with self._lock:
+            self.refreshing.pop(url, None)
+            result = "error" if error else "ok"
+            self.refreshes[(provider, result)] = self.refreshes.get((provider, result), 0) + 1
+            if models is not None:
+                self.listings[url] = ProviderListing(models, now)
+            else:
+                if url not in self.listings:
+                    # Never listed: the configured models stand in until a retry succeeds
+                    self.listings[url] = ProviderListing(
+                        [model_entry(model_id, provider, route) for model_id in conn["models"]], 0.0,
+                        listed=False)
+                self.listings[url].retry_at = now + self.retry_after
+                self.listings[url].error = error
+
+    def schedule(self, url: str, provider: str, route: str, conn: Dict):
+        """Start a refresh unless one is already running (call with the lock held)
+
+        Returns the new refresh, or None if one was already running.
+        """
+        if url in self.refreshing:
+            return None
+        self.refreshing[url] = self._pool.submit(self.refresh, url, provider, route, conn)
+        return self.refreshing[url]
+
+    def listing(self) -> Tuple[List[Dict], str]:
+        """The merged model list and how current it is"""
+        now = self.clock()
+        missing = []
+        stale = False
+        with self._lock:
+            for url, provider, route, conn in self.providers:
+                entry = self.listings.get(url)
+                if entry is None:
+                    # Only the request that starts the first fetch waits for it
+                    started = self.schedule(url, provider, route, conn)
+                    if started is not None:
+                        missing.append(started)
+                elif now - entry.fetched_at >= self.ttl:
+                    # A provider that never listed makes the answer partial, not stale
+                    stale = stale or entry.listed
+                    if now >= entry.retry_at:
+                        self.schedule(url, provider, route, conn)
+        if missing:
+            wait(missing, timeout=self.first_wait)
+
+        models, seen, partial = [], set(), False
+        with self._lock:
+            for url, provider, route, conn in self.providers:
+                entry = self.listings.get(url)
+                if entry is None:
+                    # Never answered yet: the configured models stand in
+                    partial = True
+                    entries = [model_entry(model_id, provider, route) for model_id in conn["models"]]
+                else:
+                    partial = partial or not entry.listed
+                    entries = entry.models
+                for model in entries:
+                    # First provider wins a duplicate id; others stay reachable via their route
+                    if model["id"] not in seen:
+                        seen.add(model["id"])
+                        models.append(model)
+            state = "partial" if partial else "stale" if stale else "fresh"
+            self.counts[state] += 1
+        return models, state
+
+    def route_for(self, model_id: str) -> Optional[str]:
+        """Route of the first provider listing a model (configured models if none listed yet)"""
+        with self._lock:
+            for url, _, route, conn in self.providers:
+                entry = self.listings.get(url)
+                listed = [model["id"] for model in entry.models] if entry else conn["models"]
+                if model_id in listed:
+                    return route
+        return None
+
+    def __call__(self, request: ProxyRequest, call_next: Handler) -> ProxyResponse:
+        path = request.path.split("?")[0]
+        if request.method == "GET" and path in LIST_PATHS:
+            models, state = self.listing()
+            return json_response(200, {"object": "list", "data": models},
+                                 [("X-Model-Catalog", state)])
+        if request.method == "POST" and path in ROUTED_PATHS and request.json is not None:
+            model_id = request.json.get("model")
+            route = self.route_for(model_id)
+            if route is None:
+                return json_response(404, {"error": {
+                    "message": f"The model `{model_id}` does not exist on any gateway route",
+                    "type": "invalid_request_error", "code": "model_not_found"}})
+            request.path = route + request.path
+        return call_next(request)
+
+    def metrics(self) -> List[str]:
+        now = self.clock()
+        with self._lock:
+            counts, refreshes = dict(self.counts), dict(self.refreshes)
+            listings = {provider: self.listings.get(url) for url, provider, _, _ in self.providers}
+        lines = metric("agw_model_catalog_requests_total", "counter",
+                       "Merged /v1/models responses by freshness",
+                       [({"state": state}, value) for state, value in counts.items()])
+        lines += metric("agw_model_catalog_refresh_total", "counter",
+                        "Provider listing fetches by result",
+                        [({"provider": provider, "result": result}, value)
+                         for (provider, result), value in sorted(refreshes.items())])
+        lines += metric("agw_model_catalog_models", "gauge", "Models listed per provider",
+                        [({"provider": provider}, len(entry.models))
+                         for provider, entry in listings.items() if entry])
+        lines += metric("agw_model_catalog_age_seconds", "gauge", "Age of each provider's listing",
+                        [({"provider": provider}, round(now - entry.fetched_at, 1))
+                         for provider, entry in listings.items() if entry and entry.listed])
+        return lines
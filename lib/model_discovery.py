@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Model Discovery
+===============
+
+Discovers the models each provider serves by calling its `/v1/models` route
+through AgentGateway, all providers at once.
+
+- Every provider gets its own timeout; a slow or failing provider falls back
+  to the models compiled from agentgateway.yaml instead of failing the run.
+- Successful results are cached on disk per provider with a TTL, so warm
+  runs make no HTTP calls at all.
+- The output is a connection list that goes straight into
+  openwebui_provisioning, which registers every model in one transaction.
+
+Point `gateway_url` at any OpenAI-compatible server (e.g. a local mock) to
+exercise discovery without real provider keys.
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from http_client import create_client
+from provisioning_compiler import CACHE_DIR
+from tracing import in_current_context, span
+
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_TTL = 3600
+
+# One connect retry, then fall back; a slow provider must not hold up the run
+_client = create_client(retries=1, retry_statuses=())
+
+# Model ids containing these are not chat models and are left out
+NON_CHAT_MARKERS = (
+    "embedding", "tts", "whisper", "dall-e", "moderation", "transcribe",
+    "realtime", "audio", "image", "search"
+)
+
+
+def probe_url(connection: Dict, gateway_url: Optional[str] = None) -> str:
+    """Return the models URL for a connection, optionally via another gateway"""
+    base = connection["url"].rstrip("/")
+    if gateway_url:
+        base = gateway_url.rstrip("/") + urlsplit(base).path
+    return f"{base}/models"
+
+
+def parse_model_ids(body: Dict) -> List[str]:
+    """Extract model ids from an OpenAI, Anthropic or Gemini model listing
+
+    Raises ValueError for anything that isn't such a listing, so the probe
+    counts as failed.
+    """
+    if not isinstance(body, dict):
+        raise ValueError(f"model listing is a JSON {type(body).__name__}, not an object")
+    listed = body.get("data", []), body.get("models", [])
+    if not all(isinstance(items, list) and all(isinstance(entry, dict) for entry in items)
+               for items in listed):
+        raise ValueError("model listing entries are not objects")
+    ids = []
+    for entry in listed[0]:
+        if entry.get("id") and isinstance(entry["id"], str):
+            ids.append(entry["id"])
+    for entry in listed[1]:
+        name = entry.get("name", "")
+        if name and isinstance(name, str):
+            ids.append(name.split("/", 1)[-1])
+    return [model_id for model_id in ids
+            if not any(marker in model_id.lower() for marker in NON_CHAT_MARKERS)]
+
+
+def fetch_models(url: str, api_key: str, timeout: float) -> List[str]:
+    """Fetch one provider's model listing"""
+    response = _client.get(
+        url,
+        headers={"Authorization": f"Bearer {api_key}"},
+        timeout=(min(timeout, 2.0), timeout)
+    )
+    response.raise_for_status()
+    model_ids = parse_model_ids(response.json())
+    if not model_ids:
+        raise ValueError("empty model listing")
+    return model_ids
+
+
+def load_cache() -> Dict:
+    """Load the on-disk model catalog"""
+    try:
+        with open(os.path.join(CACHE_DIR, "model-catalog.json"), "r") as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return catalog if isinstance(catalog, dict) else {}
+
+
+def save_cache(catalog: Dict):
+    """Atomically write the on-disk model catalog"""
+    cache_path = os.path.join(CACHE_DIR, "model-catalog.json")
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(catalog, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def discover(connections: List[Dict], gateway_url: Optional[str] = None,
+             timeout: float = DEFAULT_TIMEOUT, ttl: int = DEFAULT_TTL,
+             use_cache: bool = True) -> Tuple[List[Dict], List[Dict]]:
+    """Discover models for every connection concurrently
+
+    Returns the connections with their discovered models, and one report
+    entry per connection describing where its models came from.
+    """
+    catalog = load_cache() if use_cache else {}
+    now = time.time()
+    reports = [None] * len(connections)
+    pending = []
+
+    for index, conn in enumerate(connections):
+        url = probe_url(conn, gateway_url)
+        cached = catalog.get(url)
+        # Entries from older or hand-edited caches without these fields are misses
+        fetched_at = cached.get("fetched_at") if isinstance(cached, dict) else None
+        if (isinstance(fetched_at, (int, float)) and isinstance(cached.get("models"), list)
+                and now - fetched_at < ttl):
+            reports[index] = {"url": url, "source": "cache", "models": cached["models"],
+                              "elapsed_ms": 0.0}
+        else:
+            pending.append((index, url, conn))
+
+    def probe(url: str, conn: Dict) -> Dict:
+        start = time.perf_counter()
+        try:
+            models = fetch_models(url, conn["api_key"], timeout)
+            report = {"url": url, "source": "discovered", "models": models}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            report = {"url": url, "source": "fallback", "models": list(conn["models"]),
+                      "error": str(e)}
+        report["elapsed_ms"] = (time.perf_counter() - start) * 1000
+        return report
+
+    if pending:
+        with span("models.discover", **{"discover.pending": len(pending),
+                                        "discover.cached": len(connections) - len(pending)}), \
+                ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            futures = [(index, pool.submit(in_current_context(probe), url, conn))
+                       for index, url, conn in pending]
+            for index, future in futures:
+                reports[index] = future.result()
+                if reports[index]["source"] == "discovered":
+                    catalog[reports[index]["url"]] = {
+                        "fetched_at": now,
+                        "models": reports[index]["models"]
+                    }
+        if use_cache:
+            save_cache(catalog)
+
+    discovered = []
+    for conn, report in zip(connections, reports):
+        # Keep the gateway's default model first so it stays the preselected one
+        models = list(conn["models"])
+        models += [model_id for model_id in report["models"] if model_id not in models]
+        discovered.append({**conn, "models": models})
+
+    return discovered, reports
+
+
+def print_report(reports: List[Dict]):
+    """Print where each connection's models came from"""
+    icons = {"discovered": "✓", "cache": "ℹ", "fallback": "⚠"}
+    for report in reports:
+        print(f"  {icons[report['source']]} {report['url']}: {len(report['models'])} models "
+              f"({report['source']}, {report['elapsed_ms']:.0f}ms)")
+        if report.get("error"):
+            print(f"      {report['error']}")
+
+
+def main():
+    """Print the discovered catalog for the gateway config"""
+    from provisioning_compiler import compile_file
+
+    gateway_url = sys.argv[1] if len(sys.argv) > 1 else None
+    connections, reports = discover(compile_file(), gateway_url=gateway_url)
+    print_report(reports)
+    print(json.dumps(connections, indent=2))
+
+
+if __name__ == "__main__":
+    main()
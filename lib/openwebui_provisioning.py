@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""
+Open WebUI Provisioning
+=======================
+
+Writes AgentGateway connections and models into the Open WebUI database.
+
+The config row and every model row are written in a single transaction:
+models go in with one executemany() using INSERT ... ON CONFLICT DO UPDATE,
+so re-runs update existing rows instead of skipping them.
+
+A canonical hash of the desired connections and models is stored next to
+the config row. When it matches, nothing is written and callers can skip
+restarting Open WebUI; otherwise the exact changes are reported.
+
+This module only uses the standard library and doubles as a provisioning
+bundle: callers build a JSON plan (connections, models, users) and run it in
+one process, either locally when the database is mounted, or inside the
+open-webui container with a single `docker exec -i ... python3 -c LOADER`,
+which reads this module's source and the plan from stdin, so nothing has
+to be mounted or copied first. The structured JSON result includes per-phase
+timings. When the caller has enabled tracing (see tracing.py), phases,
+API calls and every docker step are also recorded as spans.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    from tracing import KIND_CLIENT, span
+except ImportError:
+    # Run inside the container on its own: no tracing there
+    KIND_CLIENT = 3
+
+    @contextmanager
+    def span(name, kind=1, new_trace=False, **attributes):
+        yield None
+
+DEFAULT_DB_PATH = "/app/backend/data/webui.db"
+CONTAINER_NAME = "open-webui"
+IN_CONTAINER_URL = "http://localhost:8080"
+# docker-compose mounts lib/ here in the open-webui container
+BUNDLE_MOUNT = "/opt/agentgateway/lib"
+
+# Run in the container: stdin is this module's source, a NUL byte, then the plan
+LOADER = (
+    "import sys\n"
+    "source, plan = sys.stdin.read().split('\\0', 1)\n"
+    "bundle = {'__name__': 'openwebui_provisioning'}\n"
+    "exec(compile(source, 'openwebui_provisioning.py', 'exec'), bundle)\n"
+    "sys.exit(bundle['run_json'](plan))\n"
+)
+
+# Empty group/user lists make a model visible to every user
+PUBLIC_ACCESS_CONTROL = {
+    "read": {"group_ids": [], "user_ids": []},
+    "write": {"group_ids": [], "user_ids": []}
+}
+
+MODEL_UPSERT_SQL = """
+INSERT INTO model (id, user_id, base_model_id, name, meta, params,
+                   created_at, updated_at, is_active, access_control)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    base_model_id = excluded.base_model_id,
+    name = excluded.name,
+    meta = excluded.meta,
+    params = excluded.params,
+    updated_at = excluded.updated_at,
+    is_active = excluded.is_active,
+    access_control = excluded.access_control
+"""
+
+STATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS agentgateway_provisioning (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    hash TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+)
+"""
+
+STATE_UPSERT_SQL = """
+INSERT INTO agentgateway_provisioning (id, hash, state, updated_at)
+VALUES (1, ?, ?, datetime('now'))
+ON CONFLICT(id) DO UPDATE SET
+    hash = excluded.hash,
+    state = excluded.state,
+    updated_at = excluded.updated_at
+"""
+
+CONFIG_UPSERT_SQL = """
+INSERT INTO config (id, data, version, created_at, updated_at)
+VALUES (?, ?, 0, datetime('now'), datetime('now'))
+ON CONFLICT(id) DO UPDATE SET
+    data = excluded.data,
+    updated_at = excluded.updated_at
+"""
+
+
+def apply_connections(data: Dict, connections: List[Dict]) -> Dict:
+    """Merge the connection settings into an Open WebUI config dict"""
+    base_urls = [conn["url"] for conn in connections]
+    api_keys = [conn["api_key"] for conn in connections]
+
+    data["ENABLE_OPENAI_API"] = True
+    data["OPENAI_API_BASE_URLS"] = base_urls
+    data["OPENAI_API_KEYS"] = api_keys
+
+    openai = data.setdefault("openai", {})
+    openai["enable"] = True
+    openai["api_base_urls"] = base_urls
+    openai["api_keys"] = api_keys
+
+    # api_configs with model_ids is what makes the models show up
+    openai["api_configs"] = {
+        str(index): {
+            "enable": True,
+            "tags": [],
+            "prefix_id": "",
+            "model_ids": list(conn["models"]),
+            "connection_type": "external",
+            "auth_type": "bearer"
+        }
+        for index, conn in enumerate(connections)
+    }
+
+    # Disable automatic model fetching to avoid errors
+    data["ENABLE_MODEL_FILTER"] = False
+    return data
+
+
+def build_model_rows(connections: List[Dict], timestamp: int) -> List[tuple]:
+    """Build one model table row per model of every connection"""
+    rows = []
+    access_control = json.dumps(PUBLIC_ACCESS_CONTROL)
+
+    for conn in connections:
+        for model_id in conn["models"]:
+            name = f"{conn['name']} - {model_id}"
+            meta = json.dumps({
+                "profile_image_url": "/static/favicon.png",
+                "description": f"{name} via AgentGateway",
+                "capabilities": {},
+                "position": len(rows)
+            })
+            params = json.dumps({
+                "api_base_url": conn["url"],
+                "api_key": conn["api_key"],
+                "stream": True
+            })
+            # Empty user_id makes the model system-wide
+            rows.append((model_id, "", model_id, name, meta, params,
+                         timestamp, timestamp, 1, access_control))
+
+    return rows
+
+
+def desired_state(connections: List[Dict]) -> Dict:
+    """Canonical description of what provisioning should produce"""
+    state = {"connections": {}, "models": {}}
+
+    for conn in connections:
+        state["connections"][conn["url"]] = {
+            "name": conn["name"],
+            "api_key": conn["api_key"],
+            "models": list(conn["models"])
+        }
+        for model_id in conn["models"]:
+            state["models"][model_id] = {
+                "name": f"{conn['name']} - {model_id}",
+                "api_base_url": conn["url"],
+                "api_key": conn["api_key"]
+            }
+
+    state["order"] = [conn["url"] for conn in connections]
+    return state
+
+
+def state_hash(state: Dict) -> str:
+    """SHA-256 over the canonical JSON encoding of a desired state"""
+    encoded = json.dumps(state, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def diff_states(old: Optional[Dict], new: Dict) -> List[str]:
+    """Describe every difference between two desired states"""
+    if old is None:
+        return ["initial provisioning"]
+
+    changes = []
+    for kind in ("connections", "models"):
+        before, after = old.get(kind, {}), new[kind]
+        label = kind[:-1]
+        for key in sorted(after.keys() - before.keys()):
+            changes.append(f"{label} added: {key}")
+        for key in sorted(before.keys() - after.keys()):
+            changes.append(f"{label} removed: {key}")
+        for key in sorted(after.keys() & before.keys()):
+            fields = sorted(f for f in after[key] if before[key].get(f) != after[key][f])
+            if fields:
+                changes.append(f"{label} changed: {key} ({', '.join(fields)})")
+
+    if not changes and old.get("order") != new["order"]:
+        changes.append("connection order changed")
+    return changes
+
+
+def load_state(cursor: sqlite3.Cursor):
+    """Return the stored (hash, state) pair, or (None, None)"""
+    cursor.execute(STATE_TABLE_SQL)
+    cursor.execute("SELECT hash, state FROM agentgateway_provisioning WHERE id = 1")
+    row = cursor.fetchone()
+    return (row[0], json.loads(row[1])) if row else (None, None)
+
+
+@contextmanager
+def timed(timings: Dict, name: str):
+    """Record how long a phase took, in milliseconds"""
+    start = time.perf_counter()
+    try:
+        with span(f"provision.{name}"):
+            yield
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def provision(db_path: str, connections: List[Dict], force: bool = False,
+              timings: Optional[Dict] = None) -> Dict:
+    """Write the config row and all model rows in one transaction"""
+    timings = {} if timings is None else timings
+    state = desired_state(connections)
+    digest = state_hash(state)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    cursor = conn.cursor()
+
+    try:
+        with timed(timings, "state_check"):
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='config'")
+            if not cursor.fetchone():
+                raise RuntimeError("Config table does not exist")
+
+            stored_hash, stored_state = load_state(cursor)
+        if stored_hash == digest and not force:
+            return {"changed": False, "hash": digest, "changes": [],
+                    "inserted": [], "updated": [], "deactivated": []}
+
+        with timed(timings, "config"):
+            # Take the write lock up front so the config read-modify-write is atomic
+            cursor.execute("BEGIN IMMEDIATE")
+
+            cursor.execute("SELECT id, data FROM config ORDER BY id LIMIT 1")
+            result = cursor.fetchone()
+            config_id, data = (result[0], json.loads(result[1])) if result else (1, {})
+            apply_connections(data, connections)
+            cursor.execute(CONFIG_UPSERT_SQL, (config_id, json.dumps(data)))
+
+        with timed(timings, "models"):
+            rows = build_model_rows(connections, int(time.time()))
+            model_ids = [row[0] for row in rows]
+            existing = set()
+            if model_ids:
+                placeholders = ",".join("?" * len(model_ids))
+                cursor.execute(f"SELECT id FROM model WHERE id IN ({placeholders})", model_ids)
+                existing = {row[0] for row in cursor.fetchall()}
+            cursor.executemany(MODEL_UPSERT_SQL, rows)
+
+            # Models we provisioned earlier but no longer want are hidden, not deleted
+            deactivated = sorted(set((stored_state or {}).get("models", {})) - set(model_ids))
+            cursor.executemany(
+                "UPDATE model SET is_active = 0, updated_at = ? WHERE id = ?",
+                [(int(time.time()), model_id) for model_id in deactivated]
+            )
+
+        with timed(timings, "commit"):
+            cursor.execute(STATE_UPSERT_SQL, (digest, json.dumps(state, sort_keys=True)))
+            cursor.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    return {
+        "changed": True,
+        "hash": digest,
+        "changes": diff_states(stored_state, state),
+        "inserted": [model_id for model_id in model_ids if model_id not in existing],
+        "updated": [model_id for model_id in model_ids if model_id in existing],
+        "deactivated": deactivated
+    }
+
+
+def api_post(url: str, body: Dict, token: Optional[str] = None, timeout: float = 10) -> Dict:
+    """POST JSON to the Open WebUI API"""
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"),
+                                     headers=headers, method="POST")
+    with span(f"HTTP POST {urllib.parse.urlsplit(url).path}", KIND_CLIENT,
+              **{"http.request.method": "POST", "url.full": url}) as record:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            if record is not None:
+                record.set("http.response.status_code", response.status)
+            return json.loads(response.read() or b"{}")
+
+
+def provision_users(db_path: str, webui_url: str, admin: Dict, users: List[Dict],
+                    timeout: float = 10) -> Dict:
+    """Create missing users through the admin API"""
+    result = {"created": [], "exists": [], "failed": []}
+
+    # One query tells us which users already exist
+    conn = sqlite3.connect(db_path)
+    try:
+        existing = {row[0].lower() for row in conn.execute("SELECT email FROM user")}
+    finally:
+        conn.close()
+
+    pending = []
+    for user in users:
+        if user["email"].lower() in existing:
+            result["exists"].append(user["email"])
+        else:
+            pending.append(user)
+    if not pending:
+        return result
+
+    try:
+        token = api_post(f"{webui_url}/api/v1/auths/signin",
+                         {"email": admin["email"], "password": admin["password"]},
+                         timeout=timeout)["token"]
+    except (urllib.error.URLError, KeyError, ValueError) as e:
+        result["failed"] = [{"email": user["email"], "error": f"admin sign in failed: {e}"}
+                            for user in pending]
+        return result
+
+    for user in pending:
+        try:
+            api_post(f"{webui_url}/api/v1/auths/add", {
+                "name": user["name"],
+                "email": user["email"],
+                "password": user["password"],
+                "role": user.get("role", "user")
+            }, token=token, timeout=timeout)
+            result["created"].append(user["email"])
+        except (urllib.error.URLError, ValueError) as e:
+            result["failed"].append({"email": user["email"], "error": str(e)})
+
+    return result
+
+
+def build_plan(connections: List[Dict], force: bool = False,
+               users: Optional[List[Dict]] = None, admin: Optional[Dict] = None,
+               db_path: str = DEFAULT_DB_PATH, webui_url: str = IN_CONTAINER_URL) -> Dict:
+    """Build the JSON plan the bundle executes"""
+    return {
+        "db_path": db_path,
+        "webui_url": webui_url,
+        "force": force,
+        "connections": connections,
+        "users": users or [],
+        "admin": admin
+    }
+
+
+def run_plan(plan: Dict) -> Dict:
+    """Run every step of a plan in this process"""
+    timings = {}
+
+    with timed(timings, "total"):
+        result = provision(plan.get("db_path", DEFAULT_DB_PATH), plan["connections"],
+                           force=plan.get("force", False), timings=timings)
+
+        if plan.get("users"):
+            if not plan.get("admin"):
+                raise ValueError("plan has users but no admin credentials")
+            with timed(timings, "users"):
+                result["users"] = provision_users(
+                    plan.get("db_path", DEFAULT_DB_PATH),
+                    plan.get("webui_url", IN_CONTAINER_URL),
+                    plan["admin"],
+                    plan["users"]
+                )
+
+    result["timings_ms"] = timings
+    return result
+
+
+def run_in_container(plan: Dict, container: str = CONTAINER_NAME, timeout: int = 60) -> Dict:
+    """Run a plan in the Open WebUI container with a single docker exec"""
+    with open(__file__, "r", encoding="utf-8") as f:
+        source = f.read()
+    with span("docker exec", **{"container.name": container, "bundle.bytes": len(source)}) as record:
+        completed = subprocess.run(
+            ["docker", "exec", "-i", container, "python3", "-c", LOADER],
+            input=source + "\0" + json.dumps(plan),
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+        if record is not None:
+            record.set("process.exit_code", completed.returncode)
+            if completed.returncode != 0:
+                record.fail(completed.stderr.strip()[-500:])
+
+    try:
+        result = json.loads(completed.stdout)
+    except ValueError:
+        result = {"error": completed.stderr.strip() or completed.stdout.strip()}
+
+    if completed.returncode != 0 and "error" not in result:
+        result["error"] = completed.stderr.strip()
+    return result
+
+
+def _execute(plan: Dict, container: str, local: bool) -> Dict:
+    if local:
+        try:
+            return run_plan(plan)
+        except Exception as e:
+            return {"error": str(e)}
+    try:
+        return run_in_container(plan, container)
+    except (OSError, subprocess.SubprocessError) as e:
+        return {"error": str(e)}
+
+
+def execute(plan: Dict, container: str = CONTAINER_NAME) -> Dict:
+    """Run a plan locally when the database is mounted here, else in the container"""
+    local = os.path.exists(plan.get("db_path", DEFAULT_DB_PATH))
+    with span("openwebui.provision", **{"provision.mode": "local" if local else "docker",
+                                        "provision.force": bool(plan.get("force"))}) as record:
+        result = _execute(plan, container, local)
+        if record is not None:
+            if "error" in result:
+                record.fail(result["error"])
+            else:
+                record.set("provision.changed", result.get("changed"))
+                for phase, ms in result.get("timings_ms", {}).items():
+                    record.set(f"provision.{phase}_ms", ms)
+    return result
+
+
+def print_result(result: Dict):
+    """Print a provisioning result in the scripts' usual format"""
+    if "error" in result:
+        print(f"✗ Provisioning failed: {result['error']}")
+        return
+
+    if not result["changed"]:
+        print(f"✓ Open WebUI already matches the desired state ({result['hash'][:12]})")
+    else:
+        print(f"✓ Connection configuration written to database ({result['hash'][:12]})")
+        print()
+        print("Changes:")
+        for change in result["changes"]:
+            print(f"  • {change}")
+        print()
+        for model_id in result["inserted"]:
+            print(f"  • Added model: {model_id}")
+        for model_id in result["updated"]:
+            print(f"  • Updated model: {model_id}")
+        for model_id in result["deactivated"]:
+            print(f"  • Deactivated model: {model_id}")
+        print()
+        print(f"✓ {len(result['inserted'])} added, {len(result['updated'])} updated, "
+              f"{len(result['deactivated'])} deactivated")
+
+    users = result.get("users")
+    if users:
+        print(f"✓ Users: {len(users['created'])} created, {len(users['exists'])} already exist, "
+              f"{len(users['failed'])} failed")
+        for failure in users["failed"]:
+            print(f"  ✗ {failure['email']}: {failure['error']}")
+
+    timings = ", ".join(f"{name} {ms:.1f}ms" for name, ms in result.get("timings_ms", {}).items())
+    if timings:
+        print(f"⏱ {timings}")
+
+
+def run_json(plan: str) -> int:
+    """Run a JSON plan, printing the JSON result"""
+    try:
+        result = run_plan(json.loads(plan))
+    except Exception as e:
+        print(json.dumps({"error": str(e)}))
+        return 1
+
+    print(json.dumps(result))
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    """Run a plan given as a file path, or on stdin with `-`"""
+    try:
+        if not argv or argv[0] == "-":
+            plan = sys.stdin.read()
+        else:
+            with open(argv[0], "r") as f:
+                plan = f.read()
+    except OSError as e:
+        print(json.dumps({"error": str(e)}))
+        return 1
+    return run_json(plan)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Provisioning Compiler
+=====================
+
+Compiles the AI routes in agentgateway.yaml into the Open WebUI connection
+list used by openwebui_provisioning, so the gateway config is the single
+source of truth for base URLs, API keys and default models.
+
+Every unified-gateway route with an `ai` backend becomes one connection:
+
+    pathPrefix /anthropic + provider.anthropic.model
+        -> http://agentgateway:3000/anthropic/v1 serving claude-haiku-4-5-...
+
+Compiled output is cached on disk keyed by a hash of its inputs, so repeat
+runs skip parsing the YAML entirely.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+import yaml
+
+from tracing import span
+
+GATEWAY_CONFIG = os.environ.get(
+    "AGENTGATEWAY_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agentgateway.yaml")
+)
+GATEWAY_URL = "http://agentgateway:3000"
+GATEWAY_PORT = 3000
+CACHE_DIR = os.environ.get("AGW_CACHE_DIR", os.path.join(tempfile.gettempdir(), "agentgateway"))
+
+# Display names used in the Open WebUI model selector
+PROVIDER_LABELS = {
+    "anthropic": "Anthropic (Claude)",
+    "openai": "OpenAI (GPT)",
+    "xai": "xAI (Grok)",
+    "gemini": "Gemini"
+}
+
+
+def iter_ai_routes(gateway_config: Dict, port: int = GATEWAY_PORT):
+    """Yield (route, ai backend) pairs of the listener on the given port"""
+    for bind in gateway_config.get("binds", []):
+        if bind.get("port") != port:
+            continue
+        for listener in bind.get("listeners", []):
+            for route in listener.get("routes", []):
+                for backend in route.get("backends", []):
+                    if "ai" in backend:
+                        yield route, backend["ai"]
+
+
+def route_prefix(route: Dict) -> Optional[str]:
+    """Return the pathPrefix a route matches on"""
+    for match in route.get("matches", []):
+        prefix = match.get("path", {}).get("pathPrefix")
+        if prefix:
+            return prefix.rstrip("/")
+    return None
+
+
+def default_model(ai_backend: Dict) -> Optional[str]:
+    """Return the default model configured for an AI backend"""
+    for settings in ai_backend.get("provider", {}).values():
+        if settings and settings.get("model"):
+            return settings["model"]
+    return None
+
+
+def compile_connections(gateway_config: Dict, gateway_url: str = GATEWAY_URL,
+                        port: int = GATEWAY_PORT,
+                        extra_models: Optional[Dict[str, List[str]]] = None) -> List[Dict]:
+    """Build Open WebUI connections from the gateway's AI routes"""
+    extra_models = extra_models or {}
+    connections = []
+
+    for route, ai_backend in iter_ai_routes(gateway_config, port):
+        prefix = route_prefix(route)
+        provider = ai_backend.get("name")
+        if not prefix or not provider:
+            continue
+
+        models = []
+        for model_id in [default_model(ai_backend)] + list(extra_models.get(provider, [])):
+            if model_id and model_id not in models:
+                models.append(model_id)
+
+        connections.append({
+            "name": PROVIDER_LABELS.get(provider, provider.title()),
+            "url": f"{gateway_url.rstrip('/')}{prefix}/v1",
+            # Open WebUI needs a key; the gateway injects the real one
+            "api_key": f"sk-{provider}",
+            "models": models
+        })
+
+    return connections
+
+
+def compile_file(path: str = GATEWAY_CONFIG, gateway_url: str = GATEWAY_URL,
+                 port: int = GATEWAY_PORT,
+                 extra_models: Optional[Dict[str, List[str]]] = None,
+                 use_cache: bool = True) -> List[Dict]:
+    """Compile agentgateway.yaml, reusing the cached output when inputs match"""
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    key = hashlib.sha256(raw + json.dumps(
+        [gateway_url, port, extra_models or {}], sort_keys=True
+    ).encode("utf-8")).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, "openwebui-connections.json")
+
+    if use_cache:
+        try:
+            with open(cache_path, "r") as f:
+                cached = json.load(f)
+            if cached.get("key") == key:
+                return cached["connections"]
+        except (OSError, ValueError):
+            pass
+
+    with span("connections.compile", **{"config.path": path}):
+        connections = compile_connections(yaml.safe_load(raw), gateway_url, port, extra_models)
+
+    if use_cache:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump({"key": key, "connections": connections}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+
+    return connections
+
+
+def main():
+    """Print the compiled connections as JSON"""
+    path = sys.argv[1] if len(sys.argv) > 1 else GATEWAY_CONFIG
+    print(json.dumps(compile_file(path, use_cache=False), indent=2))
+
+
+if __name__ == "__main__":
+    main()
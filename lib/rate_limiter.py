@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Adaptive Rate Limiter
+=====================
+
+Paces requests from many worker threads against a service whose capacity we
+don't know up front (Open WebUI, Keycloak).
+
+The limiter starts at `initial_rate` requests/second and speeds up
+multiplicatively after every success until the first 429 or 5xx. Throttling
+halves the rate, remembers it as the ceiling for fast growth (like TCP slow
+start), and pauses all workers for an exponential, jittered backoff (or the
+server's Retry-After). Above that ceiling the rate only grows additively.
+Concurrent throttle responses within one backoff window count once, so a
+burst of 429s doesn't collapse the rate to the floor.
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+def is_throttle_status(status_code: int) -> bool:
+    """Whether a response means "slow down" rather than "failed" """
+    return status_code == 429 or status_code >= 500
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """Thread-safe request pacing with multiplicative increase and backoff"""
+
+    def __init__(self, initial_rate: float = 20.0, min_rate: float = 1.0,
+                 max_rate: float = 500.0, increase: float = 1.05, step: float = 0.5,
+                 decrease: float = 0.5, base_backoff: float = 0.5, max_backoff: float = 30.0):
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.step = step
+        self.decrease = decrease
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+        self._paused_until = 0.0
+        self._backoffs = 0
+        self._threshold = max_rate
+
+    def acquire(self):
+        """Block until the caller may send its next request"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def on_success(self):
+        """Speed up after a successful request"""
+        with self._lock:
+            if self.rate < self._threshold:
+                self.rate = min(self._threshold, self.rate * self.increase)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.step)
+            if time.monotonic() >= self._paused_until:
+                self._backoffs = 0
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> float:
+        """Back off after a 429/5xx; returns the pause in seconds"""
+        with self._lock:
+            self.throttled += 1
+            now = time.monotonic()
+            if now < self._paused_until:
+                # Already backing off for this burst
+                return self._paused_until - now
+
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._threshold = self.rate
+            self._backoffs += 1
+            if retry_after is None:
+                pause = min(self.max_backoff, self.base_backoff * 2 ** (self._backoffs - 1))
+                pause *= random.uniform(0.5, 1.5)
+            else:
+                pause = min(self.max_backoff, retry_after) + random.uniform(0, self.base_backoff)
+            self._paused_until = now + pause
+            return pause
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Readiness Checks
+================
+
+Waits for stack dependencies (Open WebUI, Keycloak, AgentGateway) to become
+ready as early as possible:
+
+- The first probe goes out immediately and retries start at 100ms, growing
+  exponentially with jitter up to `max_delay`, within a total `deadline`.
+- A dependency is ready when all of its probes pass. Probes run concurrently,
+  and should include an API-level check (a JSON endpoint the init script is
+  about to use) so no fixed "settle" sleep is needed afterwards.
+- Several dependencies can be awaited at once; every report says how long
+  that dependency took to become ready.
+"""
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from http_client import create_client
+from tracing import in_current_context, span
+
+# (url, predicate on the response)
+Probe = Tuple[str, Callable[[requests.Response], bool]]
+
+
+def status_ok(response: requests.Response) -> bool:
+    """Liveness: the endpoint answers 200"""
+    return response.status_code == 200
+
+
+def json_ok(response: requests.Response) -> bool:
+    """API readiness: the endpoint answers 200 with a JSON body"""
+    if response.status_code != 200:
+        return False
+    try:
+        response.json()
+        return True
+    except ValueError:
+        return False
+
+
+def openwebui_probes(base_url: str) -> List[Probe]:
+    """Health endpoint plus the config API the web app loads first"""
+    return [(f"{base_url}/health", status_ok), (f"{base_url}/api/config", json_ok)]
+
+
+def keycloak_probes(base_url: str) -> List[Probe]:
+    """Root page plus the master realm's OIDC discovery document"""
+    return [
+        (f"{base_url}/", status_ok),
+        (f"{base_url}/realms/master/.well-known/openid-configuration", json_ok)
+    ]
+
+
+def run_probe(session: requests.Session, probe: Probe, timeout: float) -> bool:
+    """Run one probe, treating connection errors as "not ready" """
+    url, predicate = probe
+    try:
+        return predicate(session.get(url, timeout=timeout))
+    except requests.exceptions.RequestException:
+        return False
+
+
+def wait_until_ready(name: str, probes: List[Probe], deadline: float = 150.0,
+                     initial_delay: float = 0.1, max_delay: float = 2.0,
+                     timeout: float = 2.0, session: Optional[requests.Session] = None,
+                     verbose: bool = True) -> Dict:
+    """Poll a dependency's probes until they all pass or the deadline expires"""
+    with span(f"ready {name}", **{"ready.deadline_s": deadline}) as record:
+        report = _poll(name, probes, deadline, initial_delay, max_delay, timeout,
+                       session or create_client(pool_size=len(probes), retries=0), verbose)
+        if record is not None:
+            record.set("ready.attempts", report["attempts"])
+            record.set("ready.elapsed_s", round(report["elapsed_s"], 3))
+            if not report["ready"]:
+                record.fail(f"not ready after {report['elapsed_s']:.1f}s")
+        return report
+
+
+def _poll(name: str, probes: List[Probe], deadline: float, initial_delay: float,
+          max_delay: float, timeout: float, session: requests.Session, verbose: bool) -> Dict:
+    start = time.monotonic()
+    attempts = 0
+
+    with ThreadPoolExecutor(max_workers=len(probes)) as pool:
+        while True:
+            attempts += 1
+            remaining = deadline - (time.monotonic() - start)
+            probe_timeout = max(0.1, min(timeout, remaining))
+            check = in_current_context(lambda probe: run_probe(session, probe, probe_timeout))
+            passed = list(pool.map(check, probes))
+
+            elapsed = time.monotonic() - start
+            if all(passed):
+                return {"name": name, "ready": True, "elapsed_s": elapsed, "attempts": attempts}
+
+            delay = min(max_delay, initial_delay * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+            if elapsed + delay >= deadline:
+                return {"name": name, "ready": False, "elapsed_s": elapsed, "attempts": attempts,
+                        "failing": [url for (url, _), ok in zip(probes, passed) if not ok]}
+
+            if verbose and attempts % 5 == 0:
+                print(f"  {name}: not ready after {elapsed:.1f}s ({attempts} attempts)... waiting")
+            time.sleep(delay)
+
+
+def wait_for_all(dependencies: Dict[str, List[Probe]], deadline: float = 150.0,
+                 **kwargs) -> Dict[str, Dict]:
+    """Wait for several dependencies concurrently"""
+    with ThreadPoolExecutor(max_workers=max(1, len(dependencies))) as pool:
+        futures = {
+            name: pool.submit(in_current_context(wait_until_ready), name, probes, deadline, **kwargs)
+            for name, probes in dependencies.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def print_readiness(report: Dict):
+    """Print one readiness report line"""
+    if report["ready"]:
+        print(f"✓ {report['name']} is ready! ({report['elapsed_s']:.2f}s, "
+              f"{report['attempts']} attempts)")
+    else:
+        print(f"✗ Timeout waiting for {report['name']} after {report['elapsed_s']:.1f}s")
+        for url in report.get("failing", []):
+            print(f"  still failing: {url}")
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Realm Reconciler
+================
+
+Brings an existing Keycloak realm in line with realm-config.json instead of
+skipping it once it exists:
+
+1. Read the current realm: settings, roles, groups, clients, users, group
+   memberships and realm role mappings (paged, see keycloak_admin).
+2. Diff it against the desired configuration. Only keys present in the
+   configuration are compared, so server-side defaults never count as drift.
+3. Apply the minimal set of changes:
+   - new roles, groups, clients and users are created in batches through
+     the partial-import API (`ifResourceExists: SKIP`),
+   - changed clients are overwritten in place through partial import,
+   - changed realm settings, roles, groups and users, and missing group
+     memberships and role mappings, are applied with targeted admin calls,
+     concurrently.
+
+A second run against an unchanged configuration finds nothing to do and
+makes no writes. Reconciliation never deletes anything: users, groups and
+clients created outside realm-config.json are left alone, and passwords are
+only set when a user is created, so users keep passwords they changed.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from keycloak_admin import KeycloakAdmin
+from tracing import in_current_context, span
+
+IMPORT_BATCH_SIZE = 500
+WRITE_CONCURRENCY = 8
+
+# Realm config sections that are not plain realm settings
+COLLECTION_KEYS = ("realm", "users", "groups", "clients", "roles", "defaultRoles")
+
+# User fields only applied at creation time
+USER_CREATE_ONLY = ("credentials", "groups", "realmRoles")
+
+
+def drifted(desired: Any, current: Any) -> bool:
+    """Whether `current` differs from `desired` in any key `desired` sets"""
+    if isinstance(desired, dict):
+        if not isinstance(current, dict):
+            return True
+        return any(key not in current or drifted(value, current[key])
+                   for key, value in desired.items())
+    if isinstance(desired, list):
+        if not isinstance(current, list):
+            return True
+        if desired and all(isinstance(item, dict) and "name" in item for item in desired):
+            # Named entries (protocol mappers) are matched by name
+            by_name = {item.get("name"): item for item in current if isinstance(item, dict)}
+            return any(item["name"] not in by_name or drifted(item, by_name[item["name"]])
+                       for item in desired)
+        # Plain lists (redirect URIs, attribute values) are unordered
+        return (sorted(json.dumps(item, sort_keys=True) for item in desired) !=
+                sorted(json.dumps(item, sort_keys=True) for item in current))
+    return desired != current
+
+
+def batches(items: List, size: int) -> List[List]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class RealmReconciler:
+    """Diffs a realm against its configuration and applies the difference"""
+
+    def __init__(self, admin: KeycloakAdmin, config: Dict):
+        self.admin = admin
+        self.config = config
+        self.realm = config["realm"]
+
+    # -- reading --------------------------------------------------------------
+
+    def fetch_state(self) -> Dict:
+        """Current realm state, indexed for diffing"""
+        admin, realm = self.admin, self.realm
+        response = admin.session.get(admin.realm_url(realm), timeout=admin.timeout)
+        response.raise_for_status()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            roles = pool.submit(in_current_context(lambda: list(admin.roles(realm))))
+            groups = pool.submit(in_current_context(lambda: list(admin.groups(realm))))
+            clients = pool.submit(in_current_context(lambda: list(admin.clients(realm))))
+            users = pool.submit(in_current_context(lambda: list(admin.users(realm))))
+            state = {
+                "settings": response.json(),
+                "roles": {role["name"]: role for role in roles.result()},
+                "groups": {group["path"]: group for group in groups.result()},
+                "clients": {client["clientId"]: client for client in clients.result()},
+                "users": {user["username"]: user for user in users.result()}
+            }
+
+        # Memberships are read per group and per role, not per user
+        wanted_groups = {path for user in self.config.get("users", [])
+                         for path in user.get("groups", [])}
+        wanted_roles = {role for user in self.config.get("users", [])
+                        for role in user.get("realmRoles", [])}
+        with ThreadPoolExecutor(max_workers=WRITE_CONCURRENCY) as pool:
+            members = {
+                path: pool.submit(in_current_context(
+                    lambda gid: {u["username"] for u in admin.group_members(realm, gid)}),
+                    state["groups"][path]["id"])
+                for path in wanted_groups if path in state["groups"]
+            }
+            holders = {
+                role: pool.submit(in_current_context(
+                    lambda name: {u["username"] for u in admin.role_users(realm, name)}), role)
+                for role in wanted_roles if role in state["roles"]
+            }
+            state["members"] = {path: future.result() for path, future in members.items()}
+            state["role_users"] = {role: future.result() for role, future in holders.items()}
+        return state
+
+    # -- diffing --------------------------------------------------------------
+
+    def plan(self, state: Dict) -> Dict:
+        """Minimal set of changes that makes the realm match the configuration"""
+        config = self.config
+        settings = {key: value for key, value in config.items() if key not in COLLECTION_KEYS}
+        changed_settings = {key: value for key, value in settings.items()
+                            if drifted(value, state["settings"].get(key))}
+
+        new_roles, changed_roles = [], []
+        for role in config.get("roles", {}).get("realm", []):
+            current = state["roles"].get(role["name"])
+            if current is None:
+                new_roles.append(role)
+            elif drifted(role, current):
+                changed_roles.append(role)
+
+        new_groups, changed_groups = [], []
+        for group in config.get("groups", []):
+            path = group.get("path", f"/{group['name']}")
+            current = state["groups"].get(path)
+            if current is None:
+                new_groups.append(group)
+            elif drifted(group, current):
+                changed_groups.append({**group, "id": current["id"]})
+
+        new_clients, changed_clients = [], []
+        for client in config.get("clients", []):
+            current = state["clients"].get(client["clientId"])
+            if current is None:
+                new_clients.append(client)
+            elif drifted(client, current):
+                changed_clients.append(client)
+
+        new_users, changed_users, memberships, role_mappings = [], [], [], []
+        for user in config.get("users", []):
+            username = user["username"].lower()
+            current = state["users"].get(username)
+            if current is None:
+                new_users.append(user)
+                continue
+            fields = {key: value for key, value in user.items() if key not in USER_CREATE_ONLY}
+            if drifted(fields, current):
+                changed_users.append({**fields, "id": current["id"]})
+            for path in user.get("groups", []):
+                if username not in state["members"].get(path, set()):
+                    memberships.append((current["id"], path))
+            for role in user.get("realmRoles", []):
+                if username not in state["role_users"].get(role, set()):
+                    role_mappings.append((current["id"], role))
+
+        return {
+            "settings": changed_settings,
+            "create": {"roles": new_roles, "groups": new_groups,
+                       "clients": new_clients, "users": new_users},
+            "update": {"roles": changed_roles, "groups": changed_groups,
+                       "clients": changed_clients, "users": changed_users},
+            "memberships": memberships,
+            "role_mappings": role_mappings
+        }
+
+    @staticmethod
+    def is_empty(plan: Dict) -> bool:
+        return not (plan["settings"] or plan["memberships"] or plan["role_mappings"] or
+                    any(plan["create"].values()) or any(plan["update"].values()))
+
+    @staticmethod
+    def describe(plan: Dict) -> List[str]:
+        """Human-readable lines for a plan"""
+        lines = []
+        if plan["settings"]:
+            lines.append(f"update realm settings: {', '.join(sorted(plan['settings']))}")
+        for action in ("create", "update"):
+            for kind, items in plan[action].items():
+                if items:
+                    names = [item.get("clientId") or item.get("username") or item.get("name")
+                             for item in items]
+                    shown = ", ".join(names[:5]) + (f", ... (+{len(names) - 5})" if len(names) > 5 else "")
+                    lines.append(f"{action} {len(items)} {kind}: {shown}")
+        if plan["memberships"]:
+            lines.append(f"add {len(plan['memberships'])} group membership(s)")
+        if plan["role_mappings"]:
+            lines.append(f"add {len(plan['role_mappings'])} realm role mapping(s)")
+        return lines
+
+    # -- applying -------------------------------------------------------------
+
+    def partial_import(self, body: Dict, if_exists: str) -> Dict:
+        """POST one partial-import batch"""
+        admin = self.admin
+        response = admin.session.post(
+            admin.realm_url(self.realm, "partialImport"),
+            json={**body, "ifResourceExists": if_exists},
+            timeout=max(admin.timeout, 120)
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def apply(self, plan: Dict) -> Dict:
+        """Apply a plan; returns counts of what was written"""
+        admin, realm = self.admin, self.realm
+        counts = {"added": 0, "overwritten": 0, "updated": 0}
+
+        if plan["settings"]:
+            admin.session.put(admin.realm_url(realm), json=plan["settings"],
+                              timeout=admin.timeout).raise_for_status()
+            counts["updated"] += 1
+
+        # Roles, groups and clients first, so new users can reference them
+        create = plan["create"]
+        base = {}
+        if create["roles"]:
+            base["roles"] = {"realm": create["roles"]}
+        if create["groups"]:
+            base["groups"] = create["groups"]
+        if create["clients"]:
+            base["clients"] = create["clients"]
+        if base:
+            counts["added"] += self.partial_import(base, "SKIP").get("added", 0)
+        for batch in batches(create["users"], IMPORT_BATCH_SIZE):
+            counts["added"] += self.partial_import({"users": batch}, "SKIP").get("added", 0)
+
+        if plan["update"]["clients"]:
+            result = self.partial_import({"clients": plan["update"]["clients"]}, "OVERWRITE")
+            counts["overwritten"] += result.get("overwritten", 0)
+
+        # Everything else is independent single-resource writes
+        group_ids = {}
+        if plan["memberships"]:
+            group_ids = {group["path"]: group["id"] for group in admin.groups(realm)}
+        roles = {}
+        if plan["role_mappings"]:
+            roles = {role["name"]: role for role in admin.roles(realm)}
+
+        writes = []
+        for role in plan["update"]["roles"]:
+            writes.append(("PUT", f"roles/{role['name']}", role))
+        for group in plan["update"]["groups"]:
+            writes.append(("PUT", f"groups/{group['id']}", group))
+        for user in plan["update"]["users"]:
+            writes.append(("PUT", f"users/{user['id']}", user))
+        for user_id, path in plan["memberships"]:
+            writes.append(("PUT", f"users/{user_id}/groups/{group_ids[path]}", None))
+        for user_id, role in plan["role_mappings"]:
+            writes.append(("POST", f"users/{user_id}/role-mappings/realm", [roles[role]]))
+
+        def write(entry):
+            method, path, body = entry
+            admin.session.request(method, admin.realm_url(realm, path), json=body,
+                                  timeout=admin.timeout).raise_for_status()
+
+        with ThreadPoolExecutor(max_workers=WRITE_CONCURRENCY) as pool:
+            list(pool.map(in_current_context(write), writes))
+        counts["updated"] += len(writes)
+        return counts
+
+    def reconcile(self, dry_run: bool = False) -> Dict:
+        """Fetch, diff and (unless dry_run) apply; returns the plan and counts"""
+        with span("realm.read"):
+            plan = self.plan(self.fetch_state())
+        counts = {"added": 0, "overwritten": 0, "updated": 0}
+        if not dry_run and not self.is_empty(plan):
+            with span("realm.apply", **{"realm.changes": len(self.describe(plan))}):
+                counts = self.apply(plan)
+        return {"plan": plan, "changes": self.describe(plan), **counts}
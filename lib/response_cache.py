@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Response Cache
+==============
+
+A gateway_proxy layer that answers repeated, deterministic chat requests
+from memory instead of sending them to the provider again:
+
+- The cache key is a SHA-256 of the route and the canonicalized request
+  body: keys sorted, `null` values and per-caller fields (`user`,
+  `metadata`, `store`) dropped, so the same model, messages, temperature,
+  tools and options always map to the same entry regardless of key order.
+- Only deterministic requests are cached: `temperature` at or below
+  `max_temperature` (default 0), or a fixed `seed`, and a single choice.
+  Anything else, or a request with `Cache-Control: no-cache`/`no-store`,
+  bypasses the cache.
+- Entries live in a byte-bounded LRU with a TTL (ttl_cache.py). Only
+  complete 200 responses are stored.
+- Streamed responses are passed through to the client as they arrive and
+  recorded on the side. A stream is stored only when it finished (`[DONE]`
+  or `message_stop`), and a hit replays it as the same SSE events.
+- Behind the coalescer (singleflight.py), only the leader of a coalesced
+  request stores its response; followers are counted as `coalesced`, not
+  as misses.
+- `metrics()` reports hits, misses, bypasses by reason, stores, evictions,
+  size, hit ratio and the provider tokens the hits saved. Responses carry
+  `X-Cache: HIT`, `MISS` or `BYPASS`.
+"""
+
+import hashlib
+import json
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from gateway_proxy import Handler, ProxyRequest, ProxyResponse, metric
+from token_usage import Usage, response_usage
+from ttl_cache import TTLCache
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+
+# Completion endpoints (OpenAI-compatible and Anthropic messages)
+CACHEABLE_SUFFIXES = ("/chat/completions", "/completions", "/messages")
+
+# Fields that identify the caller, not the prompt
+IGNORED_FIELDS = ("user", "metadata", "store")
+
+# Markers of a stream that ran to completion
+STREAM_END_MARKERS = (b"data: [DONE]", b"event: message_stop")
+
+
+class CachedResponse:
+    """A stored response: full body, or the SSE events of a stream"""
+
+    def __init__(self, status: int, content_type: str, body: bytes = b"",
+                 events: Optional[List[bytes]] = None, tokens: int = 0):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.events = events
+        self.tokens = tokens
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(event) for event in self.events or ())
+
+
+def canonical_key(path: str, body: Dict) -> str:
+    """Cache key for a request body on a route"""
+    fields = {key: value for key, value in body.items()
+              if key not in IGNORED_FIELDS and value is not None}
+    canonical = json.dumps({"path": path.split("?")[0], "body": fields},
+                           sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def deterministic(body: Dict, max_temperature: float) -> bool:
+    """Whether the same request should produce the same response"""
+    if body.get("n", 1) != 1:
+        return False
+    if body.get("seed") is not None:
+        return True
+    temperature = body.get("temperature")
+    # Providers default to temperature 1
+    return isinstance(temperature, (int, float)) and temperature <= max_temperature
+
+
+def split_events(stream: bytes) -> List[bytes]:
+    """SSE events of a recorded stream, each with its blank-line terminator"""
+    events = stream.replace(b"\r\n", b"\n").split(b"\n\n")
+    return [event + b"\n\n" for event in events if event.strip()]
+
+
+class ResponseCache:
+    """Proxy layer that caches deterministic completion responses"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_entry_bytes: int = DEFAULT_MAX_ENTRY_BYTES, max_temperature: float = 0.0,
+                 suffixes: Tuple[str, ...] = CACHEABLE_SUFFIXES):
+        self.entries = TTLCache(max_entries=100000, ttl=ttl, max_weight=max_bytes,
+                                weigher=lambda entry: entry.size)
+        self.max_entry_bytes = max_entry_bytes
+        self.max_temperature = max_temperature
+        self.suffixes = suffixes
+        self._lock = threading.Lock()
+        self.counts = {"hit": 0, "miss": 0, "coalesced": 0, "bypass": 0, "store": 0}
+        self.bypasses: Dict[str, int] = {}
+        self.tokens_saved = 0
+
+    def count(self, result: str, reason: Optional[str] = None):
+        with self._lock:
+            self.counts[result] += 1
+            if reason:
+                self.bypasses[reason] = self.bypasses.get(reason, 0) + 1
+
+    def bypass_reason(self, request: ProxyRequest) -> Optional[str]:
+        if request.method != "POST" or not request.path.split("?")[0].endswith(self.suffixes):
+            return "route"
+        cache_control = request.headers.get("cache-control", "").lower()
+        if "no-cache" in cache_control or "no-store" in cache_control:
+            return "no_cache"
+        if request.json is None:
+            return "body"
+        if not deterministic(request.json, self.max_temperature):
+            return "nondeterministic"
+        return None
+
+    def __call__(self, request: ProxyRequest, call_next: Handler) -> ProxyResponse:
+        reason = self.bypass_reason(request)
+        if reason:
+            # Other routes (models, health, agents) are not counted as bypasses
+            if reason != "route":
+                self.count("bypass", reason)
+            response = call_next(request)
+            if reason != "route":
+                response.set_header("X-Cache", "BYPASS")
+            return response
+
+        key = canonical_key(request.path, request.json)
+        cached = self.entries.get(key)
+        if cached is not None:
+            self.count("hit")
+            with self._lock:
+                self.tokens_saved += cached.tokens
+            return self.replay(cached)
+
+        response = call_next(request)
+        response.set_header("X-Cache", "MISS")
+        if response.header("X-Coalesced") == "follower":
+            # The leader of this coalesced request stores the one response they share
+            self.count("coalesced")
+            return response
+        self.count("miss")
+        if response.status != 200:
+            return response
+        content_type = response.header("Content-Type", "application/json")
+        if response.streaming:
+            response.chunks = self.record(key, content_type, response.chunks, response_usage(response))
+        elif len(response.body) <= self.max_entry_bytes:
+            self.store(key, CachedResponse(200, content_type, response.body,
+                                           tokens=response_usage(response).total))
+        return response
+
+    def store(self, key: str, entry: CachedResponse):
+        self.entries.set(key, entry)
+        self.count("store")
+
+    def record(self, key: str, content_type: str, chunks: Iterator[bytes],
+               usage: Usage) -> Iterator[bytes]:
+        """Pass a stream through unchanged, storing it if it completes"""
+        parts: Optional[List[bytes]] = []
+        size = 0
+        complete = False
+        try:
+            for chunk in chunks:
+                yield chunk
+                if parts is not None:
+                    size += len(chunk)
+                    if size > self.max_entry_bytes:
+                        parts = None
+                    else:
+                        parts.append(chunk)
+            complete = True
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            if complete and parts is not None:
+                stream = b"".join(parts)
+                if any(marker in stream for marker in STREAM_END_MARKERS):
+                    events = split_events(stream)
+                    self.store(key, CachedResponse(200, content_type, events=events,
+                                                   tokens=usage.total))
+
+    @staticmethod
+    def replay(cached: CachedResponse) -> ProxyResponse:
+        headers = [("Content-Type", cached.content_type), ("X-Cache", "HIT")]
+        if cached.events is None:
+            return ProxyResponse(cached.status, headers, cached.body)
+        return ProxyResponse(cached.status, headers, chunks=iter(cached.events))
+
+    def metrics(self) -> List[str]:
+        with self._lock:
+            counts, bypasses, saved = dict(self.counts), dict(self.bypasses), self.tokens_saved
+        lookups = counts["hit"] + counts["miss"]
+        lines = metric("agw_response_cache_requests_total", "counter",
+                       "Cacheable-route requests by cache result (coalesced: shared another miss)",
+                       [({"result": result}, counts[result])
+                        for result in ("hit", "miss", "coalesced", "bypass")])
+        lines += metric("agw_response_cache_bypass_total", "counter",
+                        "Requests that skipped the cache, by reason",
+                        [({"reason": reason}, value) for reason, value in sorted(bypasses.items())])
+        lines += metric("agw_response_cache_stores_total", "counter",
+                        "Responses written to the cache", [({}, counts["store"])])
+        lines += metric("agw_response_cache_evictions_total", "counter",
+                        "Entries evicted to stay within the size bound", [({}, self.entries.evictions)])
+        lines += metric("agw_response_cache_entries", "gauge", "Cached responses",
+                        [({}, len(self.entries))])
+        lines += metric("agw_response_cache_bytes", "gauge", "Size of cached responses",
+                        [({}, self.entries.weight)])
+        lines += metric("agw_response_cache_hit_ratio", "gauge",
+                        "Hits / (hits + misses) since start",
+                        [({}, round(counts["hit"] / lookups, 4) if lookups else 0)])
+        lines += metric("agw_response_cache_tokens_saved_total", "counter",
+                        "Provider tokens not spent thanks to cache hits", [({}, saved)])
+        return lines
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Hedged Routing
+==============
+
+A gateway_proxy layer that treats equivalent models on different AI
+routes (`/anthropic`, `/openai`, `/xai`, `/gemini`) as one pool, so a slow
+or failing provider doesn't make users wait:
+
+- Model groups (proxy/model-groups.json) list interchangeable
+  `(route, model)` pairs. A chat completion for any member of a group can
+  be answered by any other member; the request is rewritten to the other
+  route and model.
+- Every route keeps an exponentially weighted moving average (EWMA) of its
+  time to first token and of its variance, separately for streamed and
+  full responses. Its p95 is estimated as mean + 1.645 standard
+  deviations.
+- The requested route is tried first. For a streamed completion, if it
+  has produced no first token by its p95, a hedge request goes to the
+  fastest healthy alternative. Whichever first token arrives first wins,
+  and the loser's stream is closed after its first chunk, which stops the
+  provider generating. Full (non-streamed) completions are not hedged:
+  their answer is the whole completion, so a loser would be generated and
+  billed in full. They still fail over.
+- A circuit breaker per route opens when the error rate (5xx, 429,
+  connection errors) over the last `window` requests reaches
+  `error_threshold`. Open routes are skipped, so requests fail over to
+  the next candidate straight away. After `cooldown` seconds one probe
+  request is let through (half-open); its result closes or re-opens the
+  breaker.
+- Responses carry `X-Routed-To: <route> <model>`, plus `X-Hedged: true`
+  when a hedge was sent.
+
+scripts/mock-gateway.py serves the same routes with injected latency and
+errors, to try all of this locally.
+"""
+
+import json
+import math
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from gateway_proxy import Handler, ProxyRequest, ProxyResponse, metric
+
+Candidate = Tuple[str, str]  # (route prefix, model)
+
+# z-score of the 95th percentile of a normal distribution
+P95_Z = 1.645
+
+
+class Ewma:
+    """Exponentially weighted mean and variance of a latency"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.mean: Optional[float] = None
+        self.variance = 0.0
+        self.samples = 0
+
+    def add(self, value: float):
+        self.samples += 1
+        if self.mean is None:
+            self.mean = value
+            return
+        diff = value - self.mean
+        increment = self.alpha * diff
+        self.mean += increment
+        self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+
+    def p95(self) -> Optional[float]:
+        if self.mean is None:
+            return None
+        return self.mean + P95_Z * math.sqrt(self.variance)
+
+
+class RouteHealth:
+    """Latency EWMAs and a circuit breaker for one route"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, alpha: float, window: int, min_requests: int,
+                 error_threshold: float, cooldown: float):
+        self.latency = {True: Ewma(alpha), False: Ewma(alpha)}
+        self.outcomes = deque(maxlen=window)
+        self.min_requests = min_requests
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+
+    def available(self, now: float) -> bool:
+        """Whether this route may take a request (claims the probe when half-open)"""
+        if self.state == self.OPEN and now - self.opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+        return self.state == self.CLOSED
+
+    def record(self, ok: bool, ttft: Optional[float], streaming: bool, now: float):
+        if ok and ttft is not None:
+            self.latency[streaming].add(ttft)
+        self.outcomes.append(ok)
+        if self.state == self.HALF_OPEN:
+            self.probing = False
+            if ok:
+                self.state = self.CLOSED
+                self.outcomes.clear()
+            else:
+                self.trip(now)
+            return
+        failures = self.outcomes.count(False)
+        if (self.state == self.CLOSED and len(self.outcomes) >= self.min_requests and
+                failures / len(self.outcomes) >= self.error_threshold):
+            self.trip(now)
+
+    def trip(self, now: float):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.trips += 1
+
+
+def load_groups(path: str) -> List[List[Candidate]]:
+    """Model groups from JSON: {"groups": [{"name": ..., "members": [{"route", "model"}]}]}"""
+    with open(path, "r") as f:
+        config = json.load(f)
+    return [[(member["route"].rstrip("/"), member["model"]) for member in group["members"]]
+            for group in config.get("groups", [])]
+
+
+def split_route(path: str) -> Tuple[str, str]:
+    """('/openai', '/v1/chat/completions') from '/openai/v1/chat/completions'"""
+    _, route, rest = path.split("/", 2) if path.count("/") >= 2 else ("", path.strip("/"), "")
+    return f"/{route}", f"/{rest}"
+
+
+def prepend(first: Optional[bytes], chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """A stream with its already-read first chunk put back"""
+    try:
+        if first:
+            yield first
+        yield from chunks
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def discard(response: Optional[ProxyResponse]):
+    """Close a response nobody will read"""
+    if response is not None and response.streaming and hasattr(response.chunks, "close"):
+        response.chunks.close()
+
+
+class HedgedRouter:
+    """Proxy layer that hedges and fails over between equivalent routes"""
+
+    def __init__(self, groups: List[List[Candidate]], alpha: float = 0.2,
+                 hedge_min: float = 0.25, hedge_max: float = 10.0, default_hedge: float = 2.0,
+                 window: int = 20, min_requests: int = 5, error_threshold: float = 0.5,
+                 cooldown: float = 30.0, clock=time.monotonic):
+        self.groups = {member: group for group in groups for member in group}
+        self.hedge_min = hedge_min
+        self.hedge_max = hedge_max
+        self.default_hedge = default_hedge
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.health: Dict[str, RouteHealth] = {
+            route: RouteHealth(alpha, window, min_requests, error_threshold, cooldown)
+            for route in sorted({route for group in groups for route, _ in group})
+        }
+        self.counts = {"requests": 0, "hedged": 0, "hedge_won": 0, "failover": 0, "discarded": 0}
+
+    def hedge_delay(self, route: str, streaming: bool) -> float:
+        """How long to wait for the primary's first token before hedging"""
+        with self._lock:
+            p95 = self.health[route].latency[streaming].p95()
+        delay = self.default_hedge if p95 is None else p95
+        return min(self.hedge_max, max(self.hedge_min, delay))
+
+    def candidates(self, request: ProxyRequest) -> List[Candidate]:
+        """Requested route first, then the alternatives, fastest first"""
+        route, _ = split_route(request.path.split("?")[0])
+        model = request.json.get("model")
+        group = self.groups.get((route, model))
+        if not group:
+            return []
+        streaming = bool(request.json.get("stream"))
+
+        def expected(candidate: Candidate) -> float:
+            mean = self.health[candidate[0]].latency[streaming].mean
+            return mean if mean is not None else self.default_hedge
+        with self._lock:
+            others = sorted((c for c in group if c != (route, model)), key=expected)
+        return [(route, model), *others]
+
+    def claim(self, candidates: List[Candidate]) -> Optional[Candidate]:
+        """Next candidate whose breaker lets a request through"""
+        now = self.clock()
+        with self._lock:
+            while candidates:
+                candidate = candidates.pop(0)
+                if self.health[candidate[0]].available(now):
+                    return candidate
+        return None
+
+    def record(self, route: str, ok: bool, ttft: Optional[float], streaming: bool):
+        with self._lock:
+            self.health[route].record(ok, ttft, streaming, self.clock())
+
+    def count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    @staticmethod
+    def rewrite(request: ProxyRequest, candidate: Candidate) -> ProxyRequest:
+        route, model = candidate
+        _, rest = split_route(request.path)
+        body = dict(request.json, model=model)
+        headers = {name: value for name, value in request.headers.items() if name != "content-length"}
+        return ProxyRequest(request.method, route + rest, headers, json.dumps(body).encode("utf-8"))
+
+    def attempt(self, candidate: Candidate, request: ProxyRequest, call_next: Handler,
+                streaming: bool, results: "queue.Queue"):
+        """Run one upstream attempt; report (candidate, response, first chunk, ok)"""
+        start = time.perf_counter()
+        response, first, ok = None, None, False
+        try:
+            response = call_next(self.rewrite(request, candidate))
+            ok = response.status < 500 and response.status != 429
+            if ok and response.streaming:
+                # The first token, not the headers, is what the user waits for
+                first = next(response.chunks, None)
+        except Exception:
+            ok = False
+        self.record(candidate[0], ok, time.perf_counter() - start if ok else None, streaming)
+        results.put((candidate, response, first, ok))
+
+    def __call__(self, request: ProxyRequest, call_next: Handler) -> ProxyResponse:
+        if (request.method != "POST" or not request.path.split("?")[0].endswith("/chat/completions")
+                or request.json is None):
+            return call_next(request)
+        candidates = self.candidates(request)
+        if not candidates:
+            return call_next(request)
+
+        self.count("requests")
+        streaming = bool(request.json.get("stream"))
+        results: "queue.Queue" = queue.Queue()
+        requested = candidates[0]
+        pending = 0
+        hedged = False
+        last_failure = None
+
+        def launch() -> Optional[Candidate]:
+            nonlocal pending
+            candidate = self.claim(candidates)
+            if candidate is not None:
+                pending += 1
+                threading.Thread(target=self.attempt, daemon=True,
+                                 args=(candidate, request, call_next, streaming, results)).start()
+            return candidate
+
+        primary = launch()
+        if primary is None:
+            # Every route's breaker is open: let the requested one try anyway
+            return call_next(request)
+        while pending:
+            try:
+                # Only streams are hedged: a losing stream can be cut off, a full response can't
+                timeout = (None if hedged or not streaming or not candidates
+                           else self.hedge_delay(primary[0], streaming))
+                candidate, response, first, ok = results.get(timeout=timeout)
+            except queue.Empty:
+                hedged = launch() is not None
+                if hedged:
+                    self.count("hedged")
+                continue
+            pending -= 1
+            if not ok:
+                discard(last_failure)
+                last_failure = response
+                if not pending:
+                    primary = launch()
+                    if primary is not None:
+                        self.count("failover")
+                continue
+
+            # Winner: close whatever else answers later
+            if pending:
+                threading.Thread(target=self.drain, args=(results, pending), daemon=True).start()
+            discard(last_failure)
+            if hedged and candidate != requested:
+                self.count("hedge_won")
+            if response.streaming:
+                response.chunks = prepend(first, response.chunks)
+            response.set_header("X-Routed-To", f"{candidate[0]} {candidate[1]}")
+            if hedged:
+                response.set_header("X-Hedged", "true")
+            return response
+
+        if last_failure is not None:
+            return last_failure
+        return call_next(request)
+
+    def drain(self, results: "queue.Queue", pending: int):
+        for _ in range(pending):
+            _, response, _, _ = results.get()
+            if response is not None:
+                self.count("discarded")
+            discard(response)
+
+    def metrics(self) -> List[str]:
+        with self._lock:
+            counts = dict(self.counts)
+            health = {route: (h.state, h.trips, h.latency[True].mean, h.latency[False].mean,
+                              h.latency[True].p95())
+                      for route, h in self.health.items()}
+        lines = metric("agw_hedging_requests_total", "counter",
+                       "Grouped completions: all, hedged, won by the hedge, failed over, "
+                       "and losing responses closed",
+                       [({"kind": kind}, value) for kind, value in counts.items()])
+        lines += metric("agw_hedging_breaker_open", "gauge", "1 if the route's breaker is open",
+                        [({"route": route}, int(state == RouteHealth.OPEN))
+                         for route, (state, *_) in health.items()])
+        lines += metric("agw_hedging_breaker_trips_total", "counter", "Times the breaker opened",
+                        [({"route": route}, trips) for route, (_, trips, *_) in health.items()])
+        lines += metric("agw_hedging_ttft_ewma_seconds", "gauge",
+                        "EWMA time to first token (stream) or response (full)",
+                        [({"route": route, "mode": mode}, round(value, 4))
+                         for route, (_, _, stream, full, _) in health.items()
+                         for mode, value in (("stream", stream), ("full", full)) if value is not None])
+        return lines
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Request Coalescing
+==================
+
+A gateway_proxy layer that sends identical concurrent requests upstream
+only once ("singleflight"). When Open WebUI loads for many users at once,
+or a prompt template fires from several places at the same moment, the
+gateway sees one request instead of a burst, so the burst doesn't use up
+the route's `localRateLimit` budget or pay for the same tokens twice:
+
+- The first request for a key (the leader) goes upstream. Requests with
+  the same key that arrive while it is in flight (followers) wait for its
+  response instead of sending their own.
+- Full responses are handed to every waiter as copies.
+- Streamed (SSE) responses are read by one pump thread into a shared
+  buffer. Every subscriber, including ones that join mid-stream, gets the
+  stream from the start and then follows it live. One slow client never
+  holds up the others. If every subscriber disconnects before the end,
+  the upstream stream is closed at its next chunk instead of being read
+  (and paid for) to the end; later requests for the key start afresh.
+- Keys: `GET .../models` by path, and completions by the response cache's
+  canonical body key. By default only deterministic completions are
+  coalesced, because merging sampled requests would hand several users the
+  same sample; `coalesce_all=True` merges every identical body.
+
+If the leader fails with an exception, its followers fall back to sending
+their own requests. Followers don't carry their own headers upstream, so
+gateway-side attribution is the leader's.
+"""
+
+import hashlib
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+from gateway_proxy import Handler, ProxyRequest, ProxyResponse, metric
+from response_cache import CACHEABLE_SUFFIXES, canonical_key, deterministic
+
+# Listings coalesced by path
+GET_SUFFIXES = ("/models",)
+
+# How long a follower waits for the leader's response headers
+FOLLOWER_TIMEOUT = 300.0
+
+
+class Broadcast:
+    """One upstream stream, read once and replayed to any number of subscribers"""
+
+    def __init__(self, source: Iterator[bytes], on_done: Optional[Callable[[], None]] = None):
+        self.source = source
+        self.on_done = on_done
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.subscribers = 0
+        # Every subscriber left before the end; nobody else may join
+        self.abandoned = False
+        self._cond = threading.Condition()
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def _pump(self):
+        try:
+            for chunk in self.source:
+                with self._cond:
+                    if self.abandoned:
+                        break
+                    self.chunks.append(chunk)
+                    self._cond.notify_all()
+        except Exception:
+            # Subscribers see the stream end where the upstream broke off
+            pass
+        finally:
+            if hasattr(self.source, "close"):
+                self.source.close()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            if self.on_done:
+                self.on_done()
+
+    def subscribe(self) -> Optional["Subscription"]:
+        """Every chunk from the start, then live; None once the stream was abandoned"""
+        with self._cond:
+            if self.abandoned:
+                return None
+            self.subscribers += 1
+        return Subscription(self)
+
+    def read(self, index: int) -> List[bytes]:
+        """Chunks from `index` on, waiting for more; empty when the stream has ended"""
+        with self._cond:
+            while index >= len(self.chunks) and not self.done:
+                self._cond.wait()
+            return self.chunks[index:]
+
+    def leave(self):
+        with self._cond:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.abandoned = True
+
+
+class Subscription:
+    """One subscriber's position in a Broadcast
+
+    Counted from subscribe() until closed (or collected), so a response that
+    is dropped before its first chunk is read still lets the upstream go.
+    """
+
+    def __init__(self, broadcast: Broadcast):
+        self.broadcast = broadcast
+        self.index = 0
+        self.batch: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def __iter__(self) -> "Subscription":
+        return self
+
+    def __next__(self) -> bytes:
+        if self.position == len(self.batch):
+            if self.closed:
+                raise StopIteration
+            self.batch, self.position = self.broadcast.read(self.index), 0
+            self.index += len(self.batch)
+            if not self.batch:
+                self.close()
+                raise StopIteration
+        self.position += 1
+        return self.batch[self.position - 1]
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broadcast.leave()
+
+    __del__ = close
+
+
+class Flight:
+    """An in-flight upstream request and the response it will share"""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.failed = False
+        self.response: Optional[ProxyResponse] = None
+        self.broadcast: Optional[Broadcast] = None
+
+    def share(self, role: str) -> Optional[ProxyResponse]:
+        """A copy of the response for one waiter; None if its stream was abandoned"""
+        source = self.response
+        headers = [*source.headers, ("X-Coalesced", role)]
+        if self.broadcast is not None:
+            subscription = self.broadcast.subscribe()
+            if subscription is None:
+                return None
+            shared = ProxyResponse(source.status, headers, chunks=subscription)
+        else:
+            shared = ProxyResponse(source.status, headers, source.body)
+        # The leader's stream is parsed for usage once; waiters reuse the result
+        shared.usage = source.usage
+        return shared
+
+
+class Coalescer:
+    """Proxy layer that merges identical in-flight requests"""
+
+    def __init__(self, coalesce_all: bool = False, max_temperature: float = 0.0,
+                 follower_timeout: float = FOLLOWER_TIMEOUT):
+        self.coalesce_all = coalesce_all
+        self.max_temperature = max_temperature
+        self.follower_timeout = follower_timeout
+        self._lock = threading.Lock()
+        self.inflight: Dict[str, Flight] = {}
+        self.counts = {"leader": 0, "follower": 0, "fallback": 0}
+
+    def key(self, request: ProxyRequest) -> Optional[str]:
+        path = request.path.split("?")[0]
+        # Requests with different credentials never share a response
+        credential = hashlib.sha256(request.headers.get("authorization", "").encode("utf-8")).hexdigest()[:16]
+        if request.method == "GET" and path.endswith(GET_SUFFIXES):
+            return f"GET {request.path} {credential}"
+        if request.method != "POST" or not path.endswith(CACHEABLE_SUFFIXES) or request.json is None:
+            return None
+        if not self.coalesce_all and not deterministic(request.json, self.max_temperature):
+            return None
+        return f"POST {canonical_key(request.path, request.json)} {credential}"
+
+    def count(self, role: str):
+        with self._lock:
+            self.counts[role] += 1
+
+    def land(self, key: str, flight: Flight):
+        """Stop accepting followers for a flight"""
+        with self._lock:
+            if self.inflight.get(key) is flight:
+                del self.inflight[key]
+
+    def __call__(self, request: ProxyRequest, call_next: Handler) -> ProxyResponse:
+        key = self.key(request)
+        if key is None:
+            return call_next(request)
+
+        with self._lock:
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.inflight[key] = Flight()
+
+        if not leader:
+            shared = None
+            if flight.ready.wait(self.follower_timeout) and not flight.failed:
+                shared = flight.share("follower")
+            if shared is None:
+                self.count("fallback")
+                return call_next(request)
+            self.count("follower")
+            return shared
+
+        self.count("leader")
+        try:
+            response = call_next(request)
+        except BaseException:
+            flight.failed = True
+            flight.ready.set()
+            self.land(key, flight)
+            raise
+
+        flight.response = response
+        if response.streaming:
+            # Joiners are accepted until the stream ends; they replay from the start
+            flight.broadcast = Broadcast(response.chunks, on_done=lambda: self.land(key, flight))
+        else:
+            self.land(key, flight)
+        # Subscribed before followers can join, so none of them can abandon the stream under it
+        shared = flight.share("leader")
+        flight.ready.set()
+        return shared
+
+    def metrics(self) -> List[str]:
+        with self._lock:
+            counts, inflight = dict(self.counts), len(self.inflight)
+        lines = metric("agw_singleflight_requests_total", "counter",
+                       "Coalescable requests by role (follower = upstream call saved)",
+                       [({"role": role}, value) for role, value in counts.items()])
+        lines += metric("agw_singleflight_inflight", "gauge",
+                        "Distinct upstream requests currently shared", [({}, inflight)])
+        return lines
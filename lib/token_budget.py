@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Token Budgets
+=============
+
+A gateway_proxy layer that rations provider tokens instead of requests.
+AgentGateway's `localRateLimit` counts requests (10/min per route), so a
+100k-token prompt costs the same as a 10-token one. This layer enforces
+tokens-per-minute budgets per user and per team:
+
+- Each user and team has a token bucket that refills continuously at its
+  TPM rate (capacity: one minute's worth).
+- Before a completion is sent, its input tokens are estimated from the
+  request body (about 4 characters per token) and reserved from the
+  user's and every team's bucket. If any bucket can't cover the estimate,
+  the request is answered with 429 and a `Retry-After` for when it can.
+- When the response arrives, the reservation is settled against the real
+  `usage` block: from the JSON body, or from the SSE stream as it passes
+  through (the stream isn't held back). Streams without a usage block are
+  settled from the streamed text. Buckets may go into debt, which later
+  requests wait out.
+- Users and teams come from the verified `X-User-Identity` token
+  (identity_token.py). Without `$AGW_IDENTITY_KEY` the plain
+  `X-User-Email` header is used. Requests without either fall under the
+  `anonymous` budget.
+- Buckets are plain slot objects in one dict behind one lock, so admission
+  and settlement take microseconds (`python3 token_budget.py` benchmarks
+  it). Full buckets are pruned, and the state can be saved to a JSON file
+  and restored on restart.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import identity_token
+from gateway_proxy import Handler, ProxyRequest, ProxyResponse, json_response, metric
+from response_cache import CACHEABLE_SUFFIXES
+from token_usage import Usage, response_usage
+
+CHARS_PER_TOKEN = 4
+# Per-message framing tokens (role, separators)
+MESSAGE_OVERHEAD = 4
+
+ANONYMOUS = identity_token.ANONYMOUS
+SAVE_INTERVAL = 30.0
+
+
+def text_length(value) -> int:
+    """Characters of text in a message content value (string or parts)"""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, list):
+        return sum(text_length(part.get("text", "")) if isinstance(part, dict) else text_length(part)
+                   for part in value)
+    return 0
+
+
+def estimate_input_tokens(body: Dict) -> int:
+    """Rough prompt size of a chat/messages request"""
+    chars = text_length(body.get("system")) + text_length(body.get("prompt"))
+    messages = body.get("messages") or []
+    for message in messages:
+        if isinstance(message, dict):
+            chars += text_length(message.get("content"))
+    if body.get("tools"):
+        chars += len(json.dumps(body["tools"], separators=(",", ":")))
+    return chars // CHARS_PER_TOKEN + MESSAGE_OVERHEAD * len(messages) + 1
+
+
+class Bucket:
+    __slots__ = ("tokens", "updated", "limit")
+
+    def __init__(self, tokens: float, updated: float, limit: int):
+        self.tokens = tokens
+        self.updated = updated
+        self.limit = limit
+
+
+class TokenBuckets:
+    """Tokens-per-minute buckets by key ("user:alice", "team:eng")"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.buckets: Dict[str, Bucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: str, limit: int, now: float) -> Bucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(float(limit), now, limit)
+        else:
+            bucket.limit = limit
+            bucket.tokens = min(limit, bucket.tokens + (now - bucket.updated) * limit / 60.0)
+            bucket.updated = now
+        return bucket
+
+    def reserve(self, limits: List[Tuple[str, int]], cost: int) -> Tuple[bool, float, str]:
+        """Take `cost` from every bucket, or none: (ok, retry_after, key that refused)"""
+        with self._lock:
+            now = self.clock()
+            buckets = [(key, self._bucket(key, limit, now)) for key, limit in limits]
+            for key, bucket in buckets:
+                # A request bigger than the whole budget needs a full bucket
+                needed = min(cost, bucket.limit)
+                if bucket.tokens < needed:
+                    return False, (needed - bucket.tokens) * 60.0 / bucket.limit, key
+            for _, bucket in buckets:
+                bucket.tokens -= cost
+            return True, 0.0, ""
+
+    def settle(self, limits: List[Tuple[str, int]], delta: int):
+        """Charge (or refund, if negative) the difference to the estimate"""
+        if not delta:
+            return
+        with self._lock:
+            now = self.clock()
+            for key, limit in limits:
+                self._bucket(key, limit, now).tokens -= delta
+
+    def prune(self) -> int:
+        """Forget buckets that have refilled completely"""
+        with self._lock:
+            now = self.clock()
+            full = [key for key, bucket in self.buckets.items()
+                    if bucket.tokens + (now - bucket.updated) * bucket.limit / 60.0 >= bucket.limit]
+            for key in full:
+                del self.buckets[key]
+        return len(full)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {key: [bucket.tokens, bucket.updated, bucket.limit]
+                    for key, bucket in self.buckets.items()}
+
+    def restore(self, state: Dict):
+        with self._lock:
+            for key, (tokens, updated, limit) in state.items():
+                self.buckets[key] = Bucket(tokens, updated, limit)
+
+
+class TokenBudget:
+    """Proxy layer enforcing per-user and per-team tokens-per-minute budgets"""
+
+    def __init__(self, user_tpm: int = 0, team_tpm: int = 0, anonymous_tpm: int = 0,
+                 overrides: Optional[Dict] = None, state_path: Optional[str] = None,
+                 signing_key: Optional[bytes] = None, suffixes: Tuple[str, ...] = CACHEABLE_SUFFIXES):
+        self.user_tpm = user_tpm
+        self.team_tpm = team_tpm
+        self.anonymous_tpm = anonymous_tpm
+        overrides = overrides or {}
+        self.user_limits: Dict[str, int] = overrides.get("users", {})
+        self.team_limits: Dict[str, int] = overrides.get("teams", {})
+        self.signing_key = signing_key if signing_key is not None else identity_token.identity_key()
+        self.suffixes = suffixes
+        self.buckets = TokenBuckets()
+        self.identity = identity_token.RequestIdentity(self.signing_key)
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self.counts = {"admitted": 0, "rejected": 0, "unmetered": 0}
+        self.rejections: Dict[str, int] = {}
+        self.tokens = {"estimated": 0, "actual": 0}
+        if state_path:
+            self.load()
+            threading.Thread(target=self._save_loop, daemon=True).start()
+
+    # -- who pays -----------------------------------------------------------
+
+    def identify(self, request: ProxyRequest) -> Tuple[str, List[str]]:
+        """(user, teams) for a request"""
+        return self.identity(request.headers)
+
+    def limits(self, user: str, teams: List[str]) -> List[Tuple[str, int]]:
+        """(bucket key, TPM) for every budget that applies; 0 means unlimited"""
+        default = self.anonymous_tpm if user == ANONYMOUS else self.user_tpm
+        limits = [(f"user:{user}", self.user_limits.get(user, default))]
+        limits += [(f"team:{team}", self.team_limits.get(team, self.team_tpm)) for team in teams]
+        return [(key, limit) for key, limit in limits if limit > 0]
+
+    # -- the layer ----------------------------------------------------------
+
+    def __call__(self, request: ProxyRequest, call_next: Handler) -> ProxyResponse:
+        path = request.path.split("?")[0]
+        if request.method != "POST" or not path.endswith(self.suffixes) or request.json is None:
+            return call_next(request)
+        limits = self.limits(*self.identify(request))
+        if not limits:
+            self.count("unmetered")
+            return call_next(request)
+
+        estimate = estimate_input_tokens(request.json)
+        ok, retry_after, refused = self.buckets.reserve(limits, estimate)
+        if not ok:
+            self.count("rejected", refused.split(":", 1)[0])
+            return json_response(429, {"error": {
+                "message": f"Token budget exceeded for {refused}; retry in {retry_after:.0f}s",
+                "type": "tokens", "code": "rate_limit_exceeded"
+            }}, [("Retry-After", str(max(1, int(retry_after + 0.999))))])
+        self.count("admitted")
+
+        try:
+            response = call_next(request)
+        except BaseException:
+            self.buckets.settle(limits, -estimate)
+            raise
+        if response.status >= 400:
+            # The provider didn't bill a failed request
+            self.buckets.settle(limits, -estimate)
+            return response
+        usage = response_usage(response, count_text=True)
+        if response.streaming:
+            response.chunks = self.meter_stream(response.chunks, limits, estimate, usage)
+        else:
+            self.settle(limits, estimate, usage.total or estimate)
+        return response
+
+    def meter_stream(self, chunks: Iterator[bytes], limits: List[Tuple[str, int]],
+                     estimate: int, usage: Usage) -> Iterator[bytes]:
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            # Streams without a usage block are charged for their text
+            self.settle(limits, estimate, usage.total or estimate + usage.text_chars // CHARS_PER_TOKEN)
+
+    def settle(self, limits: List[Tuple[str, int]], estimate: int, actual: int):
+        self.buckets.settle(limits, actual - estimate)
+        with self._lock:
+            self.tokens["estimated"] += estimate
+            self.tokens["actual"] += actual
+
+    def count(self, result: str, scope: Optional[str] = None):
+        with self._lock:
+            self.counts[result] += 1
+            if scope:
+                self.rejections[scope] = self.rejections.get(scope, 0) + 1
+
+    # -- persistence --------------------------------------------------------
+
+    def load(self):
+        try:
+            with open(self.state_path, "r") as f:
+                self.buckets.restore(json.load(f).get("buckets", {}))
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def save(self):
+        self.buckets.prune()
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"buckets": self.buckets.snapshot(), "saved_at": int(time.time())}, f)
+        os.replace(tmp, self.state_path)
+
+    def close(self):
+        """Save the buckets one last time"""
+        if self.state_path:
+            try:
+                self.save()
+            except OSError as e:
+                print(f"⚠ Could not save token budgets to {self.state_path}: {e}")
+
+    def _save_loop(self):
+        while True:
+            time.sleep(SAVE_INTERVAL)
+            try:
+                self.save()
+            except OSError as e:
+                print(f"⚠ Could not save token budgets to {self.state_path}: {e}")
+
+    def metrics(self) -> List[str]:
+        with self._lock:
+            counts, rejections, tokens = dict(self.counts), dict(self.rejections), dict(self.tokens)
+        lines = metric("agw_token_budget_requests_total", "counter",
+                       "Completion requests by admission result",
+                       [({"result": result}, value) for result, value in counts.items()])
+        lines += metric("agw_token_budget_rejections_total", "counter",
+                        "Rejected requests by the budget that refused them",
+                        [({"scope": scope}, value) for scope, value in sorted(rejections.items())])
+        lines += metric("agw_token_budget_tokens_total", "counter",
+                        "Tokens reserved up front (estimated) and settled (actual)",
+                        [({"kind": kind}, value) for kind, value in tokens.items()])
+        lines += metric("agw_token_budget_buckets", "gauge", "Budgets currently tracked",
+                        [({}, len(self.buckets.buckets))])
+        return lines
+
+
+def benchmark(requests: int = 20000) -> Dict:
+    """Per-request overhead of identify + reserve + settle, in microseconds"""
+    key = b"benchmark"
+    layer = TokenBudget(user_tpm=10 ** 9, team_tpm=10 ** 9, signing_key=key)
+    tokens = [identity_token.sign(f"user-{i}", f"user{i}@example.com", f"team-{i % 10}", key)
+              for i in range(100)]
+    body = json.dumps({"model": "gpt", "messages": [
+        {"role": "system", "content": "You are a helpful assistant. " * 20},
+        {"role": "user", "content": "Summarize the quarterly report. " * 50}
+    ]}).encode("utf-8")
+    reply = ProxyResponse(200, [("Content-Type", "application/json")],
+                          json.dumps({"usage": {"total_tokens": 900}}).encode("utf-8"))
+    samples = []
+    for index in range(requests):
+        request = ProxyRequest("POST", "/openai/v1/chat/completions",
+                               {"Content-Type": "application/json",
+                                identity_token.HEADER: tokens[index % len(tokens)]}, body)
+        start = time.perf_counter()
+        layer(request, lambda _: reply)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "requests": requests,
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 1),
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "p99_us": round(samples[int(len(samples) * 0.99)] * 1e6, 1)
+    }
+
+
+def main():
+    """Benchmark the layer's overhead"""
+    result = benchmark()
+    print(f"⏱ Token budget overhead over {result['requests']} requests: "
+          f"mean {result['mean_us']}us, p50 {result['p50_us']}us, p99 {result['p99_us']}us")
+
+
+if __name__ == "__main__":
+    main()
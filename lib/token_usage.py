@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Token Usage
+===========
+
+The one parser for provider-reported token usage, shared by the proxy
+layers that need it (response_cache.py, token_budget.py, usage_tap.py):
+
+- `Usage` merges OpenAI (`prompt_tokens`/`completion_tokens`/`total_tokens`)
+  and Anthropic (`input_tokens`/`output_tokens`, cumulative across
+  `message_start` and `message_delta`) usage blocks, and remembers the
+  model the provider reported.
+- `Usage.feed()` reads an SSE stream incrementally. It scans each chunk for
+  `"usage"` and, until the model is known, `"model"`, and only JSON-decodes
+  the `data:` lines that contain them. Only a line split across two chunks
+  is copied (to join it). OpenAI's `"usage": null` chunks are skipped. With
+  `count_text` set it also counts the characters of streamed deltas, for
+  streams that never report usage.
+- `response_usage()` attaches one `Usage` to a `ProxyResponse`: a body is
+  parsed once, a stream is tapped once, however many layers ask. Layers
+  read the result when their own wrapper of the stream ends, by which time
+  the tap has seen every chunk.
+"""
+
+import json
+import re
+import time
+from typing import Iterator, Optional
+
+from gateway_proxy import ProxyResponse
+
+USAGE_KEY = b'"usage"'
+MODEL_KEY = b'"model"'
+
+# Text of streamed deltas, for streams that carry no usage block
+DELTA_TEXT = re.compile(rb'"(?:content|text)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class Usage:
+    """Token usage and model of a response, read incrementally from SSE"""
+
+    def __init__(self, count_text: bool = False):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.total_tokens = 0
+        self.model: Optional[str] = None
+        self.found = False
+        self.count_text = count_text
+        self.text_chars = 0
+        self.seconds = 0.0
+        self._tail = b""
+
+    @property
+    def total(self) -> int:
+        """Total tokens: as reported, else input plus output"""
+        return max(self.total_tokens, self.input_tokens + self.output_tokens)
+
+    def feed(self, chunk: bytes):
+        data = self._tail + chunk if self._tail else chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._tail = data
+            return
+        self._scan(data, USAGE_KEY, end)
+        if self.model is None:
+            self._scan(data, MODEL_KEY, end)
+        if self.count_text:
+            self.text_chars += sum(len(match) for match in DELTA_TEXT.findall(data, 0, end))
+        self._tail = data[end + 1:]
+
+    def _scan(self, data: bytes, key: bytes, end: int):
+        """Parse every complete line (before `end`) that contains `key`"""
+        pos = data.find(key, 0, end)
+        while pos >= 0:
+            start = data.rfind(b"\n", 0, pos) + 1
+            stop = data.find(b"\n", pos, end + 1)
+            if not (key is USAGE_KEY and data[pos + 7:pos + 16].lstrip(b": ").startswith(b"null")):
+                self.parse(data[start:stop])
+            pos = data.find(key, stop, end)
+
+    def parse(self, line: bytes):
+        if not line.startswith(b"data:"):
+            return
+        try:
+            payload = json.loads(line[5:])
+        except ValueError:
+            return
+        self.add_payload(payload)
+
+    def add_payload(self, payload):
+        """Merge a JSON response or stream event (Anthropic nests it in `message`)"""
+        if not isinstance(payload, dict):
+            return
+        message = payload.get("message") if isinstance(payload.get("message"), dict) else {}
+        self.model = self.model or payload.get("model") or message.get("model")
+        self.add(payload.get("usage") or message.get("usage"))
+
+    def add(self, usage):
+        """Merge an OpenAI or Anthropic usage block (Anthropic's counts are cumulative)"""
+        if not isinstance(usage, dict):
+            return
+        self.found = True
+        self.input_tokens = max(self.input_tokens,
+                                int(usage.get("prompt_tokens") or usage.get("input_tokens") or 0))
+        self.output_tokens = max(self.output_tokens,
+                                 int(usage.get("completion_tokens") or usage.get("output_tokens") or 0))
+        self.total_tokens = max(self.total_tokens, int(usage.get("total_tokens") or 0))
+
+
+def body_usage(body: bytes) -> Usage:
+    """Usage of a complete JSON response"""
+    usage = Usage()
+    try:
+        usage.add_payload(json.loads(body))
+    except ValueError:
+        pass
+    return usage
+
+
+def tap(chunks: Iterator[bytes], usage: Usage) -> Iterator[bytes]:
+    """Pass chunks through untouched, feeding each to `usage` after it is sent on"""
+    try:
+        for chunk in chunks:
+            yield chunk
+            start = time.perf_counter()
+            usage.feed(chunk)
+            usage.seconds += time.perf_counter() - start
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def response_usage(response: ProxyResponse, count_text: bool = False) -> Usage:
+    """The response's shared Usage, parsing the body or tapping the stream on first use"""
+    if response.usage is None:
+        if response.streaming:
+            response.usage = Usage()
+            response.chunks = tap(response.chunks, response.usage)
+        else:
+            response.usage = body_usage(response.body)
+    # Set before the first chunk is read, so every chunk is counted
+    response.usage.count_text = response.usage.count_text or count_text
+    return response.usage
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Provisioning Traces
+===================
+
+Records init and provisioning runs as OpenTelemetry traces in the Jaeger
+that already receives the gateway's traces, so a slow cold start can be
+read as a timeline instead of a wall of status lines.
+
+- `init(service)` starts a root span for the process; `span(name, **attrs)`
+  nests phases under whatever span is current (context variables, so
+  threads started through `init_dag` or `in_current_context` keep their
+  parent).
+- Every `requests` call becomes a client span with method, URL, status and
+  outcome, and carries a W3C `traceparent` header so calls through
+  AgentGateway join the same trace.
+- Spans are exported as OTLP/HTTP JSON to `$OTEL_EXPORTER_OTLP_ENDPOINT`
+  (default http://jaeger:4318) when the process exits or `flush()` is
+  called. If the collector can't be reached they are appended to a local
+  file (`$AGW_TRACE_FILE`) as OTLP JSON lines; `upload_file()` sends them
+  later.
+
+Only the standard library is used, so the module is safe to import
+anywhere (including the in-container provisioning bundle, where tracing
+stays off). Nothing is recorded until `init()` is called, and
+`OTEL_SDK_DISABLED=true` turns it off entirely.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import secrets
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+DEFAULT_ENDPOINT = "http://jaeger:4318"
+DEFAULT_TRACE_FILE = os.path.join(
+    os.environ.get("AGW_CACHE_DIR", os.path.join(tempfile.gettempdir(), "agentgateway")),
+    "traces.jsonl"
+)
+MAX_BUFFERED_SPANS = 2048
+
+# OTLP enums
+KIND_INTERNAL, KIND_CLIENT = 1, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_current: contextvars.ContextVar = contextvars.ContextVar("agw_span", default=None)
+_tracer: Optional["Tracer"] = None
+
+
+def otlp_value(value) -> Dict:
+    """Encode one attribute value as an OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """One timed operation"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str],
+                 kind: int = KIND_INTERNAL, attributes: Optional[Dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = STATUS_OK
+        self.message = ""
+
+    def set(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def fail(self, message: str):
+        self.status = STATUS_ERROR
+        self.message = message[:500]
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [{"key": key, "value": otlp_value(value)}
+                           for key, value in self.attributes.items()],
+            "status": {"code": self.status, **({"message": self.message} if self.message else {})}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Tracer:
+    """Buffers finished spans and exports them in batches"""
+
+    def __init__(self, service: str, endpoint: str, trace_file: str):
+        self.service = service
+        self.endpoint = endpoint.rstrip("/")
+        self.trace_file = trace_file
+        self.trace_id = secrets.token_hex(16)
+        self.root: Optional[Span] = None
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def finish(self, span: Span):
+        span.end_ns = time.time_ns()
+        with self._lock:
+            self._spans.append(span)
+            full = len(self._spans) >= MAX_BUFFERED_SPANS
+        if full:
+            self.flush()
+
+    def payload(self, spans: List[Span]) -> Dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": self.service}},
+                {"key": "host.name", "value": {"stringValue": os.uname().nodename}}
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "agentgateway.provisioning"},
+                "spans": [span.to_otlp() for span in spans]
+            }]
+        }]}
+
+    def flush(self) -> str:
+        """Export buffered spans; returns where they went"""
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if not spans:
+            return "nothing"
+        body = json.dumps(self.payload(spans)).encode("utf-8")
+        try:
+            post_otlp(f"{self.endpoint}/v1/traces", body)
+            return self.endpoint
+        except (OSError, urllib.error.URLError):
+            os.makedirs(os.path.dirname(self.trace_file) or ".", exist_ok=True)
+            with open(self.trace_file, "ab") as f:
+                f.write(body + b"\n")
+            return self.trace_file
+
+
+def post_otlp(url: str, body: bytes, timeout: float = 2.0):
+    """POST one OTLP JSON request (urllib, so it is never traced itself)"""
+    request = urllib.request.Request(url, data=body, method="POST",
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def init(service: str, endpoint: Optional[str] = None, trace_file: Optional[str] = None,
+         root: bool = True) -> Optional[Tracer]:
+    """Start tracing this process, by default under one root span"""
+    global _tracer
+    if os.environ.get("OTEL_SDK_DISABLED", "").lower() == "true":
+        return None
+    if _tracer is None:
+        _tracer = Tracer(
+            os.environ.get("OTEL_SERVICE_NAME", service),
+            os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT") or endpoint or DEFAULT_ENDPOINT,
+            os.environ.get("AGW_TRACE_FILE") or trace_file or DEFAULT_TRACE_FILE
+        )
+        if root:
+            _tracer.root = Span(service, _tracer.trace_id, None)
+            _current.set(_tracer.root)
+        instrument_requests()
+        atexit.register(shutdown)
+    return _tracer
+
+
+def shutdown():
+    """End the root span and export everything"""
+    if _tracer is None:
+        return
+    if _tracer.root and _tracer.root.end_ns is None:
+        _tracer.finish(_tracer.root)
+    destination = _tracer.flush()
+    if _tracer.root and destination != "nothing":
+        print(f"ℹ Trace {_tracer.trace_id} exported to {destination}")
+
+
+def flush() -> str:
+    """Export buffered spans now (long-running processes call this per pass)"""
+    return _tracer.flush() if _tracer else "disabled"
+
+
+def current_span() -> Optional[Span]:
+    return _current.get() or (_tracer.root if _tracer else None)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, new_trace: bool = False, **attributes):
+    """Record a phase as a span; exceptions mark it failed and propagate
+
+    `new_trace=True` starts a separate trace, e.g. one per pass of a
+    periodic job, instead of nesting under the process's root span.
+    """
+    if _tracer is None:
+        yield None
+        return
+    parent = None if new_trace else current_span()
+    record = Span(name, parent.trace_id if parent else secrets.token_hex(16),
+                  parent.span_id if parent else None, kind, attributes)
+    token = _current.set(record)
+    try:
+        yield record
+    except BaseException as e:
+        record.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        _tracer.finish(record)
+
+
+def in_current_context(fn: Callable) -> Callable:
+    """Bind fn to the caller's span so work submitted to a thread pool nests under it"""
+    parent = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def instrument_requests():
+    """Record every requests call as a client span"""
+    try:
+        import requests
+    except ImportError:
+        return
+    if getattr(requests.Session.send, "_agw_traced", False):
+        return
+
+    original = requests.Session.send
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        with span(f"HTTP {request.method} {url.path or '/'}", KIND_CLIENT, **{
+            "http.request.method": request.method,
+            "url.full": f"{url.scheme}://{url.netloc}{url.path}",
+            "server.address": url.hostname or ""
+        }) as record:
+            if record is not None:
+                request.headers["traceparent"] = record.traceparent
+            response = original(self, request, **kwargs)
+            if record is not None:
+                record.set("http.response.status_code", response.status_code)
+                if response.status_code >= 400:
+                    record.fail(f"HTTP {response.status_code}")
+            return response
+
+    send._agw_traced = True
+    requests.Session.send = send
+
+
+def upload_file(path: str = DEFAULT_TRACE_FILE, endpoint: Optional[str] = None) -> int:
+    """Send spans saved while offline to the collector; returns batches sent
+
+    If a batch fails, the file is rewritten to hold only that batch and the
+    ones after it, so the next run doesn't send accepted spans twice.
+    """
+    endpoint = (os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT") or endpoint or DEFAULT_ENDPOINT).rstrip("/")
+    sent = 0
+    with open(path, "rb") as f:
+        uploaded = 0
+        try:
+            for line in f:
+                if line.strip():
+                    post_otlp(f"{endpoint}/v1/traces", line.strip())
+                    sent += 1
+                uploaded += len(line)
+        except OSError:
+            if uploaded:
+                f.seek(uploaded)
+                tmp_path = f"{path}.{os.getpid()}"
+                with open(tmp_path, "wb") as rest:
+                    rest.write(f.read())
+                os.replace(tmp_path, path)
+            raise
+    os.remove(path)
+    return sent
+
+
+def main():
+    """Upload spans saved while Jaeger was unreachable"""
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TRACE_FILE
+    if not os.path.exists(path):
+        print(f"ℹ No saved traces at {path}")
+        return
+    try:
+        print(f"✓ Uploaded {upload_file(path, 'http://localhost:4318')} batches from {path}")
+    except OSError as e:
+        print(f"✗ Upload stopped: {e}; the batches not yet sent are kept in {path}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+TTL Cache
+=========
+
+A small thread-safe LRU cache whose entries also expire after a time to
+live. Used wherever a per-request lookup should cost a dictionary hit
+instead of a database or network round trip. Besides an entry count, the
+cache can be bounded by total weight (e.g. bytes, with `weigher=len`).
+Hits, misses and evictions are counted so callers can report a hit rate.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 max_weight: Optional[int] = None, weigher: Callable[[Any], int] = lambda value: 1):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.weight = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remove(self, key: Hashable) -> Optional[tuple]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires, _ = entry
+            if expires <= self.clock():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value; `ttl` overrides the cache default for this entry"""
+        expires = self.clock() + (self.ttl if ttl is None else ttl)
+        weight = self.weigher(value)
+        if self.max_weight is not None and weight > self.max_weight:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires, weight)
+            self.weight += weight
+            while (len(self._entries) > self.max_entries or
+                   (self.max_weight is not None and self.weight > self.max_weight)):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._remove(key)
+        return entry[0] if entry else default
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict:
+        return {"entries": len(self), "weight": self.weight, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": round(self.hit_rate, 4)}
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Streaming Usage Tap
+===================
+
+A gateway_proxy layer that records how many tokens each user spends per
+model, including on streamed responses, where most tokens go and where
+usage only arrives in the last SSE frames:
+
+- Streams are tapped, not buffered. Every chunk is handed on unchanged
+  (the same bytes object) before the tap looks at it, so the tap can't
+  delay the first token.
+- Usage is read by token_usage.py, which only JSON-decodes the `data:`
+  lines that carry it: OpenAI's final usage chunk, and Anthropic's
+  `message_start` and `message_delta` events. The stream is parsed once
+  even when the token budget or response cache meter it too.
+- OpenAI-format streams only carry usage when the request asks for it, so
+  streamed `/chat/completions` requests get
+  `"stream_options": {"include_usage": true}` added. The client then also
+  receives the final usage chunk (`"choices": []`), as it would had it
+  asked itself.
+- When the stream ends, the request's user (identity_token.RequestIdentity),
+  the model the provider reported and the input/output tokens are added
+  to a `UsageStore`. The store aggregates in memory per day, user and model
+  and flushes to a local SQLite file in the background.
+- `metrics()` exports tokens per model (not per user, to keep Prometheus
+  series bounded) and the time spent in the tap.
+
+`python3 usage_tap.py` benchmarks the tap, both per chunk and as time to
+first token through a real proxy against a local SSE upstream, with and
+without the tap. `python3 usage_tap.py --report usage.db` prints the
+store's totals.
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import identity_token
+from gateway_proxy import GatewayProxy, Handler, ProxyRequest, ProxyResponse, metric
+from http_client import create_client
+from response_cache import CACHEABLE_SUFFIXES
+from token_usage import Usage, response_usage
+
+DEFAULT_DB = "usage.db"
+FLUSH_INTERVAL = 10.0
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS token_usage (
+    day TEXT NOT NULL,
+    user TEXT NOT NULL,
+    model TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    PRIMARY KEY (day, user, model)
+)
+"""
+
+UPSERT_SQL = """
+INSERT INTO token_usage (day, user, model, requests, input_tokens, output_tokens)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, user, model) DO UPDATE SET
+    requests = requests + excluded.requests,
+    input_tokens = input_tokens + excluded.input_tokens,
+    output_tokens = output_tokens + excluded.output_tokens
+"""
+
+
+class UsageStore:
+    """Per-day, per-user, per-model token totals in a local SQLite file"""
+
+    def __init__(self, path: str = DEFAULT_DB, flush_interval: float = FLUSH_INTERVAL):
+        self.path = path
+        self._lock = threading.Lock()
+        self.pending: Dict[Tuple[str, str, str], List[int]] = {}
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA_SQL)
+        self._db_lock = threading.Lock()
+        if flush_interval:
+            threading.Thread(target=self._flush_loop, args=(flush_interval,), daemon=True).start()
+
+    def record(self, user: str, model: str, input_tokens: int, output_tokens: int,
+               now: Optional[float] = None):
+        moment = datetime.fromtimestamp(now if now is not None else time.time(), timezone.utc)
+        day = moment.strftime("%Y-%m-%d")
+        with self._lock:
+            totals = self.pending.setdefault((day, user, model), [0, 0, 0])
+            totals[0] += 1
+            totals[1] += input_tokens
+            totals[2] += output_tokens
+
+    def flush(self) -> int:
+        """Write the in-memory totals; returns the rows written"""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        rows = [(*key, *totals) for key, totals in pending.items()]
+        with self._db_lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(UPSERT_SQL, rows)
+            self.conn.execute("COMMIT")
+        return len(rows)
+
+    def _flush_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"⚠️  Usage store flush failed: {e}")
+
+    def totals(self, since: Optional[str] = None) -> List[Dict]:
+        """Tokens per user and model, optionally from a day (YYYY-MM-DD) on"""
+        self.flush()
+        query = ("SELECT user, model, SUM(requests), SUM(input_tokens), SUM(output_tokens) "
+                 "FROM token_usage")
+        params: Tuple = ()
+        if since:
+            query, params = query + " WHERE day >= ?", (since,)
+        with self._db_lock:
+            rows = self.conn.execute(query + " GROUP BY user, model ORDER BY user, model", params).fetchall()
+        return [{"user": user, "model": model, "requests": requests, "input_tokens": input_tokens,
+                 "output_tokens": output_tokens} for user, model, requests, input_tokens, output_tokens in rows]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def request_usage(request: ProxyRequest) -> ProxyRequest:
+    """The request with OpenAI's `stream_options.include_usage` set, if it streams"""
+    body = request.json
+    if not isinstance(body, dict) or not body.get("stream"):
+        return request
+    options = body.get("stream_options")
+    if not isinstance(options, dict):
+        options = {}
+    if options.get("include_usage"):
+        return request
+    body = dict(body, stream_options=dict(options, include_usage=True))
+    headers = {name: value for name, value in request.headers.items() if name != "content-length"}
+    return ProxyRequest(request.method, request.path, headers, json.dumps(body).encode("utf-8"))
+
+
+class UsageTap:
+    """Proxy layer recording per-user, per-model token usage"""
+
+    def __init__(self, store: UsageStore, signing_key: Optional[bytes] = None,
+                 suffixes: Tuple[str, ...] = CACHEABLE_SUFFIXES, include_usage: bool = True):
+        self.store = store
+        self.include_usage = include_usage
+        key = signing_key if signing_key is not None else identity_token.identity_key()
+        self.identity = identity_token.RequestIdentity(key)
+        self.suffixes = suffixes
+        self._lock = threading.Lock()
+        self.tokens: Dict[Tuple[str, str], int] = {}
+        self.requests = {"metered": 0, "unmetered": 0}
+        self.tap_seconds = 0.0
+
+    def __call__(self, request: ProxyRequest, call_next: Handler) -> ProxyResponse:
+        path = request.path.split("?")[0]
+        if request.method != "POST" or not path.endswith(self.suffixes):
+            return call_next(request)
+        user, _ = self.identity(request.headers)
+        requested = (request.json or {}).get("model") or "unknown"
+        if self.include_usage and path.endswith("/chat/completions"):
+            request = request_usage(request)
+        response = call_next(request)
+        if response.status != 200:
+            return response
+        usage = response_usage(response)
+        if response.streaming:
+            response.chunks = self.tap(response.chunks, user, requested, usage)
+        else:
+            self.record(user, requested, usage)
+        return response
+
+    def tap(self, chunks: Iterator[bytes], user: str, requested: str, usage: Usage) -> Iterator[bytes]:
+        """Pass chunks through untouched, recording the usage read from them at the end"""
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            with self._lock:
+                self.tap_seconds += usage.seconds
+            self.record(user, requested, usage)
+
+    def record(self, user: str, requested: str, usage: Usage):
+        if not usage.found:
+            with self._lock:
+                self.requests["unmetered"] += 1
+            return
+        model = usage.model or requested
+        self.store.record(user, model, usage.input_tokens, usage.output_tokens)
+        with self._lock:
+            self.requests["metered"] += 1
+            for kind, value in (("input", usage.input_tokens), ("output", usage.output_tokens)):
+                self.tokens[(model, kind)] = self.tokens.get((model, kind), 0) + value
+
+    def close(self):
+        """Write the usage still held in memory"""
+        self.store.close()
+
+    def metrics(self) -> List[str]:
+        with self._lock:
+            tokens, requests, seconds = dict(self.tokens), dict(self.requests), self.tap_seconds
+        lines = metric("agw_usage_tokens_total", "counter", "Provider-reported tokens by model",
+                       [({"model": model, "kind": kind}, value)
+                        for (model, kind), value in sorted(tokens.items())])
+        lines += metric("agw_usage_requests_total", "counter",
+                        "Completions with (metered) and without (unmetered) a usage block",
+                        [({"result": result}, value) for result, value in requests.items()])
+        lines += metric("agw_usage_tap_seconds_total", "counter",
+                        "Time spent parsing streams for usage", [({}, round(seconds, 6))])
+        return lines
+
+
+# -- benchmark ---------------------------------------------------------------
+
+def sample_stream(provider: str, tokens: int = 200) -> List[bytes]:
+    """SSE chunks shaped like an OpenAI or Anthropic completion stream"""
+    if provider == "anthropic":
+        events = [("message_start", {"type": "message_start", "message": {
+            "id": "msg_1", "model": "claude-haiku-4-5-20251001",
+            "usage": {"input_tokens": 812, "output_tokens": 1}}})]
+        events += [("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                            "delta": {"type": "text_delta", "text": f"word{i} "}})
+                   for i in range(tokens)]
+        events += [("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                                      "usage": {"output_tokens": tokens}}),
+                   ("message_stop", {"type": "message_stop"})]
+        return [f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8") for name, data in events]
+    chunks = [{"id": "c1", "object": "chat.completion.chunk", "model": "gpt-5.2-2025-12-11",
+               "choices": [{"index": 0, "delta": {"content": f"word{i} "}}], "usage": None}
+              for i in range(tokens)]
+    chunks.append({"id": "c1", "object": "chat.completion.chunk", "model": "gpt-5.2-2025-12-11",
+                   "choices": [], "usage": {"prompt_tokens": 812, "completion_tokens": tokens,
+                                            "total_tokens": 812 + tokens}})
+    lines = [f"data: {json.dumps(chunk)}\n\n".encode("utf-8") for chunk in chunks]
+    return lines + [b"data: [DONE]\n\n"]
+
+
+def feed_benchmark(rounds: int = 200) -> Dict:
+    """Tap cost per chunk, for whole and for split chunks"""
+    results = {}
+    for provider in ("openai", "anthropic"):
+        stream = sample_stream(provider)
+        # Split every chunk in two, so lines cross chunk boundaries
+        split = [part for chunk in stream for part in (chunk[:len(chunk) // 2], chunk[len(chunk) // 2:])]
+        for label, chunks in ((provider, stream), (f"{provider}_split", split)):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                usage = Usage()
+                for chunk in chunks:
+                    usage.feed(chunk)
+            elapsed = time.perf_counter() - start
+            assert usage.found and usage.output_tokens == 200, label
+            results[label] = round(elapsed / (rounds * len(chunks)) * 1e6, 3)
+    return results
+
+
+def ttft_benchmark(streams: int = 200, first_token_delay: float = 0.002) -> Dict:
+    """Time to first byte through the proxy, without and with the tap"""
+    stream = sample_stream("openai", tokens=20)
+
+    class Upstream(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(first_token_delay)
+            for chunk in stream:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    servers = []
+
+    def start(server):
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    upstream = start(ThreadingHTTPServer(("127.0.0.1", 0), Upstream))
+    store = UsageStore(":memory:", flush_interval=0)
+    tap = UsageTap(store, signing_key=b"")
+    plain = start(GatewayProxy(upstream).serve("127.0.0.1", 0))
+    tapped = start(GatewayProxy(upstream, layers=[tap]).serve("127.0.0.1", 0))
+
+    client = create_client(pool_size=4, retries=0)
+    body = {"model": "gpt-5.2-2025-12-11", "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+    samples = {"plain": [], "tapped": []}
+    try:
+        for index in range(streams):
+            # Alternate so drift affects both sides equally
+            for label, base in (("plain", plain), ("tapped", tapped)):
+                start_time = time.perf_counter()
+                with client.post(f"{base}/openai/v1/chat/completions", json=body, stream=True) as response:
+                    chunks = response.iter_content(chunk_size=None)
+                    next(chunks)
+                    ttft = time.perf_counter() - start_time
+                    for _ in chunks:
+                        pass
+                if index:
+                    samples[label].append(ttft)
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    result = {"streams": streams - 1, "metered": tap.requests["metered"]}
+    for label, values in samples.items():
+        values.sort()
+        result[f"{label}_p50_ms"] = round(values[len(values) // 2] * 1000, 3)
+        result[f"{label}_p95_ms"] = round(values[int(len(values) * 0.95)] * 1000, 3)
+    result["tap_us_per_stream"] = round(tap.tap_seconds / max(1, tap.requests["metered"]) * 1e6, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the usage tap, or report a usage store")
+    parser.add_argument("--report", metavar="DB", help="Print per-user/model totals from a usage store")
+    parser.add_argument("--since", help="With --report: first day to include (YYYY-MM-DD)")
+    parser.add_argument("--streams", type=int, default=200, help="Streams per side. Default: 200")
+    args = parser.parse_args()
+
+    if args.report:
+        store = UsageStore(args.report, flush_interval=0)
+        for row in store.totals(args.since):
+            print(f"{row['user']:<32} {row['model']:<32} {row['requests']:>7} req "
+                  f"{row['input_tokens']:>10} in {row['output_tokens']:>10} out")
+        store.close()
+        return
+
+    per_chunk = feed_benchmark()
+    print("⏱ Tap cost per chunk: " + ", ".join(f"{label} {value}us" for label, value in per_chunk.items()))
+    result = ttft_benchmark(args.streams)
+    print(f"⏱ TTFT over {result['streams']} streams: "
+          f"without tap p50 {result['plain_p50_ms']}ms / p95 {result['plain_p95_ms']}ms, "
+          f"with tap p50 {result['tapped_p50_ms']}ms / p95 {result['tapped_p95_ms']}ms "
+          f"({result['tap_us_per_stream']}us of parsing per stream, after each chunk is sent)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+User Identity Headers
+=====================
+
+Tags Open WebUI's outbound LLM calls with the user who made them, so
+AgentGateway traces and metrics can be attributed per user:
+
+- `UserHeaderMiddleware` is a pure ASGI middleware. It finds the signed-in
+  user in the request's Open WebUI token, keeps their identity in a context
+  variable for the rest of the request, and hands `receive`/`send` to the
+  app untouched: nothing is buffered or copied, so streamed (SSE) chat
+  responses reach the browser chunk by chunk exactly as without it.
+  Starlette's `BaseHTTPMiddleware`, by contrast, runs the app in a second
+  task and relays every body chunk through a memory stream.
+- `instrument_httpx()` and `instrument_aiohttp()` add `X-User-Email` and
+  `X-User-Id` to every request sent to the gateway while a user request is
+  being handled; `httpx_event_hooks()` does the same for a single client.
+- The module attribute `app` is Open WebUI's app with all of the above
+  installed. Point uvicorn at `user_headers:app` (see
+  docker-compose.user-headers.yml).
+- `python3 user_headers.py` benchmarks time-to-first-token of a streamed
+  response without middleware, with this middleware and, where Starlette
+  is installed (inside the open-webui container), with BaseHTTPMiddleware.
+
+The token is only read to find the user id. Its signature is checked when
+`WEBUI_SECRET_KEY` is set, and Open WebUI's own auth still decides whether
+the request is allowed at all. Identities are cached per session token
+(LRU with TTL, never past the token's expiry): the user's email and team
+are looked up once per session, when a gateway call first happens, and
+every later request costs one cache hit. With `$AGW_IDENTITY_KEY` set,
+each session also gets a signed `X-User-Identity` token (identity_token.py)
+that analytics can verify instead of trusting the plain headers. Headers
+are only added for the hosts in `$AGW_USER_HEADER_HOSTS` (default
+`agentgateway`), never for third parties.
+
+Only the standard library is needed; httpx and aiohttp are patched only
+when they are installed.
+"""
+
+import asyncio
+import base64
+import binascii
+import contextvars
+import hashlib
+import hmac
+import json
+import os
+import time
+from http.cookies import CookieError, SimpleCookie
+from typing import Callable, Dict, Iterable, List, Optional
+
+import identity_token
+from ttl_cache import TTLCache
+
+HEADER_EMAIL = "X-User-Email"
+HEADER_ID = "X-User-Id"
+
+# Sessions whose identity is kept, and for how long
+SESSION_CACHE_SIZE = 10000
+SESSION_CACHE_TTL = 900
+
+# Open WebUI routes that can lead to a gateway call
+DEFAULT_PATHS = ("/api/", "/openai/", "/ollama/")
+
+GATEWAY_HOSTS = frozenset(
+    host.strip()
+    for host in os.environ.get("AGW_USER_HEADER_HOSTS", "agentgateway").split(",")
+    if host.strip()
+)
+
+Lookup = Callable[[str], Optional[Dict]]
+
+_identity: contextvars.ContextVar = contextvars.ContextVar("agw_user_identity", default=None)
+
+
+class Identity:
+    """A session's user; email and team are looked up and the headers built on first use"""
+
+    def __init__(self, user_id: str, email: Optional[str] = None, team: Optional[str] = None,
+                 lookup: Optional[Lookup] = None, signing_key: Optional[bytes] = None):
+        self.user_id = user_id
+        self.email = email
+        self.team = team
+        self._lookup = lookup
+        self._signing_key = signing_key
+        self._headers: Optional[Dict[str, str]] = None
+
+    def headers(self) -> Dict[str, str]:
+        if self._headers is not None:
+            return self._headers
+        if (self.email is None or self.team is None) and self._lookup is not None:
+            try:
+                user = self._lookup(self.user_id) or {}
+            except Exception:
+                # Attribution must never fail the chat itself
+                user = {}
+            self.email = self.email or user.get("email") or ""
+            self.team = self.team or user.get("team") or ""
+        headers = {HEADER_ID: self.user_id}
+        if self.email:
+            headers[HEADER_EMAIL] = self.email
+        if self._signing_key:
+            headers[identity_token.HEADER] = identity_token.sign(
+                self.user_id, self.email or "", self.team or "", self._signing_key)
+        self._headers = headers
+        return headers
+
+
+def current_identity() -> Optional[Identity]:
+    return _identity.get()
+
+
+def b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def token_claims(token: str, secret: Optional[str] = None) -> Optional[Dict]:
+    """Claims of an HS256 JWT; None if malformed, expired or wrongly signed"""
+    try:
+        header, payload, signature = token.split(".")
+        claims = json.loads(b64url_decode(payload))
+        if secret is not None:
+            expected = hmac.new(secret.encode("utf-8"), f"{header}.{payload}".encode("ascii"),
+                                hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, b64url_decode(signature)):
+                return None
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
+    if not isinstance(claims, dict):
+        return None
+    expires = claims.get("exp")
+    if isinstance(expires, (int, float)) and expires < time.time():
+        return None
+    return claims
+
+
+def request_token(scope: Dict) -> Optional[str]:
+    """Open WebUI session token from the Authorization header or `token` cookie"""
+    cookie = None
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, credential = value.decode("latin-1").partition(" ")
+            # sk-... are Open WebUI API keys, not session tokens
+            if scheme.lower() == "bearer" and credential and not credential.startswith("sk-"):
+                return credential.strip()
+        elif name == b"cookie":
+            cookie = value.decode("latin-1")
+    if cookie:
+        try:
+            morsel = SimpleCookie(cookie).get("token")
+        except CookieError:
+            return None
+        return morsel.value if morsel else None
+    return None
+
+
+def openwebui_user(user_id: str) -> Optional[Dict]:
+    """Look a user and their teams up in Open WebUI's database (inside open-webui)"""
+    from open_webui.models.groups import Groups
+    from open_webui.models.users import Users
+    user = Users.get_user_by_id(user_id)
+    if not user:
+        return None
+    # Team groups are synced from Keycloak (see user_sync.py)
+    teams = sorted(group.name for group in Groups.get_groups_by_member_id(user_id))
+    return {"id": user.id, "email": user.email, "team": ",".join(teams)}
+
+
+class UserHeaderMiddleware:
+    """Pure ASGI middleware that makes the request's user available to outbound calls"""
+
+    def __init__(self, app, lookup: Lookup = openwebui_user, secret: Optional[str] = None,
+                 paths: Iterable[str] = DEFAULT_PATHS, signing_key: Optional[bytes] = None,
+                 cache: Optional[TTLCache] = None):
+        self.app = app
+        self.lookup = lookup
+        self.secret = secret if secret is not None else os.environ.get("WEBUI_SECRET_KEY") or None
+        self.paths = tuple(paths)
+        self.signing_key = signing_key if signing_key is not None else identity_token.identity_key()
+        self.cache = cache if cache is not None else TTLCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL)
+
+    def identify(self, scope: Dict) -> Optional[Identity]:
+        # An auth middleware further out may already have resolved the user
+        user = scope.get("state", {}).get("user")
+        if user is not None:
+            user_id = str(getattr(user, "id", ""))
+            identity = self.cache.get(f"user:{user_id}")
+            if identity is None:
+                identity = Identity(user_id, getattr(user, "email", "") or "",
+                                    lookup=self.lookup, signing_key=self.signing_key)
+                self.cache.set(f"user:{user_id}", identity)
+            return identity
+
+        token = request_token(scope)
+        if not token:
+            return None
+        identity = self.cache.get(token)
+        if identity is not None:
+            return identity
+        claims = token_claims(token, self.secret)
+        if not claims or not claims.get("id"):
+            return None
+        identity = Identity(str(claims["id"]), lookup=self.lookup, signing_key=self.signing_key)
+        ttl = self.cache.ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            ttl = min(ttl, claims["exp"] - time.time())
+        self.cache.set(token, identity, ttl)
+        return identity
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope.get("path", "").startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        token = _identity.set(self.identify(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _identity.reset(token)
+
+
+def outbound_headers(host: Optional[str]) -> Dict[str, str]:
+    """Identity headers for a request to `host`, if it is the gateway"""
+    identity = _identity.get()
+    if identity is None or host not in GATEWAY_HOSTS:
+        return {}
+    return identity.headers()
+
+
+def add_httpx_headers(request):
+    """httpx request hook"""
+    request.headers.update(outbound_headers(request.url.host))
+
+
+async def add_httpx_headers_async(request):
+    add_httpx_headers(request)
+
+
+def httpx_event_hooks(asynchronous: bool = True) -> Dict:
+    """`event_hooks=` for one httpx client"""
+    return {"request": [add_httpx_headers_async if asynchronous else add_httpx_headers]}
+
+
+def instrument_httpx():
+    """Add identity headers to every httpx request"""
+    try:
+        import httpx
+    except ImportError:
+        return
+    if getattr(httpx.Client.send, "_agw_user_headers", False):
+        return
+
+    original_send = httpx.Client.send
+    original_async_send = httpx.AsyncClient.send
+
+    def send(self, request, **kwargs):
+        add_httpx_headers(request)
+        return original_send(self, request, **kwargs)
+
+    async def async_send(self, request, **kwargs):
+        add_httpx_headers(request)
+        return await original_async_send(self, request, **kwargs)
+
+    send._agw_user_headers = async_send._agw_user_headers = True
+    httpx.Client.send = send
+    httpx.AsyncClient.send = async_send
+
+
+def aiohttp_trace_config():
+    """aiohttp TraceConfig that adds identity headers"""
+    import aiohttp
+
+    async def on_request_start(session, context, params):
+        params.headers.update(outbound_headers(params.url.host))
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_request_start)
+    return config
+
+
+def instrument_aiohttp():
+    """Add identity headers to every aiohttp session (Open WebUI's OpenAI client)"""
+    try:
+        import aiohttp
+    except ImportError:
+        return
+    if getattr(aiohttp.ClientSession.__init__, "_agw_user_headers", False):
+        return
+
+    original_init = aiohttp.ClientSession.__init__
+
+    def __init__(self, *args, trace_configs=None, **kwargs):
+        original_init(self, *args, trace_configs=[*(trace_configs or []), aiohttp_trace_config()],
+                      **kwargs)
+
+    __init__._agw_user_headers = True
+    aiohttp.ClientSession.__init__ = __init__
+
+
+def install(app, **options):
+    """Wrap an ASGI app and instrument its HTTP clients"""
+    instrument_httpx()
+    instrument_aiohttp()
+    return UserHeaderMiddleware(app, **options)
+
+
+def __getattr__(name):
+    # `uvicorn user_headers:app` serves Open WebUI with identity headers
+    if name == "app":
+        from open_webui.main import app as webui
+        globals()["app"] = install(webui)
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# -- benchmark ----------------------------------------------------------------
+
+BENCH_SECRET = "benchmark-secret"
+BENCH_CHUNKS = 20
+
+
+def sign_token(claims: Dict, secret: str) -> str:
+    """HS256 JWT, as Open WebUI issues them"""
+    def encode(data: bytes) -> str:
+        return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+    signing_input = (encode(json.dumps({"alg": "HS256", "typ": "JWT"}).encode("utf-8")) + "." +
+                     encode(json.dumps(claims).encode("utf-8")))
+    signature = hmac.new(secret.encode("utf-8"), signing_input.encode("ascii"), hashlib.sha256).digest()
+    return f"{signing_input}.{encode(signature)}"
+
+
+async def streaming_app(scope, receive, send):
+    """Stand-in for a streamed chat completion: one gateway call, then SSE chunks"""
+    if scope["type"] != "http":
+        return
+    outbound_headers(next(iter(GATEWAY_HOSTS), "agentgateway"))
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"text/event-stream")]})
+    for index in range(BENCH_CHUNKS):
+        await send({"type": "http.response.body", "body": b'data: {"n": %d}\n\n' % index,
+                    "more_body": True})
+        await asyncio.sleep(0)
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def time_request(app, scope: Dict) -> Dict:
+    """Time to the first body chunk, and how many chunks arrived separately"""
+    start = time.perf_counter()
+    first = None
+    chunks = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal first, chunks
+        if message["type"] == "http.response.body" and message.get("body"):
+            chunks += 1
+            if first is None:
+                first = time.perf_counter() - start
+
+    await app(dict(scope), receive, send)
+    return {"ttft": first or 0.0, "chunks": chunks}
+
+
+def bench_variants() -> Dict:
+    """ASGI apps to compare, by name"""
+    lookup = lambda user_id: {"id": user_id, "email": f"{user_id}@example.com", "team": "bench"}
+    variants = {
+        "no middleware": streaming_app,
+        "UserHeaderMiddleware (ASGI)": UserHeaderMiddleware(streaming_app, lookup=lookup,
+                                                            secret=BENCH_SECRET,
+                                                            signing_key=BENCH_SECRET.encode("utf-8"))
+    }
+    try:
+        from starlette.middleware.base import BaseHTTPMiddleware
+    except ImportError:
+        return variants
+
+    async def dispatch(request, call_next):
+        request.state.user_headers = {HEADER_ID: "bench"}
+        return await call_next(request)
+    variants["BaseHTTPMiddleware"] = BaseHTTPMiddleware(streaming_app, dispatch=dispatch)
+    return variants
+
+
+async def run_benchmark(requests: int, concurrency: int) -> Dict:
+    token = sign_token({"id": "bench-user", "exp": time.time() + 3600}, BENCH_SECRET)
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+             "method": "POST", "scheme": "http", "path": "/api/chat/completions",
+             "raw_path": b"/api/chat/completions", "root_path": "", "query_string": b"",
+             "headers": [(b"authorization", f"Bearer {token}".encode("ascii")),
+                         (b"content-type", b"application/json")],
+             "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8080), "state": {}}
+    results = {}
+    for name, app in bench_variants().items():
+        for _ in range(min(requests, 200)):
+            await time_request(app, scope)
+        samples: List[Dict] = []
+        for _ in range(0, requests, concurrency):
+            samples += await asyncio.gather(*(time_request(app, scope) for _ in range(concurrency)))
+        ttft = sorted(sample["ttft"] for sample in samples)
+        results[name] = {
+            "requests": len(samples),
+            "p50_us": round(ttft[len(ttft) // 2] * 1e6, 1),
+            "p95_us": round(ttft[min(len(ttft) - 1, int(len(ttft) * 0.95))] * 1e6, 1),
+            "chunks_per_response": min(sample["chunks"] for sample in samples)
+        }
+    return results
+
+
+def benchmark(requests: int = 5000, concurrency: int = 1) -> Dict:
+    """Time-to-first-token per middleware variant (in-process, no network)"""
+    return asyncio.run(run_benchmark(requests, concurrency))
+
+
+def print_benchmark(results: Dict):
+    baseline = results["no middleware"]
+    print(f"{'variant':32} {'p50 TTFT':>10} {'p95 TTFT':>10} {'vs none':>9} {'chunks':>7}")
+    for name, entry in results.items():
+        delta = entry["p50_us"] - baseline["p50_us"]
+        print(f"{name:32} {entry['p50_us']:>8.1f}us {entry['p95_us']:>8.1f}us "
+              f"{delta:>+7.1f}us {entry['chunks_per_response']:>4}/{BENCH_CHUNKS}")
+
+
+def main():
+    """Benchmark the middleware against the bare app"""
+    import sys
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for concurrency in (1, 50):
+        print(f"\n{requests} streamed requests, concurrency {concurrency}:")
+        print_benchmark(benchmark(requests, concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Bulk User Import
+================
+
+Streams users from large CSV or NDJSON files and checkpoints progress to a
+local journal so an interrupted import resumes where it stopped.
+
+CSV files need a header row; both formats use the same fields as the
+`users` entries in init/openwebui/config.json:
+
+    email,password,name,team,role
+    sarah.marketing@example.com,Marketing123!,Sarah Johnson,marketing,user
+
+The journal is an append-only file with one confirmed email per line, so it
+is cheap to write and tolerates a crash mid-line. Outcomes are folded into
+`ImportStats` as they arrive, so memory stays flat however large the file.
+"""
+
+import csv
+import json
+import os
+import random
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+REQUIRED_FIELDS = ("email", "password", "name")
+# Per-user results (with passwords) are only kept for lists this small
+DETAIL_LIMIT = 50
+# Latencies sampled for percentiles
+LATENCY_RESERVOIR = 4096
+
+
+def normalize_user(record: Dict, source: str) -> Dict:
+    """Validate a user record and fill in defaults"""
+    if not isinstance(record, dict):
+        raise ValueError(f"{source}: not a JSON object")
+    missing = [field for field in REQUIRED_FIELDS if not record.get(field)]
+    if missing:
+        raise ValueError(f"{source}: missing {', '.join(missing)}")
+    return {
+        "email": record["email"].strip(),
+        "password": record["password"],
+        "name": record["name"].strip(),
+        "team": (record.get("team") or "default").strip(),
+        "role": (record.get("role") or "user").strip()
+    }
+
+
+def iter_users(path: str, on_invalid: Optional[Callable[[str], None]] = None) -> Iterator[Dict]:
+    """Yield users from a CSV or NDJSON file without loading it into memory
+
+    An invalid row raises ValueError, or with `on_invalid` is reported to it
+    and skipped, so one bad row doesn't end the import.
+    """
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = ((f"{path}:{line_no}", record)
+                    for line_no, record in enumerate(csv.DictReader(f), start=2))
+        else:
+            rows = ((f"{path}:{line_no}", line) for line_no, line in enumerate(f, start=1)
+                    if line.strip())
+        for source, row in rows:
+            try:
+                if isinstance(row, str):
+                    try:
+                        row = json.loads(row)
+                    except ValueError:
+                        raise ValueError(f"{source}: invalid JSON") from None
+                user = normalize_user(row, source)
+            except ValueError as e:
+                if on_invalid is None:
+                    raise
+                on_invalid(str(e))
+                continue
+            yield user
+
+
+class ImportJournal:
+    """Append-only record of users confirmed by Open WebUI"""
+
+    def __init__(self, path: str, sync_every: int = 100):
+        self.path = path
+        self.sync_every = sync_every
+        self.done: Set[str] = set()
+        self._pending_sync = 0
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                # A torn last line from a crash is simply not counted
+                self.done = {line.strip().lower() for line in f if line.endswith("\n")}
+        self._file = open(path, "a", encoding="utf-8")
+        if self._file.tell() and not self._ends_with_newline():
+            # Start fresh after a torn line so the next entry isn't glued to it
+            self._file.write("\n")
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def __contains__(self, email: str) -> bool:
+        return email.lower() in self.done
+
+    def record(self, email: str):
+        """Mark a user as confirmed"""
+        with self._lock:
+            self.done.add(email.lower())
+            self._file.write(email + "\n")
+            self._file.flush()
+            self._pending_sync += 1
+            if self._pending_sync >= self.sync_every:
+                os.fsync(self._file.fileno())
+                self._pending_sync = 0
+
+    def close(self):
+        """Flush everything to disk"""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+class ImportStats:
+    """Running totals of an import: counts per status and team, latency
+
+    Only the first DETAIL_LIMIT results are kept whole (small inline lists
+    print their accounts); past that they are dropped and only counts
+    remain. Latency percentiles come from a fixed-size random reservoir.
+    """
+
+    def __init__(self, detail_limit: int = DETAIL_LIMIT, reservoir: int = LATENCY_RESERVOIR):
+        self.detail_limit = detail_limit
+        self.reservoir = reservoir
+        self.total = 0
+        self.invalid = 0
+        self.statuses: Dict[str, int] = {}
+        self.teams: Dict[str, Dict[str, int]] = {}
+        self.latencies: List[float] = []
+        self.max_latency_ms = 0.0
+        self.timed = 0
+        self.details: Optional[List[Dict]] = []
+        self._lock = threading.Lock()
+
+    def add(self, result: Dict):
+        status = result["status"]
+        with self._lock:
+            self.total += 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            team = self.teams.setdefault(result.get("team", "default"), {})
+            team[status] = team.get(status, 0) + 1
+            if result.get("attempts"):
+                self._sample(result["latency_ms"])
+            if self.details is not None:
+                if len(self.details) < self.detail_limit:
+                    self.details.append(result)
+                else:
+                    self.details = None
+
+    def reject(self):
+        """Count an input row that wasn't a valid user as failed"""
+        with self._lock:
+            self.total += 1
+            self.invalid += 1
+            self.statuses["failed"] = self.statuses.get("failed", 0) + 1
+
+    def _sample(self, latency_ms: float):
+        self.timed += 1
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        if len(self.latencies) < self.reservoir:
+            self.latencies.append(latency_ms)
+        else:
+            slot = random.randrange(self.timed)
+            if slot < self.reservoir:
+                self.latencies[slot] = latency_ms
+
+    def count(self, status: str) -> int:
+        return self.statuses.get(status, 0)
+
+    def percentile(self, fraction: float) -> float:
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
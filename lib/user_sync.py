@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Keycloak → Open WebUI User Sync
+===============================
+
+Makes Keycloak the single source of users: the realm's users and team
+groups are mirrored into Open WebUI accounts and groups.
+
+- Keycloak is read in pages: users once, memberships once per group (see
+  keycloak_admin). Open WebUI users and groups are listed once each.
+- Every Keycloak user gets a fingerprint of what is synced (email, name,
+  role, enabled, teams). Fingerprints are stored in a small local state
+  file next to the Keycloak → Open WebUI id mapping, so a re-sync only
+  writes users whose fingerprint changed or whose Open WebUI row drifted.
+- Changes are creates, updates and deactivations. Disabled or deleted
+  Keycloak users are deactivated by setting their Open WebUI role to
+  "pending"; nothing is ever deleted. Only users this sync created or
+  adopted (by email) are touched, and `protected` emails never are.
+
+Accounts created here get a random password: people sign in through
+Keycloak SSO, and Open WebUI merges the OAuth login into the account by
+email (OAUTH_MERGE_ACCOUNTS_BY_EMAIL=true).
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import requests
+
+from http_client import create_client
+from keycloak_admin import KeycloakAdmin
+from provisioning_compiler import CACHE_DIR
+from rate_limiter import AdaptiveRateLimiter, is_throttle_status, retry_after_seconds
+from tracing import in_current_context, span
+
+DEFAULT_STATE_PATH = os.path.join(CACHE_DIR, "keycloak-user-sync.json")
+DEACTIVATED_ROLE = "pending"
+
+
+def fingerprint(user: Dict) -> str:
+    """Stable hash of the synced fields of one user"""
+    payload = json.dumps({key: user[key] for key in ("email", "name", "role", "enabled", "teams")},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def keycloak_users(admin: KeycloakAdmin, realm: str, admin_role: str = "admin",
+                   skipped: Optional[List[str]] = None) -> Dict[str, Dict]:
+    """Desired Open WebUI users, keyed by Keycloak user id
+
+    Users without an email can't sign in to Open WebUI; their usernames are
+    appended to `skipped` instead.
+    """
+    users = {}
+    for user in admin.users(realm):
+        if user.get("email"):
+            users[user["id"]] = user
+        elif skipped is not None:
+            skipped.append(user.get("username") or user["id"])
+    groups = list(admin.groups(realm))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        members = dict(zip(
+            [group["name"] for group in groups],
+            pool.map(in_current_context(
+                lambda group: {m["id"] for m in admin.group_members(realm, group["id"])}), groups)
+        ))
+        try:
+            admins = {u["id"] for u in admin.role_users(realm, admin_role)}
+        except requests.exceptions.HTTPError:
+            admins = set()
+
+    desired = {}
+    for user_id, user in users.items():
+        name = " ".join(part for part in (user.get("firstName"), user.get("lastName")) if part)
+        desired[user_id] = {
+            "email": user["email"].lower(),
+            "name": name or user.get("username") or user["email"],
+            "role": "admin" if user_id in admins else "user",
+            "enabled": user.get("enabled", True),
+            "teams": sorted(team for team, ids in members.items() if user_id in ids)
+        }
+    return desired
+
+
+class SyncState:
+    """Keycloak id → Open WebUI id and fingerprint, kept on local disk"""
+
+    def __init__(self, path: str = DEFAULT_STATE_PATH):
+        self.path = path
+        try:
+            with open(path, "r") as f:
+                self.users: Dict[str, Dict] = json.load(f).get("users", {})
+        except (OSError, ValueError):
+            self.users = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"users": self.users, "synced_at": int(time.time())}, f)
+        os.replace(tmp, self.path)
+
+
+class OpenWebUIAdmin:
+    """The few Open WebUI admin endpoints the sync needs, with pacing and retries"""
+
+    def __init__(self, base_url: str, token: str, limiter: Optional[AdaptiveRateLimiter] = None,
+                 max_attempts: int = 6):
+        self.base_url = base_url.rstrip("/")
+        # The limiter owns status retries; the client only retries connects
+        self.session = create_client(retry_statuses=(),
+                                     headers={"Authorization": f"Bearer {token}"})
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.max_attempts = max_attempts
+
+    def call(self, method: str, path: str, body: Optional[Dict] = None, timeout: float = 30.0):
+        """One API call, backing off on 429/5xx"""
+        for attempt in range(1, self.max_attempts + 1):
+            self.limiter.acquire()
+            response = self.session.request(method, f"{self.base_url}{path}", json=body,
+                                            timeout=timeout)
+            if is_throttle_status(response.status_code) and attempt < self.max_attempts:
+                self.limiter.on_throttle(retry_after_seconds(response.headers.get("Retry-After")))
+                continue
+            response.raise_for_status()
+            self.limiter.on_success()
+            return response.json()
+
+    def list_users(self) -> List[Dict]:
+        data = self.call("GET", "/api/v1/users/all", timeout=120)
+        return data.get("users", []) if isinstance(data, dict) else data
+
+    def create_user(self, user: Dict) -> Dict:
+        return self.call("POST", "/api/v1/auths/add", {
+            "name": user["name"],
+            "email": user["email"],
+            "password": secrets.token_urlsafe(24),
+            "role": user["role"]
+        })
+
+    def update_user(self, row: Dict, user: Dict, role: str) -> Dict:
+        return self.call("POST", f"/api/v1/users/{row['id']}/update", {
+            "name": user["name"],
+            "email": user["email"],
+            "role": role,
+            "profile_image_url": row.get("profile_image_url") or "/user.png"
+        })
+
+    def list_groups(self) -> List[Dict]:
+        return self.call("GET", "/api/v1/groups/")
+
+    def create_group(self, name: str) -> Dict:
+        return self.call("POST", "/api/v1/groups/create",
+                         {"name": name, "description": f"{name} team (synced from Keycloak)"})
+
+    def change_group_users(self, group_id: str, action: str, user_ids: List[str]):
+        self.call("POST", f"/api/v1/groups/id/{group_id}/users/{action}", {"user_ids": user_ids})
+
+
+def plan_sync(desired: Dict[str, Dict], rows: Iterable[Dict], state: SyncState,
+              protected: Iterable[str] = ()) -> Dict[str, List]:
+    """Decide which users to create, update or deactivate"""
+    rows = list(rows)
+    by_id = {row["id"]: row for row in rows}
+    by_email = {row["email"].lower(): row for row in rows if row.get("email")}
+    protected = {email.lower() for email in protected}
+    plan = {"create": [], "update": [], "deactivate": [], "unchanged": 0}
+
+    for kc_id, user in desired.items():
+        if user["email"] in protected:
+            continue
+        entry = state.users.get(kc_id)
+        row = by_id.get(entry["webui_id"]) if entry else None
+        row = row or by_email.get(user["email"])
+        target_role = user["role"] if user["enabled"] else DEACTIVATED_ROLE
+        fp = fingerprint(user)
+
+        if row is None:
+            if user["enabled"]:
+                plan["create"].append((kc_id, user))
+            continue
+        drifted = (row.get("name") != user["name"] or row.get("email", "").lower() != user["email"]
+                   or row.get("role") != target_role)
+        if entry is None or entry["fingerprint"] != fp or entry["webui_id"] != row["id"] or drifted:
+            action = "update" if user["enabled"] else "deactivate"
+            plan[action].append((kc_id, user, row))
+        else:
+            plan["unchanged"] += 1
+
+    # Users this sync manages that are gone from Keycloak
+    for kc_id, entry in state.users.items():
+        if kc_id in desired:
+            continue
+        row = by_id.get(entry["webui_id"])
+        if row and row.get("role") != DEACTIVATED_ROLE and row["email"].lower() not in protected:
+            gone = {"email": row["email"].lower(), "name": row.get("name", ""), "role": "user",
+                    "enabled": False, "teams": []}
+            plan["deactivate"].append((kc_id, gone, row))
+    return plan
+
+
+def sync_users(kc_admin: KeycloakAdmin, realm: str, webui: OpenWebUIAdmin,
+               state: Optional[SyncState] = None, protected: Iterable[str] = (),
+               admin_role: str = "admin", dry_run: bool = False,
+               concurrency: int = 8) -> Dict:
+    """One sync pass; returns counts, failures and timings"""
+    state = state or SyncState()
+    timings = {}
+
+    start = time.perf_counter()
+    skipped = []
+    with span("sync.read") as record:
+        desired = keycloak_users(kc_admin, realm, admin_role, skipped)
+        rows = webui.list_users()
+        if record is not None:
+            record.set("sync.keycloak_users", len(desired))
+            record.set("sync.openwebui_users", len(rows))
+    timings["read_ms"] = (time.perf_counter() - start) * 1000
+
+    plan = plan_sync(desired, rows, state, protected)
+    result = {
+        "keycloak_users": len(desired),
+        "created": len(plan["create"]),
+        "updated": len(plan["update"]),
+        "deactivated": len(plan["deactivate"]),
+        "unchanged": plan["unchanged"],
+        "failed": [],
+        "skipped": skipped,
+        "dry_run": dry_run
+    }
+    if dry_run:
+        result["timings_ms"] = timings
+        return result
+
+    start = time.perf_counter()
+    synced = {}  # kc_id -> (user, webui row)
+
+    def apply(action, kc_id, user, row=None):
+        try:
+            if action == "create":
+                row = webui.create_user(user)
+            elif action == "update":
+                webui.update_user(row, user, user["role"])
+            else:
+                webui.update_user(row, user, DEACTIVATED_ROLE)
+            return kc_id, user, row, None
+        except requests.exceptions.RequestException as e:
+            return kc_id, user, row, str(e)
+
+    jobs = ([("create", kc_id, user) for kc_id, user in plan["create"]] +
+            [("update",) + job for job in plan["update"]] +
+            [("deactivate",) + job for job in plan["deactivate"]])
+    with span("sync.users", **{"sync.jobs": len(jobs)}), \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for kc_id, user, row, error in pool.map(in_current_context(lambda job: apply(*job)), jobs):
+            if error:
+                result["failed"].append({"email": user["email"], "error": error})
+            else:
+                synced[kc_id] = (user, row)
+    timings["users_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    try:
+        with span("sync.teams"):
+            sync_teams(webui, synced, state)
+    except requests.exceptions.RequestException as e:
+        # Leave the fingerprints alone so the next pass retries the teams
+        result["failed"].append({"email": "(teams)", "error": str(e)})
+        synced = {}
+    timings["teams_ms"] = (time.perf_counter() - start) * 1000
+
+    for kc_id, (user, row) in synced.items():
+        if kc_id in desired:
+            state.users[kc_id] = {"webui_id": row["id"], "email": user["email"],
+                                  "teams": user["teams"], "fingerprint": fingerprint(user)}
+        else:
+            state.users.pop(kc_id, None)
+    state.save()
+
+    result["timings_ms"] = timings
+    return result
+
+
+def sync_teams(webui: OpenWebUIAdmin, synced: Dict, state: SyncState):
+    """Move changed users between the Open WebUI groups named after their teams"""
+    adds: Dict[str, List[str]] = {}
+    removes: Dict[str, List[str]] = {}
+    for kc_id, (user, row) in synced.items():
+        previous = set(state.users.get(kc_id, {}).get("teams", []))
+        for team in user["teams"]:
+            # Adding is idempotent, so re-adding covers rows adopted by email
+            adds.setdefault(team, []).append(row["id"])
+        for team in previous - set(user["teams"]):
+            removes.setdefault(team, []).append(row["id"])
+    if not adds and not removes:
+        return
+
+    groups = {group["name"]: group for group in webui.list_groups()}
+    for team in sorted(set(adds) - set(groups)):
+        groups[team] = webui.create_group(team)
+
+    for team, user_ids in adds.items():
+        webui.change_group_users(groups[team]["id"], "add", user_ids)
+    for team, user_ids in removes.items():
+        if team in groups:
+            webui.change_group_users(groups[team]["id"], "remove", user_ids)
+
+
+def print_sync_result(result: Dict):
+    """Print a one-screen summary of a sync pass"""
+    prefix = "Would sync" if result["dry_run"] else "Synced"
+    print(f"{prefix} {result['keycloak_users']} Keycloak users: {result['created']} created, "
+          f"{result['updated']} updated, {result['deactivated']} deactivated, "
+          f"{result['unchanged']} unchanged")
+    if result.get("skipped"):
+        print(f"  ⚠ Skipped {len(result['skipped'])} Keycloak users without an email: "
+              + ", ".join(result["skipped"][:10]) + (" ..." if len(result["skipped"]) > 10 else ""))
+    for failure in result["failed"][:20]:
+        print(f"  ✗ {failure['email']}: {failure['error']}")
+    if len(result["failed"]) > 20:
+        print(f"  ... and {len(result['failed']) - 20} more failures")
+    timings = result.get("timings_ms", {})
+    if timings:
+        print("⏱ " + ", ".join(f"{name[:-3]} {ms:.0f}ms" for name, ms in timings.items()))
@@ -6,10 +6,16 @@ Generates reports showing which users are using which LLM providers
 
 import requests
 import json
+import os
 from collections import defaultdict
 from datetime import datetime
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from http_client import create_client
+from identity_token import identity_key, verify
+
 # Configuration
 JAEGER_URL = "http://localhost:16686/api/traces"
 SERVICE_NAME = "agentgateway"
@@ -25,7 +31,7 @@ def fetch_traces(lookback="24h", limit=1000):
     }
 
     try:
-        response = requests.get(JAEGER_URL, params=params, timeout=10)
+        response = create_client(pool_size=1).get(JAEGER_URL, params=params, timeout=10)
         response.raise_for_status()
         data = response.json()
         return data.get("data", [])
@@ -34,10 +40,16 @@ def fetch_traces(lookback="24h", limit=1000):
         print(f"   Make sure Jaeger is running at {JAEGER_URL}")
         sys.exit(1)
 
-def parse_traces(trace_data):
-    """Parse traces and extract user activity"""
+def parse_traces(trace_data, signing_key=None, require_signed=False):
+    """Parse traces and extract user activity
+
+    With a key, users are taken from verified X-User-Identity tokens; plain
+    X-User-Email headers are then only used when require_signed is off.
+    """
     user_stats = defaultdict(lambda: {
         "requests": 0,
+        "verified": 0,
+        "team": "",
         "providers": defaultdict(int),
         "methods": defaultdict(int),
         "total_duration_us": 0,
@@ -54,6 +66,7 @@ def parse_traces(trace_data):
             for span in trace.get("spans", []):
                 # Extract information from span tags
                 user_email = None
+                identity = None
                 provider = None
                 route_name = None
                 http_method = None
@@ -65,6 +78,8 @@ def parse_traces(trace_data):
 
                     if key == "http.header.x-user-email":
                         user_email = value
+                    elif key == "http.header.x-user-identity":
+                        identity = value
                     elif key == "route.name":
                         route_name = value
                         # Extract provider from route name (e.g., "anthropic-claude" -> "anthropic")
@@ -77,10 +92,22 @@ def parse_traces(trace_data):
                     elif key == "http.status":
                         http_status = value
 
+                # Tokens are checked against the span's own start time (microseconds)
+                claims = None
+                if signing_key and identity:
+                    claims = verify(identity, signing_key, now=span.get("startTime", 0) / 1e6)
+                if claims:
+                    user_email = claims.get("email") or claims["sub"]
+                elif require_signed:
+                    user_email = None
+
                 # Only process spans with user information
                 if user_email and user_email != "":
                     stats = user_stats[user_email]
                     stats["requests"] += 1
+                    if claims:
+                        stats["verified"] += 1
+                        stats["team"] = claims.get("team", "")
                     stats["total_duration_us"] += span.get("duration", 0)
 
                     if provider:
@@ -122,6 +149,10 @@ def print_report(user_stats, total_traces, lookback="24h"):
         print(f"{idx}. {user_email}")
         print(f"   {'─'*66}")
         print(f"   Total Requests:     {stats['requests']}")
+        if stats["verified"]:
+            print(f"   Verified Identity:  {stats['verified']}/{stats['requests']} requests")
+        if stats["team"]:
+            print(f"   Team:               {stats['team']}")
         print(f"   Avg Response Time:  {avg_duration_ms:.2f}ms")
         print(f"   Errors:             {stats['errors']} ({stats['errors']/stats['requests']*100:.1f}%)" if stats['requests'] > 0 else "   Errors:             0")
 
@@ -182,6 +213,11 @@ def main():
         default=1000,
         help="Maximum number of traces to fetch. Default: 1000"
     )
+    parser.add_argument(
+        "--require-signed",
+        action="store_true",
+        help="Only count requests with a valid signed X-User-Identity (needs AGW_IDENTITY_KEY)"
+    )
     parser.add_argument(
         "--json",
         action="store_true",
@@ -192,7 +228,11 @@ def main():
 
     # Fetch and parse traces
     trace_data = fetch_traces(lookback=args.lookback, limit=args.limit)
-    user_stats, total_traces = parse_traces(trace_data)
+    signing_key = identity_key()
+    if args.require_signed and not signing_key:
+        print("❌ --require-signed needs AGW_IDENTITY_KEY to verify identity tokens")
+        sys.exit(1)
+    user_stats, total_traces = parse_traces(trace_data, signing_key, args.require_signed)
 
     if args.json:
         # Output as JSON
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Offline Batch Queue
+===================
+
+Queues non-interactive chat completions (scheduled summaries,
+classification jobs) and sends them outside the interactive lane: as
+provider batches where a batch API is configured, otherwise through a
+throttled background lane that leaves most of each route's rate limit to
+users (lib/batch_queue.py). Results are looked up by request id.
+
+    python3 scripts/batch-queue.py submit --route /openai jobs.jsonl
+    python3 scripts/batch-queue.py run --once
+    python3 scripts/batch-queue.py status req_...
+    python3 scripts/batch-queue.py results --status done > results.jsonl
+
+Input lines are either a chat completion body or an OpenAI batch line
+(`{"custom_id": ..., "body": {...}}`); the custom_id becomes the request id.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+# lib/ at the repo root, or /app/lib in a container
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _lib_dir in (os.path.join(_HERE, "lib"), os.path.join(_HERE, "..", "lib")):
+    if os.path.isdir(_lib_dir):
+        sys.path.insert(0, _lib_dir)
+        break
+
+from batch_queue import (DEFAULT_DB, DEFAULT_GATEWAY, DEFAULT_LANE_RPM, BatchQueue, BatchWorker,
+                         batch_apis_from_env)
+from http_client import print_http_stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("AGW_BATCH_DB", DEFAULT_DB),
+        help=f"Queue database. Default: $AGW_BATCH_DB or {DEFAULT_DB}"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Queue requests from a JSONL file (- for stdin)")
+    submit.add_argument("file", help="JSONL of chat completion bodies or batch lines")
+    submit.add_argument("--route", required=True, help="Gateway route, e.g. /openai")
+
+    status = commands.add_parser("status", help="Show one request, or queue counts")
+    status.add_argument("id", nargs="?", help="Request id")
+
+    results = commands.add_parser("results", help="Print requests as JSONL")
+    results.add_argument("--status", choices=["queued", "sending", "submitted", "done", "failed"],
+                         help="Only requests in this state")
+
+    run = commands.add_parser("run", help="Work the queue")
+    run.add_argument(
+        "--gateway-url",
+        default=DEFAULT_GATEWAY,
+        help=f"AgentGateway base URL for the throttled lane. Default: {DEFAULT_GATEWAY}"
+    )
+    run.add_argument(
+        "--lane-rpm",
+        type=float,
+        default=DEFAULT_LANE_RPM,
+        help=f"Requests per minute per route for the throttled lane. Default: {DEFAULT_LANE_RPM:g}"
+    )
+    run.add_argument(
+        "--batch-api",
+        nargs="*",
+        metavar="ROUTE=BASE_URL",
+        help="Send this route's requests as provider batches, e.g. /openai=https://api.openai.com/v1 "
+             "(key from the route's *_API_KEY variable)"
+    )
+    run.add_argument(
+        "--poll-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between batch submissions/polls. Default: 60"
+    )
+    run.add_argument("--once", action="store_true", help="Exit when the queue is drained")
+    return parser.parse_args()
+
+
+def read_items(path: str):
+    handle = sys.stdin if path == "-" else open(path, "r")
+    try:
+        for number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "body" in item and isinstance(item["body"], dict):
+                yield item.get("custom_id"), item["body"]
+            else:
+                yield None, item
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def main():
+    args = parse_args()
+    queue = BatchQueue(args.db)
+    try:
+        if args.command == "submit":
+            ids = queue.submit_many(args.route, read_items(args.file))
+            for request_id in ids:
+                print(request_id)
+            print(f"✓ Queued {len(ids)} request(s) for {args.route}", file=sys.stderr)
+        elif args.command == "status":
+            if args.id:
+                record = queue.get(args.id)
+                if record is None:
+                    print(f"✗ No request {args.id}", file=sys.stderr)
+                    sys.exit(1)
+                print(json.dumps(record, indent=2))
+            else:
+                print(json.dumps(queue.counts(), indent=2, sort_keys=True))
+        elif args.command == "results":
+            for record in queue.results(args.status):
+                print(json.dumps(record))
+        elif args.command == "run":
+            worker = BatchWorker(queue, args.gateway_url, lane_rpm=args.lane_rpm,
+                                 batch_apis=batch_apis_from_env(args.batch_api))
+            try:
+                worker.run(poll_interval=args.poll_interval, once=args.once)
+            except KeyboardInterrupt:
+                worker.stop.set()
+            print(f"✓ Queue: {json.dumps(queue.counts(), sort_keys=True)}")
+            print_http_stats()
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
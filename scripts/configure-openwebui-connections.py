@@ -7,212 +7,71 @@ This script automatically configures API connections in Open WebUI
 by updating the database configuration.
 """
 
-import subprocess
-import json
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from model_discovery import discover, print_report
+from openwebui_provisioning import build_plan, execute, print_result
+from provisioning_compiler import compile_file
+from tracing import init as init_tracing
 
 CONTAINER_NAME = "open-webui"
+# Traces go to the stack's Jaeger (OTLP/HTTP), or to a local file if it is down
+OTLP_ENDPOINT = "http://localhost:4318"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rewrite the configuration even if nothing changed"
+    )
+    parser.add_argument(
+        "--discover",
+        action="store_true",
+        help="Discover models through each provider's /v1/models route"
+    )
+    parser.add_argument(
+        "--gateway-url",
+        default="http://localhost:3000",
+        help="Gateway URL used for discovery from this host. Default: http://localhost:3000"
+    )
+    return parser.parse_args()
 
-# Connections to configure
-CONNECTIONS = [
-    {
-        "name": "Anthropic (Claude)",
-        "url": "http://agentgateway:3000/anthropic/v1",
-        "api_key": "sk-anthropic",
-        "models": ["claude-haiku-4-5-20251001"]
-    },
-    {
-        "name": "OpenAI (GPT)",
-        "url": "http://agentgateway:3000/openai/v1",
-        "api_key": "sk-openai",
-        "models": ["gpt-5.2-2025-12-11"]
-    },
-    {
-        "name": "xAI (Grok)",
-        "url": "http://agentgateway:3000/xai/v1",
-        "api_key": "sk-xai",
-        "models": ["grok-4-latest"]
-    },
-    {
-        "name": "Gemini",
-        "url": "http://agentgateway:3000/gemini/v1",
-        "api_key": "sk-gemini",
-        "models": ["gemini-3-pro-preview"]
-    }
-]
 
 def main():
+    args = parse_args()
+    init_tracing("configure-openwebui-connections", endpoint=OTLP_ENDPOINT)
+
     print("="*70)
     print("Configuring Open WebUI Connections")
     print("="*70)
     print()
 
-    # Build the configuration
-    openai_api_base_urls = [conn["url"] for conn in CONNECTIONS]
-    openai_api_keys = [conn["api_key"] for conn in CONNECTIONS]
-
-    # Build models data
-    models_data = []
-    for i, conn_config in enumerate(CONNECTIONS):
-        for model in conn_config["models"]:
-            models_data.append({
-                "id": model,
-                "name": f"{conn_config['name']} - {model}",
-                "base_url": conn_config["url"],
-                "api_key_index": i
-            })
-
-    script = f"""
-import sqlite3
-import json
-import time
-
-conn = sqlite3.connect('/app/backend/data/webui.db')
-cursor = conn.cursor()
-
-# Get or create config
-cursor.execute('SELECT id, data FROM config')
-result = cursor.fetchone()
-
-if result:
-    config_id, config_data = result
-    data = json.loads(config_data)
-else:
-    config_id = 1
-    data = {{}}
-
-# Update config with connection settings
-data['ENABLE_OPENAI_API'] = True
-data['OPENAI_API_BASE_URLS'] = {json.dumps(openai_api_base_urls)}
-data['OPENAI_API_KEYS'] = {json.dumps(openai_api_keys)}
-
-# Configure openai section if it doesn't exist
-if 'openai' not in data:
-    data['openai'] = {{}}
-
-data['openai']['enable'] = True
-data['openai']['api_base_urls'] = {json.dumps(openai_api_base_urls)}
-data['openai']['api_keys'] = {json.dumps(openai_api_keys)}
-
-# THIS IS THE CRITICAL PART - Configure api_configs with model_ids
-data['openai']['api_configs'] = {{
-    '0': {{
-        'enable': True,
-        'tags': [],
-        'prefix_id': '',
-        'model_ids': ['claude-haiku-4-5-20251001'],
-        'connection_type': 'external',
-        'auth_type': 'bearer'
-    }},
-    '1': {{
-        'enable': True,
-        'tags': [],
-        'prefix_id': '',
-        'model_ids': ['gpt-5.2-2025-12-11'],
-        'connection_type': 'external',
-        'auth_type': 'bearer'
-    }},
-    '2': {{
-        'enable': True,
-        'tags': [],
-        'prefix_id': '',
-        'model_ids': ['grok-4-latest'],
-        'connection_type': 'external',
-        'auth_type': 'bearer'
-    }},
-    '3': {{
-        'enable': True,
-        'tags': [],
-        'prefix_id': '',
-        'model_ids': ['gemini-3-pro-preview'],
-        'connection_type': 'external',
-        'auth_type': 'bearer'
-    }}
-}}
-
-# Disable automatic model fetching to avoid errors
-data['ENABLE_MODEL_FILTER'] = False
-
-# Save back to database
-if result:
-    cursor.execute('UPDATE config SET data = ?, updated_at = datetime("now") WHERE id = ?',
-                   (json.dumps(data), config_id))
-else:
-    cursor.execute('INSERT INTO config (id, data, version, created_at, updated_at) VALUES (?, ?, 0, datetime("now"), datetime("now"))',
-                   (config_id, json.dumps(data)))
-
-conn.commit()
-
-print("✓ Connection configuration added to database")
-print()
-print("Configured URLs:")
-for url in data['OPENAI_API_BASE_URLS']:
-    print(f"  • {{url}}")
-print()
-
-# Add models to the model table
-models_data = {json.dumps(models_data)}
-timestamp = int(time.time())
-
-print("Adding models to database...")
-models_added = 0
-
-for model_data in models_data:
-    model_id = model_data['id']
-    model_name = model_data['name']
-    base_url = model_data['base_url']
-    api_key_idx = model_data['api_key_index']
-
-    # Check if model already exists
-    cursor.execute('SELECT id FROM model WHERE id = ?', (model_id,))
-    if cursor.fetchone():
-        print(f"  • Model {{model_id}} already exists, skipping")
-        continue
-
-    # Create model entry with proper meta and params
-    meta = json.dumps({{
-        "profile_image_url": "/static/favicon.png",
-        "description": f"{{model_name}} via AgentGateway",
-        "capabilities": {{}},
-        "position": models_added
-    }})
-
-    params = json.dumps({{
-        "api_base_url": base_url,
-        "api_key": data['OPENAI_API_KEYS'][api_key_idx],
-        "stream": True
-    }})
-
-    # Insert model - use empty string for user_id to make it system-wide
-    cursor.execute('''
-        INSERT INTO model (id, user_id, base_model_id, name, meta, params, created_at, updated_at, is_active, access_control)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (model_id, '', model_id, model_name, meta, params, timestamp, timestamp, 1, json.dumps({{"read": {{"group_ids": [], "user_ids": []}}, "write": {{"group_ids": [], "user_ids": []}}}})))
-
-    models_added += 1
-    print(f"  • Added model: {{model_name}}")
-
-conn.commit()
-print()
-print(f"✓ Added {{models_added}} new models to database")
-
-conn.close()
-"""
-
     print("Adding connection configurations to database...")
     print()
 
-    result = subprocess.run(
-        ["docker", "exec", CONTAINER_NAME, "python3", "-c", script],
-        capture_output=True,
-        text=True
-    )
+    # Connections and default models come from agentgateway.yaml
+    connections = compile_file()
 
-    print(result.stdout)
+    if args.discover:
+        print("Discovering models through AgentGateway...")
+        connections, reports = discover(connections, gateway_url=args.gateway_url)
+        print_report(reports)
+        print()
+
+    result = execute(build_plan(connections, force=args.force), CONTAINER_NAME)
+    print_result(result)
 
-    if result.returncode != 0:
-        print("Errors:")
-        print(result.stderr)
+    if "error" not in result and not result["changed"]:
+        print()
+        print("Nothing changed - no Open WebUI restart needed.")
         print()
+        return
 
     print()
     print("="*70)
@@ -231,7 +90,7 @@ conn.close()
     print("4. The models should now be available in the model selector")
     print()
     print("Models configured:")
-    for conn in CONNECTIONS:
+    for conn in connections:
         print(f"  • {conn['name']}")
         for model in conn['models']:
             print(f"    - {model}")
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+AgentGateway Caching Proxy
+==========================
+
+Runs the gateway proxy (lib/gateway_proxy.py) between Open WebUI and
+AgentGateway, with the response cache in front of the AI routes,
+identical in-flight requests coalesced into one upstream call, optional
+hedging and failover between equivalent models on different providers,
+and optional per-user and per-team tokens-per-minute budgets. Point an
+OpenAI-compatible client at http://localhost:3010/<provider>/v1 instead of
+the gateway, or at http://localhost:3010/v1 for every provider's models
+in one merged, cached list; metrics are served on /metrics.
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+
+# lib/ at the repo root, or /app/lib in the gateway-proxy container
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _lib_dir in (os.path.join(_HERE, "lib"), os.path.join(_HERE, "..", "lib")):
+    if os.path.isdir(_lib_dir):
+        sys.path.insert(0, _lib_dir)
+        break
+
+from gateway_proxy import DEFAULT_LISTEN, GatewayProxy
+from model_catalog import DEFAULT_TTL as MODELS_TTL, ModelCatalog
+from provisioning_compiler import GATEWAY_CONFIG, compile_file
+from response_cache import DEFAULT_MAX_BYTES, DEFAULT_TTL, ResponseCache
+from route_hedging import HedgedRouter, load_groups
+from singleflight import Coalescer
+from token_budget import TokenBudget
+from usage_tap import UsageStore, UsageTap
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--listen",
+        default=f"{DEFAULT_LISTEN[0]}:{DEFAULT_LISTEN[1]}",
+        help=f"Address to listen on. Default: {DEFAULT_LISTEN[0]}:{DEFAULT_LISTEN[1]}"
+    )
+    parser.add_argument(
+        "--upstream",
+        default=os.environ.get("AGW_PROXY_UPSTREAM", "http://localhost:3000"),
+        help="AgentGateway base URL. Default: http://localhost:3000"
+    )
+    parser.add_argument(
+        "--gateway-config",
+        default=GATEWAY_CONFIG,
+        help="agentgateway.yaml listing the providers for /v1/models. Default: $AGENTGATEWAY_CONFIG"
+    )
+    parser.add_argument(
+        "--models-ttl",
+        type=float,
+        default=MODELS_TTL,
+        help=f"Seconds a provider's model listing counts as fresh. Default: {MODELS_TTL:g}"
+    )
+    parser.add_argument(
+        "--no-model-catalog",
+        action="store_true",
+        help="Forward /v1/models instead of serving the merged catalog"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable the response cache"
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_TTL,
+        help=f"Seconds a cached response stays valid. Default: {DEFAULT_TTL}"
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help=f"Cache size bound in MiB. Default: {DEFAULT_MAX_BYTES // (1024 * 1024)}"
+    )
+    parser.add_argument(
+        "--cache-max-temperature",
+        type=float,
+        default=0.0,
+        help="Highest temperature still treated as deterministic. Default: 0"
+    )
+    parser.add_argument(
+        "--no-coalesce",
+        action="store_true",
+        help="Send identical concurrent requests upstream separately"
+    )
+    parser.add_argument(
+        "--coalesce-all",
+        action="store_true",
+        help="Also coalesce sampled (temperature > max) completions"
+    )
+    parser.add_argument(
+        "--model-groups",
+        default=os.environ.get("AGW_MODEL_GROUPS") or None,
+        help="JSON file of equivalent models across routes; enables hedging and failover. "
+             "Default: $AGW_MODEL_GROUPS"
+    )
+    parser.add_argument(
+        "--hedge-after",
+        type=float,
+        default=2.0,
+        help="Seconds to wait for a route's first token before hedging, until its p95 is known. "
+             "Default: 2"
+    )
+    parser.add_argument(
+        "--breaker-error-rate",
+        type=float,
+        default=0.5,
+        help="Error rate over a route's last 20 requests that opens its breaker. Default: 0.5"
+    )
+    parser.add_argument(
+        "--breaker-cooldown",
+        type=float,
+        default=30.0,
+        help="Seconds an open breaker waits before letting a probe through. Default: 30"
+    )
+    parser.add_argument(
+        "--user-tpm",
+        type=int,
+        default=int(os.environ.get("AGW_USER_TPM", 0)),
+        help="Tokens per minute per user (0 = unlimited). Default: $AGW_USER_TPM or 0"
+    )
+    parser.add_argument(
+        "--team-tpm",
+        type=int,
+        default=int(os.environ.get("AGW_TEAM_TPM", 0)),
+        help="Tokens per minute per team (0 = unlimited). Default: $AGW_TEAM_TPM or 0"
+    )
+    parser.add_argument(
+        "--anonymous-tpm",
+        type=int,
+        default=0,
+        help="Tokens per minute shared by requests without a user (0 = unlimited)"
+    )
+    parser.add_argument(
+        "--budgets",
+        help='JSON file with per-user/team TPM overrides: {"users": {...}, "teams": {...}}'
+    )
+    parser.add_argument(
+        "--budget-state",
+        help="File to keep token buckets in across restarts"
+    )
+    parser.add_argument(
+        "--usage-db",
+        default=os.environ.get("AGW_USAGE_DB") or None,
+        help="SQLite file to record per-user, per-model token usage in. Default: $AGW_USAGE_DB (off)"
+    )
+    return parser.parse_args()
+
+
+def build_proxy(args) -> GatewayProxy:
+    proxy = GatewayProxy(args.upstream)
+    # Outermost: unprefixed completions are routed before anything keys on the path
+    if not args.no_model_catalog:
+        connections = compile_file(args.gateway_config, gateway_url=args.upstream)
+        proxy.add_layer(ModelCatalog(connections, ttl=args.models_ttl))
+    if not args.no_cache:
+        proxy.add_layer(ResponseCache(ttl=args.cache_ttl, max_bytes=args.cache_max_mb * 1024 * 1024,
+                                      max_temperature=args.cache_max_temperature))
+    # Inside the cache, so a burst of misses for one prompt makes one upstream call
+    if not args.no_coalesce:
+        proxy.add_layer(Coalescer(coalesce_all=args.coalesce_all,
+                                  max_temperature=args.cache_max_temperature))
+    # Inside cache and coalescer, so only requests that reach a provider spend budget;
+    # outside hedging, so a budget 429 never counts against a route's health and a
+    # hedged request is charged once
+    if args.user_tpm or args.team_tpm or args.anonymous_tpm or args.budgets:
+        overrides = {}
+        if args.budgets:
+            with open(args.budgets, "r") as f:
+                overrides = json.load(f)
+        proxy.add_layer(TokenBudget(args.user_tpm, args.team_tpm, args.anonymous_tpm,
+                                    overrides=overrides, state_path=args.budget_state))
+    # Inside the coalescer, so a shared request is hedged once
+    if args.model_groups:
+        proxy.add_layer(HedgedRouter(load_groups(args.model_groups), default_hedge=args.hedge_after,
+                                     error_threshold=args.breaker_error_rate,
+                                     cooldown=args.breaker_cooldown))
+    # Inside cache and coalescer: only tokens a provider actually served are recorded
+    if args.usage_db:
+        proxy.add_layer(UsageTap(UsageStore(args.usage_db)))
+    return proxy
+
+
+def main():
+    args = parse_args()
+    host, _, port = args.listen.rpartition(":")
+    proxy = build_proxy(args)
+    server = proxy.serve(host or DEFAULT_LISTEN[0], int(port))
+    # `docker stop` sends SIGTERM; exit through the finally below so usage and budgets are saved
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"✓ Proxying http://{args.listen} → {args.upstream}"
+          f" (cache {'off' if args.no_cache else 'on'}, "
+          f"coalescing {'off' if args.no_coalesce else 'on'}, "
+          f"hedging {'on' if args.model_groups else 'off'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        proxy.close()
+
+
+if __name__ == "__main__":
+    main()
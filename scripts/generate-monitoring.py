@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Monitoring Generator
+====================
+
+Generates the cost monitoring from one model price catalog
+(monitoring/prices.yaml):
+
+- Prometheus recording rules (monitoring/prometheus/rules/) that
+  precompute per-route/model token, request and cost series once a minute.
+- The Grafana dashboards' usage and cost panels, rewritten to query those
+  recorded series instead of summing raw AgentGateway series with prices
+  pasted into every expression. Latency and token percentile panels need
+  histogram buckets and keep querying the raw series.
+
+    python3 scripts/generate-monitoring.py           # write rules and dashboards
+    python3 scripts/generate-monitoring.py --check   # exit 1 if anything is stale
+
+Dashboards are edited in place: only the expressions and legends of the
+panels listed below change, so hand edits to layout and styling survive.
+"""
+
+import argparse
+import copy
+import json
+import os
+import re
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import yaml
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_CATALOG = os.path.join(_ROOT, "monitoring", "prices.yaml")
+DEFAULT_RULES = os.path.join(_ROOT, "monitoring", "prometheus", "rules", "agentgateway-cost.rules.yml")
+DEFAULT_DASHBOARDS = os.path.join(_ROOT, "monitoring", "grafana", "dashboards")
+GLOBAL_DASHBOARD = "global-cost-dashboard.json"
+
+RULE_GROUP = "agentgateway_gen_ai"
+RULE_INTERVAL = "1m"
+RATE_WINDOW = "5m"
+# One increase per evaluation, so consecutive samples cover consecutive minutes
+# and sum_over_time() of them is the total over any range
+INCREASE_WINDOW = RULE_INTERVAL
+TOKEN_TYPES = ("input", "output")
+
+# Raw AgentGateway series
+TOKENS = "agentgateway_gen_ai_client_token_usage_sum"
+REQUESTS = "agentgateway_gen_ai_server_request_duration_count"
+DURATION = "agentgateway_gen_ai_server_request_duration_sum"
+
+# Recorded series, labeled provider, route and gen_ai_request_model
+# (token and cost series also gen_ai_token_type)
+TOKEN_RATE = "route_model:agentgateway_gen_ai_tokens:rate5m"
+TOKEN_INCREASE = "route_model:agentgateway_gen_ai_tokens:increase1m"
+COST_RATE = "route_model:agentgateway_gen_ai_cost_usd:rate5m"
+COST_INCREASE = "route_model:agentgateway_gen_ai_cost_usd:increase1m"
+REQUEST_RATE = "route_model:agentgateway_gen_ai_requests:rate5m"
+REQUEST_INCREASE = "route_model:agentgateway_gen_ai_requests:increase1m"
+DURATION_RATE = "route_model:agentgateway_gen_ai_request_duration_seconds:rate5m"
+
+# Panel id -> (expression, legend or None). `{sel}` is the target's provider
+# (and token type, if its expression selects one); legends may use {title},
+# {type} and {price}, the provider's default price per 1M tokens.
+RANGE_TOTAL = "sum(sum_over_time({series}{{sel}}[$__range]))"
+LATENCY_MS = f"sum({DURATION_RATE}{{sel}}) / sum({REQUEST_RATE}{{sel}}) * 1000"
+GLOBAL_PANELS = {
+    2: (f"sum(sum_over_time({COST_INCREASE}[$__range]))", None),
+    3: (RANGE_TOTAL.format(series=COST_INCREASE), None),
+    4: (RANGE_TOTAL.format(series=COST_INCREASE), None),
+    5: (RANGE_TOTAL.format(series=COST_INCREASE), None),
+    6: (RANGE_TOTAL.format(series=COST_INCREASE), None),
+    7: (RANGE_TOTAL.format(series=COST_INCREASE), None),
+    8: (f"sum({COST_RATE}{{sel}})", None),
+    11: (f"sum({REQUEST_RATE}{{sel}})", None),
+    12: (LATENCY_MS, None),
+    21: (f"sum({COST_RATE}{{sel}})", "{title} {type} (${price}/M tokens)"),
+    22: (LATENCY_MS, None),
+    23: (RANGE_TOTAL.format(series=REQUEST_INCREASE), None),
+    31: (f"sum({TOKEN_RATE}{{sel}})", None),
+    32: (RANGE_TOTAL.format(series=TOKEN_INCREASE), None),
+    33: (RANGE_TOTAL.format(series=TOKEN_INCREASE), None),
+}
+PROVIDER_PANELS = {
+    401: (RANGE_TOTAL.format(series=REQUEST_INCREASE), None),
+    402: (f"sum by (gen_ai_request_model) ({REQUEST_RATE}{{sel}})", None),
+    403: (LATENCY_MS, None),
+    404: (RANGE_TOTAL.format(series=TOKEN_INCREASE), None),
+    406: (f"sum by (gen_ai_request_model, gen_ai_token_type) ({TOKEN_RATE}{{sel}})", None),
+    412: (f"sum by (gen_ai_request_model) ({COST_RATE}{{sel}})",
+          "{type} Cost - {{{{gen_ai_request_model}}}} (~${price}/M tokens)"),
+}
+
+HEADER = """\
+# Generated by scripts/generate-monitoring.py from monitoring/prices.yaml.
+# Do not edit: change the price catalog and re-run the generator.
+#
+# {token_rate:66} tokens/s
+# {token_increase:66} tokens in the last minute
+# {cost_rate:66} USD/s
+# {cost_increase:66} USD in the last minute
+# {request_rate:66} requests/s
+# {request_increase:66} requests in the last minute
+# {duration_rate:66} request seconds/s
+#
+# Totals over a range are sum_over_time() of the increase1m series. Those are
+# not counters: never apply rate() or increase() to them.
+"""
+
+
+def load_catalog(path: str) -> Dict[str, Dict]:
+    """Providers from the price catalog, validated"""
+    with open(path, "r") as f:
+        data = yaml.safe_load(f) or {}
+    providers = data.get("providers")
+    if not isinstance(providers, dict) or not providers:
+        raise ValueError(f"{path}: no providers")
+    for name, provider in providers.items():
+        if not re.fullmatch(r"[a-z0-9_]+", name):
+            raise ValueError(f"{path}: provider name {name!r} must be a lowercase label value")
+        for field in ("route", "input", "output"):
+            if field not in provider:
+                raise ValueError(f"{path}: {name} has no {field}")
+        provider.setdefault("title", name)
+        provider["models"] = provider.get("models") or {}
+        for model, prices in provider["models"].items():
+            for token_type in TOKEN_TYPES:
+                if token_type not in prices:
+                    raise ValueError(f"{path}: {name} model {model} has no {token_type} price")
+    return providers
+
+
+def per_token(price: float) -> str:
+    """PromQL literal for a price per 1M tokens, per token"""
+    return f"{price / 1e6:.10g}"
+
+
+def display_price(price: float) -> str:
+    """3 -> '3', 0.6 -> '0.60', 0.075 -> '0.075'"""
+    if price == int(price):
+        return str(int(price))
+    return f"{price:.2f}" if round(price, 2) == price else f"{price:g}"
+
+
+def promql_regex(values: List[str]) -> str:
+    """Alternation matching exactly these values, escaped for a PromQL string"""
+    return "|".join(re.sub(r"([.+*?()\[\]{}^$|\\])", r"\\\\\1", value) for value in values)
+
+
+def rule(record: str, expr: str, labels: Optional[Dict[str, str]] = None) -> Dict:
+    entry = {"record": record, "expr": expr}
+    if labels:
+        # A copy per rule: shared dicts would be dumped as YAML anchors
+        entry["labels"] = dict(labels)
+    return entry
+
+
+def recording_rules(catalog: Dict[str, Dict]) -> List[Dict]:
+    """Usage series per provider, then cost series priced from them
+
+    Rules in a group run in order, so the cost rules see this evaluation's
+    usage series.
+    """
+    rules = []
+    for name, provider in catalog.items():
+        selector = f'{{route=~"{provider["route"]}"}}'
+        labels = {"provider": name}
+        by = "route, gen_ai_request_model"
+        rules += [
+            rule(TOKEN_RATE, f"sum by ({by}, gen_ai_token_type) "
+                             f"(rate({TOKENS}{selector}[{RATE_WINDOW}]))", labels),
+            rule(TOKEN_INCREASE, f"sum by ({by}, gen_ai_token_type) "
+                                 f"(increase({TOKENS}{selector}[{INCREASE_WINDOW}]))", labels),
+            rule(REQUEST_RATE, f"sum by ({by}) (rate({REQUESTS}{selector}[{RATE_WINDOW}]))", labels),
+            rule(REQUEST_INCREASE, f"sum by ({by}) "
+                                   f"(increase({REQUESTS}{selector}[{INCREASE_WINDOW}]))", labels),
+            rule(DURATION_RATE, f"sum by ({by}) (rate({DURATION}{selector}[{RATE_WINDOW}]))", labels),
+        ]
+    for name, provider in catalog.items():
+        models = provider["models"]
+        for token_type in TOKEN_TYPES:
+            matchers = f'provider="{name}", gen_ai_token_type="{token_type}"'
+            # Provider price for every model without its own entry
+            cases = [(matchers + (f', gen_ai_request_model!~"{promql_regex(list(models))}"'
+                                  if models else ""), provider[token_type])]
+            cases += [(matchers + f', gen_ai_request_model="{model}"', prices[token_type])
+                      for model, prices in models.items()]
+            for source, record in ((TOKEN_RATE, COST_RATE), (TOKEN_INCREASE, COST_INCREASE)):
+                rules += [rule(record, f"{source}{{{case}}} * {per_token(price)}")
+                          for case, price in cases]
+    return rules
+
+
+def render_rules(catalog: Dict[str, Dict]) -> str:
+    doc = {"groups": [{"name": RULE_GROUP, "interval": RULE_INTERVAL,
+                       "rules": recording_rules(catalog)}]}
+    header = HEADER.format(token_rate=TOKEN_RATE, token_increase=TOKEN_INCREASE, cost_rate=COST_RATE,
+                           cost_increase=COST_INCREASE, request_rate=REQUEST_RATE,
+                           request_increase=REQUEST_INCREASE, duration_rate=DURATION_RATE)
+    return header + "\n" + yaml.safe_dump(doc, sort_keys=False, width=1000)
+
+
+def target_provider(expr: str, catalog: Dict[str, Dict]) -> Optional[str]:
+    """Provider a panel target queries: a recorded provider label, or the raw
+    route regex / gen_ai_system the hand-written dashboards used"""
+    for name, provider in catalog.items():
+        if (f'provider="{name}"' in expr or f'gen_ai_system="{name}"' in expr
+                or f'route=~"{provider["route"]}"' in expr):
+            return name
+    return None
+
+
+def iter_panels(panels: List[Dict]) -> Iterator[Dict]:
+    for panel in panels:
+        yield panel
+        yield from iter_panels(panel.get("panels", []))
+
+
+def regenerate(dashboard: Dict, panels: Dict[int, Tuple[str, Optional[str]]],
+               catalog: Dict[str, Dict], source: str) -> Dict:
+    """A copy of the dashboard with the listed panels querying recorded series"""
+    updated = copy.deepcopy(dashboard)
+    for panel in iter_panels(updated.get("panels", [])):
+        spec = panels.get(panel.get("id"))
+        if spec is None:
+            continue
+        expr, legend = spec
+        for target in panel.get("targets", []):
+            old = target.get("expr", "")
+            name = target_provider(old, catalog)
+            if name is None and "{sel}" in expr:
+                raise ValueError(f"{source}: panel {panel['id']} target {target.get('refId')} "
+                                 f"matches no provider in the catalog")
+            # Summed input + output cost selects both types: keep all of them
+            token_types = set(re.findall(r'gen_ai_token_type="(\w+)"', old))
+            token_type = token_types.pop() if len(token_types) == 1 else None
+            matchers = [f'provider="{name}"']
+            if token_type:
+                matchers.append(f'gen_ai_token_type="{token_type}"')
+            target["expr"] = expr.format(sel="{" + ", ".join(matchers) + "}")
+            if legend and name and token_type:
+                provider = catalog[name]
+                target["legendFormat"] = legend.format(
+                    title=provider["title"], type=token_type.capitalize(),
+                    price=display_price(provider[token_type]))
+    return updated
+
+
+def string_changes(old, new, key=None) -> Iterator[Tuple[str, str, str]]:
+    """(key, old, new) for every changed string value, in document order"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        for k in old:
+            if k in new:
+                yield from string_changes(old[k], new[k], k)
+    elif isinstance(old, list) and isinstance(new, list):
+        for a, b in zip(old, new):
+            yield from string_changes(a, b, key)
+    elif isinstance(old, str) and old != new and key is not None:
+        yield key, old, new
+
+
+def patch_json(text: str, old: Dict, new: Dict) -> str:
+    """Apply string changes to the file text, keeping its hand formatting"""
+    cursor = 0
+    for key, before, after in string_changes(old, new):
+        needle = f"{json.dumps(key)}: {json.dumps(before)}"
+        index = text.find(needle, cursor)
+        if index < 0:
+            break
+        replacement = f"{json.dumps(key)}: {json.dumps(after)}"
+        text = text[:index] + replacement + text[index + len(needle):]
+        cursor = index + len(replacement)
+    else:
+        if json.loads(text) == new:
+            return text
+    return json.dumps(new, indent=2) + "\n"
+
+
+def outputs(catalog: Dict[str, Dict], rules_path: str, dashboards_dir: str) -> Dict[str, str]:
+    """Path -> generated content"""
+    generated = {rules_path: render_rules(catalog)}
+    dashboards = [(GLOBAL_DASHBOARD, GLOBAL_PANELS)]
+    dashboards += [(provider["dashboard"], PROVIDER_PANELS)
+                   for provider in catalog.values() if provider.get("dashboard")]
+    for filename, panels in dashboards:
+        path = os.path.join(dashboards_dir, filename)
+        if not os.path.exists(path):
+            print(f"⚠️  {path} not found, skipped", file=sys.stderr)
+            continue
+        with open(path, "r") as f:
+            text = f.read()
+        dashboard = json.loads(text)
+        generated[path] = patch_json(text, dashboard, regenerate(dashboard, panels, catalog, filename))
+    return generated
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG, help="Price catalog. Default: monitoring/prices.yaml")
+    parser.add_argument(
+        "--rules",
+        default=DEFAULT_RULES,
+        help="Recording rules file to write. Default: monitoring/prometheus/rules/agentgateway-cost.rules.yml"
+    )
+    parser.add_argument(
+        "--dashboards",
+        default=DEFAULT_DASHBOARDS,
+        help="Grafana dashboards directory. Default: monitoring/grafana/dashboards"
+    )
+    parser.add_argument("--check", action="store_true", help="Only report files that are out of date")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        catalog = load_catalog(args.catalog)
+        generated = outputs(catalog, args.rules, args.dashboards)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        print(f"✗ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    stale = []
+    for path, content in generated.items():
+        current = None
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                current = f.read()
+        if current == content:
+            continue
+        stale.append(os.path.relpath(path))
+        if not args.check:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+
+    if args.check:
+        for path in stale:
+            print(f"✗ {path} is out of date", file=sys.stderr)
+        if stale:
+            print("  Run: python3 scripts/generate-monitoring.py", file=sys.stderr)
+            sys.exit(1)
+        print("✓ Monitoring is up to date")
+    else:
+        for path in stale:
+            print(f"✓ Wrote {path}")
+        if not stale:
+            print("✓ Nothing to do")
+
+
+if __name__ == "__main__":
+    main()
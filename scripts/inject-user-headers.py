@@ -1,74 +1,127 @@
 #!/usr/bin/env python3
 """
-Middleware to inject user headers into Open WebUI requests
-This script adds user information to all outgoing API requests
+Inject User Headers into Open WebUI's Gateway Calls
+===================================================
+
+Open WebUI doesn't tell AgentGateway which user a chat request belongs to.
+lib/user_headers.py fixes that without rebuilding the image: a pure ASGI
+middleware resolves the signed-in user, and Open WebUI's HTTP clients add
+`X-User-Email` and `X-User-Id` to every request they send to the gateway.
+
+Enable it with the compose override (lib/ is already mounted into the
+open-webui container):
+
+    docker-compose -f docker-compose.yml -f docker-compose.user-headers.yml up -d open-webui
+
+This script checks whether the running container serves the wrapped app,
+and benchmarks the middleware's effect on time-to-first-token.
 """
 
+import argparse
+import json
 import os
+import subprocess
 import sys
 
-# Add this to Open WebUI's backend
-# In open-webui/backend/apps/webui/main.py or similar
-
-MIDDLEWARE_CODE = '''
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-import logging
-
-logger = logging.getLogger(__name__)
-
-class UserHeaderMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware to inject user information into outgoing API requests
-    """
-    async def dispatch(self, request: Request, call_next):
-        # Get user from request state (set by auth middleware)
-        user = getattr(request.state, "user", None)
-
-        if user:
-            # Add user headers for AgentGateway tracking
-            request.state.user_headers = {
-                "X-User-Email": getattr(user, "email", ""),
-                "X-User-Id": str(getattr(user, "id", "")),
-                "X-User-Name": getattr(user, "name", ""),
-                "X-User-Role": getattr(user, "role", "user")
-            }
-
-            logger.info(f"Adding user headers for: {user.email}")
-
-        response = await call_next(request)
-        return response
-
-# Add to your app startup
-# app.add_middleware(UserHeaderMiddleware)
-'''
-
-print("=" * 70)
-print("Open WebUI User Header Middleware")
-print("=" * 70)
-print()
-print("This middleware needs to be added to Open WebUI's backend code.")
-print()
-print("📝 Steps to add user tracking:")
-print()
-print("1. Add the middleware code to Open WebUI's backend")
-print("2. Modify the OpenAI client to include user headers")
-print("3. Restart Open WebUI")
-print()
-print("=" * 70)
-print()
-print("Middleware Code:")
-print("=" * 70)
-print(MIDDLEWARE_CODE)
-print()
-print("=" * 70)
-print()
-print("Alternative: Use environment variables")
-print("=" * 70)
-print()
-print("Since modifying Open WebUI code is complex, we can use a simpler approach:")
-print()
-print("1. Configure Open WebUI to pass user info in request body")
-print("2. Use AgentGateway's logging to extract user info")
-print("3. Use Jaeger to track by source IP (per-user containers)")
-print()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from openwebui_provisioning import BUNDLE_MOUNT, CONTAINER_NAME
+from user_headers import benchmark, print_benchmark
+
+OVERRIDE_FILE = "docker-compose.user-headers.yml"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--container",
+        default=CONTAINER_NAME,
+        help=f"Open WebUI container. Default: {CONTAINER_NAME}"
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Benchmark time-to-first-token with and without the middleware"
+    )
+    parser.add_argument(
+        "--in-container",
+        action="store_true",
+        help="Run the benchmark inside the container, to compare with BaseHTTPMiddleware"
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=5000,
+        help="Streamed requests per variant. Default: 5000"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=50,
+        help="Concurrent requests per variant. Default: 50"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output raw JSON benchmark results"
+    )
+    return parser.parse_args()
+
+
+def container_status(container: str) -> str:
+    """'enabled', 'disabled' or why it couldn't be checked"""
+    try:
+        result = subprocess.run(
+            ["docker", "exec", container, "sh", "-c", "cat /proc/[0-9]*/cmdline 2>/dev/null | tr '\\0' ' '"],
+            capture_output=True, text=True, timeout=15
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return f"unknown ({e})"
+    if result.returncode != 0:
+        return f"unknown ({result.stderr.strip() or 'container not running'})"
+    return "enabled" if "user_headers:app" in result.stdout else "disabled"
+
+
+def run_benchmark(args) -> dict:
+    if not args.in_container:
+        return benchmark(args.requests, args.concurrency)
+    code = ("import json, sys; sys.path.insert(0, %r); import user_headers; "
+            "print(json.dumps(user_headers.benchmark(%d, %d)))"
+            % (BUNDLE_MOUNT, args.requests, args.concurrency))
+    result = subprocess.run(["docker", "exec", args.container, "python3", "-c", code],
+                            capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "benchmark failed in the container")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+
+    if args.benchmark:
+        try:
+            results = run_benchmark(args)
+        except (OSError, subprocess.TimeoutExpired, RuntimeError) as e:
+            print(f"✗ Benchmark failed: {e}")
+            sys.exit(1)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            where = f"in {args.container}" if args.in_container else "locally"
+            print(f"⏱ Time to first streamed chunk, {args.requests} requests, "
+                  f"concurrency {args.concurrency}, {where}:\n")
+            print_benchmark(results)
+        return
+
+    status = container_status(args.container)
+    if status == "enabled":
+        print(f"✓ {args.container} adds X-User-Email / X-User-Id to gateway requests")
+        return
+    print(f"ℹ User headers in {args.container}: {status}")
+    print("  Enable them with:")
+    print(f"    docker-compose -f docker-compose.yml -f {OVERRIDE_FILE} up -d open-webui")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
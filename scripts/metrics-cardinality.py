@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Metrics Cardinality Analyzer
+============================
+
+Finds the labels that are growing AgentGateway's Prometheus series count
+before queries slow down, e.g. after adding user and team attribution:
+
+- Series come from Prometheus' series API (`/api/v1/series`), or, without a
+  Prometheus, from a local stand-in: the gateway's `/metrics` page or a
+  saved copy of it.
+- Labels of the matching metrics (`agentgateway_*` by default) are ranked
+  by series count, distinct values and growth (new values per day). Head
+  memory is estimated per label.
+- Growth compares the current series with an earlier window in Prometheus.
+  For the stand-in it compares with a snapshot saved by an earlier run
+  (`--save` / `--baseline`).
+- Labels with more than `--max-values` values, or growth that will take
+  them past it within `--horizon` days, get suggested
+  `metric_relabel_configs`. These keep each label's top values and drop the
+  long tail of series. They never merge series, because two scraped series
+  with the same labels would collide.
+
+    python3 scripts/metrics-cardinality.py
+    python3 scripts/metrics-cardinality.py --prometheus-url http://localhost:9090 --growth-window 7d
+    python3 scripts/metrics-cardinality.py --metrics-url http://localhost:15020/metrics --save snap.json
+    python3 scripts/metrics-cardinality.py --metrics-file metrics.txt --baseline snap.json
+
+The relabel suggestions go to stdout (or `--relabel-out`) as YAML for the
+matching job in monitoring/prometheus/prometheus.yml.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+# lib/ at the repo root, or /app/lib in a container
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _lib_dir in (os.path.join(_HERE, "lib"), os.path.join(_HERE, "..", "lib")):
+    if os.path.isdir(_lib_dir):
+        sys.path.insert(0, _lib_dir)
+        break
+
+import requests
+
+from http_client import create_client
+
+DEFAULT_PROMETHEUS = "http://localhost:9090"
+DEFAULT_PREFIX = "agentgateway_"
+DEFAULT_MAX_VALUES = 50
+DEFAULT_KEEP = 20
+DEFAULT_HORIZON = 30.0
+# Rule of thumb for a head-block series (index, postings, open chunks).
+# Real usage depends on label sizes and scrape interval; this is for ranking.
+BYTES_PER_SERIES = 3 * 1024
+# Labels every target carries; capping them is a scrape config change
+TARGET_LABELS = frozenset(("job", "instance"))
+
+SAMPLE_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+\S+")
+LABEL_PAIR = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+DURATION_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(text: str) -> float:
+    """Seconds from a Prometheus-style duration (30m, 24h, 7d)"""
+    match = DURATION.match(text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid duration {text!r}, e.g. 24h or 7d")
+    return float(match.group(1)) * DURATION_SECONDS[match.group(2)]
+
+
+def unescape(value: str) -> str:
+    return value.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\")
+
+
+def parse_exposition(text: str, prefix: str) -> List[Dict[str, str]]:
+    """Label sets (with __name__) of every sample in Prometheus text format"""
+    series, seen = [], set()
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE_LINE.match(line)
+        if not match or not match.group(1).startswith(prefix):
+            continue
+        labels = {name: unescape(value) for name, value in LABEL_PAIR.findall(match.group(2) or "")}
+        labels["__name__"] = match.group(1)
+        key = tuple(sorted(labels.items()))
+        if key not in seen:
+            seen.add(key)
+            series.append(labels)
+    return series
+
+
+def load_snapshot(path: str) -> Dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_snapshot(path: str, series: List[Dict[str, str]], taken_at: float):
+    with open(path, "w") as f:
+        json.dump({"taken_at": taken_at, "series": series}, f)
+
+
+class Prometheus:
+    """The parts of the Prometheus HTTP API the analyzer reads"""
+
+    def __init__(self, url: str, client: Optional[requests.Session] = None):
+        self.url = url.rstrip("/")
+        self.client = client or create_client(pool_size=1)
+
+    def get(self, path: str, params=None) -> Dict:
+        response = self.client.get(self.url + path, params=params, timeout=(3.05, 60.0))
+        response.raise_for_status()
+        body = response.json()
+        if body.get("status") != "success":
+            raise ValueError(f"{path}: {body.get('error', 'request failed')}")
+        return body["data"]
+
+    def series(self, prefix: str, start: float, end: float) -> List[Dict[str, str]]:
+        """Series of the prefixed metrics that had samples in [start, end]"""
+        matcher = '{__name__=~"%s.*"}' % re.escape(prefix)
+        return self.get("/api/v1/series", {"match[]": matcher, "start": start, "end": end})
+
+    def tsdb_status(self) -> Optional[Dict]:
+        """Head block stats; None on Prometheus versions without the endpoint"""
+        try:
+            return self.get("/api/v1/status/tsdb")
+        except (requests.exceptions.HTTPError, ValueError):
+            return None
+
+
+class LabelStats:
+    """One label across the analyzed series"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.values: Counter = Counter()  # value -> series
+        self.metrics: Counter = Counter()  # metric -> series
+        self.new_values: Optional[int] = None
+        self.new_per_day: Optional[float] = None
+
+    @property
+    def series(self) -> int:
+        return sum(self.values.values())
+
+    def projected(self, horizon_days: float) -> float:
+        return len(self.values) + (self.new_per_day or 0.0) * horizon_days
+
+    def kept(self, keep: int) -> List[str]:
+        """Values kept by a cap: the ones on the most series"""
+        return [value for value, _ in self.values.most_common(keep)]
+
+    def dropped(self, keep: int) -> int:
+        """Series a cap at `keep` values would drop"""
+        return self.series - sum(count for _, count in self.values.most_common(keep))
+
+
+def label_stats(series: Iterable[Dict[str, str]],
+                previous: Optional[Iterable[Dict[str, str]]] = None,
+                days: float = 0.0) -> List[LabelStats]:
+    """Per-label stats, highest series count first
+
+    With a previous set of series `days` earlier, each label also gets the
+    number of values that appeared since.
+    """
+    stats: Dict[str, LabelStats] = {}
+    for labels in series:
+        for name, value in labels.items():
+            if name == "__name__":
+                continue
+            entry = stats.setdefault(name, LabelStats(name))
+            entry.values[value] += 1
+            entry.metrics[labels["__name__"]] += 1
+    if previous is not None:
+        before: Dict[str, Set[str]] = defaultdict(set)
+        for labels in previous:
+            for name, value in labels.items():
+                before[name].add(value)
+        for entry in stats.values():
+            entry.new_values = len(set(entry.values) - before[entry.name])
+            if days > 0:
+                entry.new_per_day = entry.new_values / days
+    return sorted(stats.values(), key=lambda entry: (entry.series, len(entry.values)), reverse=True)
+
+
+def metric_counts(series: Iterable[Dict[str, str]]) -> Counter:
+    return Counter(labels["__name__"] for labels in series)
+
+
+def flagged(stats: List[LabelStats], max_values: int, horizon_days: float) -> List[LabelStats]:
+    """Labels over the limit now, or at their growth rate within the horizon"""
+    return [entry for entry in stats
+            if entry.name not in TARGET_LABELS and entry.projected(horizon_days) > max_values]
+
+
+def regex_literal(value: str) -> str:
+    """Value escaped for an RE2 regex"""
+    return re.sub(r"([.+*?()\[\]{}^$|\\])", r"\\\1", value)
+
+
+def yaml_quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def mebibytes(series: int, bytes_per_series: int = BYTES_PER_SERIES) -> str:
+    return f"{series * bytes_per_series / 1048576:.1f} MiB"
+
+
+def relabel_configs(labels: List[LabelStats], keep: int) -> str:
+    """metric_relabel_configs keeping each label's top values
+
+    Series of the affected metrics are marked with a temporary label, the
+    kept values unmark them, and the marked rest is dropped. The marker is
+    removed (set to '') on every series that is kept.
+    """
+    lines = ["metric_relabel_configs:"]
+    for entry in labels:
+        marker = f"__tmp_cap_{entry.name}"
+        kept = entry.kept(keep)
+        metrics = "|".join(regex_literal(name) for name in sorted(entry.metrics))
+        growth = f", +{entry.new_per_day:.1f}/day" if entry.new_per_day else ""
+        lines += [
+            f"  # {entry.name}: {len(entry.values)} values{growth} on {len(entry.metrics)} metric(s);",
+            f"  # keeps the top {len(kept)}, dropping ~{entry.dropped(keep)} of {entry.series} series "
+            f"(~{mebibytes(entry.dropped(keep))})",
+            f"  - source_labels: [__name__, {entry.name}]",
+            f"    regex: {yaml_quote(f'({metrics});.+')}",
+            f"    target_label: {marker}",
+            "    replacement: drop",
+            f"  - source_labels: [{entry.name}]",
+            f"    regex: {yaml_quote('|'.join(regex_literal(value) for value in kept))}",
+            f"    target_label: {marker}",
+            "    replacement: ''",
+            f"  - source_labels: [{marker}]",
+            "    regex: drop",
+            "    action: drop",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def print_report(stats: List[LabelStats], metrics: Counter, caps: List[LabelStats],
+                 prefix: str, keep: int, tsdb: Optional[Dict], growth_note: str, top: int):
+    total = sum(metrics.values())
+    print(f"📊 {prefix}* series: {total} across {len(metrics)} metrics (~{mebibytes(total)} of head memory)")
+    if tsdb:
+        head = tsdb.get("headStats", {}).get("numSeries")
+        if head:
+            print(f"   Prometheus head: {head} series, {prefix}* is {100.0 * total / head:.1f}%")
+    print(f"   Growth: {growth_note}")
+    print()
+
+    print(f"{'Label':<28} {'Values':>7} {'New/day':>8} {'Series':>8} {'Metrics':>8} {'Est. memory':>12}")
+    print("-" * 76)
+    memory_by_label = {item["name"]: item["value"]
+                       for item in (tsdb or {}).get("memoryInBytesByLabelName") or []}
+    for entry in stats[:top]:
+        growth = "-" if entry.new_per_day is None else f"{entry.new_per_day:.1f}"
+        mark = " ⚠️" if entry in caps else ""
+        print(f"{entry.name:<28} {len(entry.values):>7} {growth:>8} {entry.series:>8} "
+              f"{len(entry.metrics):>8} {mebibytes(entry.series):>12}{mark}")
+        if entry.name in memory_by_label:
+            print(f"{'':<28} label strings in head: {memory_by_label[entry.name] / 1024:.1f} KiB")
+    print()
+
+    print("Metrics by series:")
+    for name, count in metrics.most_common(top):
+        print(f"  {count:>7}  {name}")
+    print()
+
+    if caps:
+        print(f"⚠️  {len(caps)} label(s) over the limit; capping each at {keep} values:")
+        for entry in caps:
+            print(f"   {entry.name}: drops ~{entry.dropped(keep)} series (~{mebibytes(entry.dropped(keep))})")
+    else:
+        print("✓ No label over the limit")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--prometheus-url",
+        default=os.environ.get("PROMETHEUS_URL", DEFAULT_PROMETHEUS),
+        help=f"Prometheus to query. Default: $PROMETHEUS_URL or {DEFAULT_PROMETHEUS}"
+    )
+    source.add_argument("--metrics-url", help="Read a /metrics page instead, e.g. http://localhost:15020/metrics")
+    source.add_argument("--metrics-file", help="Read a saved /metrics page instead")
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX, help=f"Metric name prefix. Default: {DEFAULT_PREFIX}")
+    parser.add_argument(
+        "--lookback",
+        type=parse_duration,
+        default="1h",
+        help="Window of current series in Prometheus. Default: 1h"
+    )
+    parser.add_argument(
+        "--growth-window",
+        type=parse_duration,
+        default="24h",
+        help="How far back to compare series in Prometheus. Default: 24h"
+    )
+    parser.add_argument("--baseline", help="Snapshot from an earlier --save, for growth without Prometheus")
+    parser.add_argument("--save", help="Save the analyzed series as a snapshot for a later --baseline")
+    parser.add_argument(
+        "--max-values",
+        type=int,
+        default=DEFAULT_MAX_VALUES,
+        help=f"Values per label before a cap is suggested. Default: {DEFAULT_MAX_VALUES}"
+    )
+    parser.add_argument(
+        "--horizon",
+        type=float,
+        default=DEFAULT_HORIZON,
+        help=f"Also cap labels that pass --max-values within this many days. Default: {DEFAULT_HORIZON:g}"
+    )
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP, help=f"Values a cap keeps. Default: {DEFAULT_KEEP}")
+    parser.add_argument("--top", type=int, default=15, help="Rows per table. Default: 15")
+    parser.add_argument("--relabel-out", help="Write the suggested metric_relabel_configs here instead of stdout")
+    parser.add_argument("--json", action="store_true", help="Print the analysis as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    now = time.time()
+    previous, days, tsdb = None, 0.0, None
+    try:
+        if args.metrics_url or args.metrics_file:
+            if args.metrics_url:
+                response = create_client(pool_size=1).get(args.metrics_url, timeout=10)
+                response.raise_for_status()
+                text = response.text
+            else:
+                with open(args.metrics_file, "r") as f:
+                    text = f.read()
+            series = parse_exposition(text, args.prefix)
+            growth_note = "no baseline (pass --baseline from an earlier --save)"
+        else:
+            prometheus = Prometheus(args.prometheus_url)
+            series = prometheus.series(args.prefix, now - args.lookback, now)
+            start = now - args.growth_window
+            previous = prometheus.series(args.prefix, start - args.lookback, start)
+            days = args.growth_window / 86400
+            if previous:
+                growth_note = f"new values since {args.growth_window / 3600:g}h ago"
+            else:
+                previous = None
+                growth_note = "no series in the earlier window yet"
+            tsdb = prometheus.tsdb_status()
+        if args.baseline:
+            baseline = load_snapshot(args.baseline)
+            previous, days = baseline["series"], (now - baseline["taken_at"]) / 86400
+            growth_note = f"new values since the baseline {days * 24:.1f}h ago"
+    except (OSError, ValueError, KeyError, requests.exceptions.RequestException) as e:
+        print(f"✗ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.save:
+        save_snapshot(args.save, series, now)
+    if not series:
+        print(f"✗ No {args.prefix}* series found", file=sys.stderr)
+        sys.exit(1)
+
+    stats = label_stats(series, previous, days)
+    metrics = metric_counts(series)
+    caps = flagged(stats, args.max_values, args.horizon)
+
+    if args.json:
+        print(json.dumps({
+            "series": sum(metrics.values()),
+            "metrics": dict(metrics.most_common()),
+            "labels": [{"name": entry.name, "values": len(entry.values), "series": entry.series,
+                        "metrics": len(entry.metrics), "new_values": entry.new_values,
+                        "new_per_day": entry.new_per_day,
+                        "memory_bytes": entry.series * BYTES_PER_SERIES,
+                        "capped": entry in caps} for entry in stats],
+            "relabel_configs": relabel_configs(caps, args.keep) if caps else None,
+        }, indent=2))
+        return
+
+    print_report(stats, metrics, caps, args.prefix, args.keep, tsdb, growth_note, args.top)
+    if caps:
+        relabel = relabel_configs(caps, args.keep)
+        if args.relabel_out:
+            with open(args.relabel_out, "w") as f:
+                f.write(relabel)
+            print(f"✓ Wrote {args.relabel_out}; add it under the scrape job in "
+                  f"monitoring/prometheus/prometheus.yml")
+        else:
+            print()
+            print("# Add under the scrape job in monitoring/prometheus/prometheus.yml")
+            print(relabel, end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Mock AgentGateway
+=================
+
+Serves the gateway's AI routes (`/<route>/v1/chat/completions` and
+`/<route>/v1/models`) with canned OpenAI-format answers, plus injected
+latency and errors per route, so the gateway proxy's cache, coalescing,
+budgets and hedging can be tried without provider keys. Each route also
+has OpenAI-format batch endpoints (`/v1/files`, `/v1/batches`) for
+lib/batch_queue.py, and `--rate-limit` answers 429 like the gateway's
+`localRateLimit`:
+
+    python scripts/mock-gateway.py --port 3999 \\
+        --latency /openai=1.5 --jitter 0.2 --error-rate /xai=0.5
+    python scripts/gateway-proxy.py --upstream http://localhost:3999 \\
+        --model-groups proxy/model-groups.json
+
+Latency is the time to the first token (streams) or to the whole response.
+As with OpenAI, a stream ends with a usage chunk only when the request sets
+`stream_options.include_usage`.
+Every response carries `X-Mock-Route` so you can see which route answered.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+
+def route_values(pairs) -> Dict[str, float]:
+    """{'/openai': 1.5} from ['/openai=1.5']"""
+    values = {}
+    for pair in pairs or ():
+        route, _, value = pair.partition("=")
+        values["/" + route.strip("/")] = float(value)
+    return values
+
+
+class MockGateway:
+    """Per-route behavior and call counts"""
+
+    def __init__(self, latency: Dict[str, float], errors: Dict[str, float],
+                 default_latency: float = 0.05, jitter: float = 0.0,
+                 tokens: int = 5, token_interval: float = 0.01,
+                 rate_limit: int = 0, batch_delay: float = 2.0):
+        self.latency = latency
+        self.errors = errors
+        self.rate_limit = rate_limit
+        self.batch_delay = batch_delay
+        self.default_latency = default_latency
+        self.jitter = jitter
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.recent: Dict[str, List[float]] = {}
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict] = {}
+
+    def called(self, route: str):
+        with self._lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+
+    def admit(self, route: str) -> bool:
+        """Per-route requests-per-minute limit over a sliding window"""
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            recent = [t for t in self.recent.get(route, ()) if now - t < 60]
+            admitted = len(recent) < self.rate_limit
+            if admitted:
+                recent.append(now)
+            self.recent[route] = recent
+        return admitted
+
+    def completion(self, route: str, model: str) -> Dict:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                "role": "assistant", "content": f"answer from {route}"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": self.tokens,
+                      "total_tokens": 10 + self.tokens},
+        }
+
+    def add_file(self, content: bytes) -> str:
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self.files[file_id] = content
+        return file_id
+
+    def batch(self, route: str, batch_id: str) -> Dict:
+        """A batch's state; it completes `batch_delay` seconds after creation"""
+        with self._lock:
+            batch = self.batches[batch_id]
+        if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= self.batch_delay:
+            lines = []
+            for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                lines.append(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": item["custom_id"],
+                    "response": {"status_code": 200,
+                                 "body": self.completion(route, item["body"].get("model", "mock"))},
+                    "error": None,
+                }))
+            batch.update(status="completed", completed_at=time.time(),
+                         output_file_id=self.add_file(("\n".join(lines) + "\n").encode("utf-8")),
+                         request_counts={"total": len(lines), "completed": len(lines), "failed": 0})
+        return batch
+
+    def delay(self, route: str) -> float:
+        base = self.latency.get(route, self.default_latency)
+        return max(0.0, base + random.uniform(-self.jitter, self.jitter) * base)
+
+    def fails(self, route: str) -> bool:
+        return random.random() < self.errors.get(route, 0.0)
+
+
+def make_handler(mock: MockGateway):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        @property
+        def route(self) -> str:
+            return "/" + self.path.lstrip("/").split("/", 1)[0]
+
+        def send_json(self, status: int, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("X-Mock-Route", self.route)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            mock.called(self.route)
+            parts = self.path.split("?")[0].strip("/").split("/")
+            if len(parts) == 4 and parts[2] == "batches" and parts[3] in mock.batches:
+                self.send_json(200, mock.batch(self.route, parts[3]))
+            elif len(parts) == 5 and parts[2] == "files" and parts[4] == "content" and parts[3] in mock.files:
+                data = mock.files[parts[3]]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/jsonl")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            elif self.path.split("?")[0].endswith("/models"):
+                time.sleep(mock.delay(self.route))
+                self.send_json(200, {"object": "list", "data": [
+                    {"id": f"mock-{self.route.strip('/')}", "object": "model", "owned_by": "mock"}
+                ]})
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            route = self.route
+            mock.called(route)
+            path = self.path.split("?")[0]
+            if path.endswith("/v1/files"):
+                return self.upload(raw)
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                body = {}
+            if path.endswith("/v1/batches"):
+                batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+                mock.batches[batch_id] = {
+                    "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"),
+                    "input_file_id": body.get("input_file_id"), "status": "in_progress",
+                    "created_at": time.time(), "output_file_id": None, "error_file_id": None,
+                }
+                return self.send_json(200, mock.batches[batch_id])
+            if not mock.admit(route):
+                self.send_response(429)
+                self.send_header("Retry-After", "5")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            delay = mock.delay(route)
+            if mock.fails(route):
+                time.sleep(delay)
+                self.send_json(503, {"error": {"message": f"injected failure on {route}"}})
+                return
+            model = body.get("model", "mock")
+            usage = {"prompt_tokens": 10, "completion_tokens": mock.tokens,
+                     "total_tokens": 10 + mock.tokens}
+            if not body.get("stream"):
+                time.sleep(delay)
+                self.send_json(200, mock.completion(route, model))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("X-Mock-Route", route)
+            self.end_headers()
+            try:
+                time.sleep(delay)
+                for index in range(mock.tokens):
+                    chunk = {"object": "chat.completion.chunk", "model": model,
+                             "choices": [{"index": 0, "delta": {"content": f"{route}#{index} "}}]}
+                    self.send_chunk(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+                    time.sleep(mock.token_interval)
+                # Like OpenAI, streams only report usage when asked to
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    final = {"object": "chat.completion.chunk", "model": model, "choices": [], "usage": usage}
+                    self.send_chunk(b"data: " + json.dumps(final).encode("utf-8") + b"\n\n")
+                self.send_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client (e.g. a losing hedge) hung up
+                pass
+
+        def upload(self, raw: bytes):
+            """multipart/form-data upload of a batch input file"""
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("utf-8") + raw)
+            content = b""
+            for part in message.iter_parts():
+                if part.get_param("name", header="content-disposition") == "file":
+                    content = part.get_payload(decode=True)
+            file_id = mock.add_file(content)
+            self.send_json(200, {"id": file_id, "object": "file", "purpose": "batch",
+                                 "bytes": len(content)})
+
+    return MockHandler
+
+
+def serve(mock: MockGateway, host: str = "127.0.0.1", port: int = 3999) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="Default: 127.0.0.1")
+    parser.add_argument("--port", type=int, default=3999, help="Default: 3999")
+    parser.add_argument(
+        "--latency",
+        nargs="*",
+        metavar="ROUTE=SECONDS",
+        help="Time to first token per route, e.g. /openai=1.5"
+    )
+    parser.add_argument(
+        "--default-latency",
+        type=float,
+        default=0.05,
+        help="Latency of routes not given in --latency. Default: 0.05"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Random +/- fraction applied to every latency. Default: 0"
+    )
+    parser.add_argument(
+        "--error-rate",
+        nargs="*",
+        metavar="ROUTE=FRACTION",
+        help="Share of requests answered with 503 per route, e.g. /xai=0.5"
+    )
+    parser.add_argument("--tokens", type=int, default=5, help="Tokens per answer. Default: 5")
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=0,
+        help="Completions per minute per route before 429 (0 = unlimited, the gateway uses 10)"
+    )
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=2.0,
+        help="Seconds until a submitted batch completes. Default: 2"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    mock = MockGateway(route_values(args.latency), route_values(args.error_rate),
+                       default_latency=args.default_latency, jitter=args.jitter, tokens=args.tokens,
+                       rate_limit=args.rate_limit, batch_delay=args.batch_delay)
+    server = serve(mock, args.host, args.port)
+    print(f"✓ Mock gateway on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Calls per route: {json.dumps(mock.calls, sort_keys=True)}")
+
+
+if __name__ == "__main__":
+    main()
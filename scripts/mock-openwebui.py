@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Mock Open WebUI
+===============
+
+Serves the parts of Open WebUI's API that init/openwebui/init-openwebui.py
+uses to create users (`/health`, `/api/config`, `/api/v1/auths/signup`,
+`/signin`, `/add`, and the `/api/v1/users/all` and paged `/api/v1/users/`
+listings), with an in-memory user table, per-request latency and a
+requests-per-second limit answered with 429, so user provisioning can be
+tried and timed without the real app:
+
+    python scripts/mock-openwebui.py --port 3998 --latency 0.005 --rate-limit 400
+
+`--bench N` starts the mock on a free port, streams N generated users to
+the initializer's `create_users()` through a temporary NDJSON file and
+prints how long it took:
+
+    python scripts/mock-openwebui.py --bench 2000
+
+`--no-users-all` hides `/api/v1/users/all`, so the paged fallback is used.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+INITIALIZER = os.path.join(_HERE, "..", "init", "openwebui", "init-openwebui.py")
+
+# Users per page of /api/v1/users/, as in Open WebUI
+PAGE_SIZE = 30
+
+
+class MockOpenWebUI:
+    """Users, tokens and request pacing"""
+
+    def __init__(self, latency: float = 0.005, rate_limit: int = 0, users_all: bool = True):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.users_all = users_all
+        self._lock = threading.Lock()
+        self.users: Dict[str, Dict] = {}
+        self.tokens: Dict[str, str] = {}
+        self.recent: List[float] = []
+        self.throttled = 0
+
+    def admit(self) -> bool:
+        """Requests-per-second limit over a sliding window"""
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            self.recent = [t for t in self.recent if now - t < 1.0]
+            if len(self.recent) >= self.rate_limit:
+                self.throttled += 1
+                return False
+            self.recent.append(now)
+        return True
+
+    def add_user(self, body: Dict, role: str) -> Dict:
+        """The new user, or None if the email is taken"""
+        email = str(body.get("email", "")).lower()
+        with self._lock:
+            if not email or email in self.users:
+                return None
+            user = {"id": secrets.token_hex(8), "email": email, "name": body.get("name", ""),
+                    "role": "admin" if not self.users else role,
+                    "password": body.get("password", "")}
+            self.users[email] = user
+            token = secrets.token_hex(16)
+            self.tokens[token] = email
+        return {**public(user), "token": token, "token_type": "Bearer"}
+
+    def signin(self, body: Dict) -> Dict:
+        email = str(body.get("email", "")).lower()
+        with self._lock:
+            user = self.users.get(email)
+            if user is None or user["password"] != body.get("password"):
+                return None
+            token = secrets.token_hex(16)
+            self.tokens[token] = email
+        return {**public(user), "token": token, "token_type": "Bearer"}
+
+    def is_admin(self, authorization: str) -> bool:
+        token = authorization[7:] if authorization.startswith("Bearer ") else ""
+        with self._lock:
+            email = self.tokens.get(token)
+            return email is not None and self.users[email]["role"] == "admin"
+
+    def listing(self) -> List[Dict]:
+        with self._lock:
+            return [public(user) for user in self.users.values()]
+
+
+def public(user: Dict) -> Dict:
+    return {key: value for key, value in user.items() if key != "password"}
+
+
+def make_handler(mock: MockOpenWebUI):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status: int, body, headers: Dict[str, str] = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            admin = mock.is_admin(self.headers.get("Authorization", ""))
+            if url.path == "/health":
+                self.send_json(200, {"status": True})
+            elif url.path == "/api/config":
+                self.send_json(200, {"name": "Mock Open WebUI", "features": {"auth": True}})
+            elif url.path == "/api/v1/auths/":
+                self.send_json(200 if admin else 401, {} if admin else {"detail": "Not authenticated"})
+            elif url.path == "/api/v1/users/all" and mock.users_all:
+                if not admin:
+                    return self.send_json(401, {"detail": "Not authenticated"})
+                users = mock.listing()
+                self.send_json(200, {"users": users, "total": len(users)})
+            elif url.path == "/api/v1/users/":
+                if not admin:
+                    return self.send_json(401, {"detail": "Not authenticated"})
+                page = int(parse_qs(url.query).get("page", ["1"])[0])
+                users = mock.listing()
+                self.send_json(200, {"users": users[(page - 1) * PAGE_SIZE:page * PAGE_SIZE],
+                                     "total": len(users)})
+            else:
+                self.send_json(404, {"detail": "Not Found"})
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                return self.send_json(422, {"detail": "invalid JSON"})
+            path = urlsplit(self.path).path
+            if not mock.admit():
+                return self.send_json(429, {"detail": "Too Many Requests"})
+            time.sleep(mock.latency)
+            if path == "/api/v1/auths/signin":
+                user = mock.signin(body)
+                if user is None:
+                    return self.send_json(400, {"detail": "The email or password provided is incorrect."})
+                self.send_json(200, user)
+            elif path in ("/api/v1/auths/signup", "/api/v1/auths/add"):
+                if path.endswith("/add") and not mock.is_admin(self.headers.get("Authorization", "")):
+                    return self.send_json(401, {"detail": "Not authenticated"})
+                user = mock.add_user(body, body.get("role", "user"))
+                if user is None:
+                    return self.send_json(400, {"detail": "Uh-oh! This email is already registered."})
+                self.send_json(200, user)
+            else:
+                self.send_json(404, {"detail": "Not Found"})
+
+    return MockHandler
+
+
+def serve(mock: MockOpenWebUI, host: str = "127.0.0.1", port: int = 3998) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    return server
+
+
+def bench(mock: MockOpenWebUI, users: int, concurrency: int, max_rate: int):
+    """Time the initializer's create_users() for `users` generated users"""
+    server = serve(mock, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    spec = importlib.util.spec_from_file_location("init_openwebui", INITIALIZER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        users_file = os.path.join(tmp, "users.ndjson")
+        with open(users_file, "w") as f:
+            for index in range(users):
+                f.write(json.dumps({"email": f"user{index}@example.com", "password": f"Pass{index}!",
+                                    "name": f"User {index}", "team": f"team{index % 5}"}) + "\n")
+        config_path = os.path.join(tmp, "config.json")
+        with open(config_path, "w") as f:
+            json.dump({"openwebui_url": base_url, "users": [], "users_file": users_file,
+                       "admin": {"email": "admin@example.com", "password": "Admin123!", "name": "Admin"},
+                       "user_provisioning": {"concurrency": concurrency, "max_rate": max_rate}}, f)
+
+        initializer = module.OpenWebUIInitializer(config_path)
+        initializer.create_admin()
+        start = time.perf_counter()
+        stats = initializer.create_users()
+        elapsed = time.perf_counter() - start
+        initializer.print_summary(stats)
+
+    server.shutdown()
+    server.server_close()
+    print(f"\n⏱ {users} users in {elapsed:.2f}s ({users / elapsed:.0f}/s, "
+          f"{mock.throttled} requests throttled by the mock)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="Default: 127.0.0.1")
+    parser.add_argument("--port", type=int, default=3998, help="Default: 3998")
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="Seconds per signup/signin/add request. Default: 0.005")
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="Requests per second before 429 (0 = unlimited). Default: 0")
+    parser.add_argument("--no-users-all", action="store_true",
+                        help="Answer 404 on /api/v1/users/all, like older Open WebUI versions")
+    parser.add_argument("--bench", type=int, metavar="USERS",
+                        help="Provision this many generated users against the mock and time it")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="With --bench: user_provisioning.concurrency. Default: 16")
+    parser.add_argument("--max-rate", type=int, default=500,
+                        help="With --bench: user_provisioning.max_rate. Default: 500")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    mock = MockOpenWebUI(args.latency, args.rate_limit, users_all=not args.no_users_all)
+    if args.bench:
+        bench(mock, args.bench, args.concurrency, args.max_rate)
+        return
+    server = serve(mock, args.host, args.port)
+    print(f"✓ Mock Open WebUI on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Users: {len(mock.users)}, throttled requests: {mock.throttled}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Provision Open WebUI in One Shot
+================================
+
+Builds a single JSON plan (connections, models and users) and runs it with
+the provisioning bundle in one `docker exec`, then prints the structured
+result with per-phase timings.
+
+Users and admin credentials are read from init/openwebui/config.json.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from model_discovery import discover, print_report
+from openwebui_provisioning import build_plan, execute, print_result
+from provisioning_compiler import compile_file
+from tracing import init as init_tracing
+
+CONTAINER_NAME = "open-webui"
+# Traces go to the stack's Jaeger (OTLP/HTTP), or to a local file if it is down
+OTLP_ENDPOINT = "http://localhost:4318"
+INIT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "..", "init", "openwebui", "config.json")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--config",
+        default=INIT_CONFIG,
+        help="Init config with admin and users. Default: init/openwebui/config.json"
+    )
+    parser.add_argument(
+        "--skip-users",
+        action="store_true",
+        help="Only provision connections and models"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rewrite the configuration even if nothing changed"
+    )
+    parser.add_argument(
+        "--discover",
+        action="store_true",
+        help="Discover models through each provider's /v1/models route"
+    )
+    parser.add_argument(
+        "--gateway-url",
+        default="http://localhost:3000",
+        help="Gateway URL used for discovery from this host. Default: http://localhost:3000"
+    )
+    parser.add_argument(
+        "--plan-out",
+        help="Also write the generated plan to this file"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output the raw JSON result instead of a formatted report"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    init_tracing("provision-openwebui", endpoint=OTLP_ENDPOINT)
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+
+    connections = compile_file(extra_models=config.get("extra_models"))
+    if args.discover:
+        connections, reports = discover(connections, gateway_url=args.gateway_url)
+        if not args.json:
+            print("Discovered models:")
+            print_report(reports)
+            print()
+
+    plan = build_plan(
+        connections,
+        force=args.force,
+        users=[] if args.skip_users else config.get("users", []),
+        admin=config.get("admin")
+    )
+
+    if args.plan_out:
+        with open(args.plan_out, "w") as f:
+            json.dump(plan, f, indent=2)
+
+    result = execute(plan, CONTAINER_NAME)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_result(result)
+        if "error" not in result and result["changed"]:
+            print()
+            print("Restart Open WebUI to apply the new connections:")
+            print("   docker-compose restart open-webui")
+
+    sys.exit(1 if "error" in result else 0)
+
+
+if __name__ == "__main__":
+    main()
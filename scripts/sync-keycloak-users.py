@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Sync Keycloak Users into Open WebUI
+===================================
+
+Mirrors the Keycloak realm's users and team groups into Open WebUI, writing
+only the users that changed since the last sync. Run it once, or keep it
+running with --interval to sync periodically.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+# lib/ at the repo root, or /app/lib in the user-sync container
+_HERE = os.path.dirname(os.path.abspath(__file__))
+for _lib_dir in (os.path.join(_HERE, "lib"), os.path.join(_HERE, "..", "lib")):
+    if os.path.isdir(_lib_dir):
+        sys.path.insert(0, _lib_dir)
+        break
+
+from http_client import create_client, print_http_stats
+from keycloak_admin import KeycloakAdmin
+from tracing import flush as flush_traces, init as init_tracing, span
+from user_sync import DEFAULT_STATE_PATH, OpenWebUIAdmin, SyncState, print_sync_result, sync_users
+
+INIT_CONFIG = os.path.join(_HERE, "..", "init", "openwebui", "config.json")
+
+# Traces go to the stack's Jaeger (OTLP/HTTP), or to a local file if it is down
+OTLP_ENDPOINT = "http://localhost:4318"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--keycloak-url",
+        default="http://localhost:8090",
+        help="Keycloak base URL. Default: http://localhost:8090"
+    )
+    parser.add_argument(
+        "--realm",
+        default="agentgateway",
+        help="Realm to sync from. Default: agentgateway"
+    )
+    parser.add_argument(
+        "--keycloak-admin",
+        default=os.environ.get("KEYCLOAK_ADMIN", "admin"),
+        help="Keycloak master realm admin user. Default: admin"
+    )
+    parser.add_argument(
+        "--keycloak-password",
+        default=os.environ.get("KEYCLOAK_ADMIN_PASSWORD", "admin"),
+        help="Keycloak master realm admin password. Default: admin"
+    )
+    parser.add_argument(
+        "--openwebui-url",
+        default="http://localhost:8888",
+        help="Open WebUI base URL. Default: http://localhost:8888"
+    )
+    parser.add_argument(
+        "--config",
+        default=INIT_CONFIG,
+        help="Init config with the Open WebUI admin. Default: init/openwebui/config.json"
+    )
+    parser.add_argument(
+        "--state",
+        default=os.environ.get("AGW_USER_SYNC_STATE", DEFAULT_STATE_PATH),
+        help=f"Fingerprint state file. Default: {DEFAULT_STATE_PATH}"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0,
+        help="Sync again every N seconds (0 = sync once and exit)"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Show what would change without writing anything"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Output the raw JSON result instead of a formatted report"
+    )
+    return parser.parse_args()
+
+
+def openwebui_token(base_url: str, admin: dict) -> str:
+    """Sign in as the Open WebUI admin"""
+    response = create_client().post(
+        f"{base_url}/api/v1/auths/signin",
+        json={"email": admin["email"], "password": admin["password"]},
+        timeout=10
+    )
+    response.raise_for_status()
+    return response.json()["token"]
+
+
+def sync_once(args, admin: dict) -> dict:
+    """Log in to both sides and run one sync pass"""
+    keycloak = KeycloakAdmin(args.keycloak_url, create_client())
+    if not keycloak.login(args.keycloak_admin, args.keycloak_password):
+        raise RuntimeError("could not authenticate to Keycloak")
+    webui = OpenWebUIAdmin(args.openwebui_url, openwebui_token(args.openwebui_url, admin))
+    return sync_users(keycloak, args.realm, webui, state=SyncState(args.state),
+                      protected=[admin["email"]], dry_run=args.dry_run)
+
+
+def main():
+    args = parse_args()
+    # Periodic runs record one trace per pass instead of one per process
+    init_tracing("sync-keycloak-users", endpoint=OTLP_ENDPOINT, root=not args.interval)
+
+    with open(args.config, "r") as f:
+        admin = json.load(f)["admin"]
+
+    while True:
+        try:
+            with span("sync-keycloak-users", new_trace=bool(args.interval)):
+                result = sync_once(args, admin)
+            if args.json:
+                print(json.dumps(result, indent=2))
+            else:
+                print_sync_result(result)
+                print_http_stats()
+            failed = bool(result["failed"])
+        except (requests.exceptions.RequestException, RuntimeError) as e:
+            print(f"✗ Sync failed: {e}")
+            failed = True
+
+        if not args.interval:
+            sys.exit(1 if failed else 0)
+        flush_traces()
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()